@@ -1,19 +1,126 @@
+import numpy as np
 
-import random
-from collections import deque
+
+class RingBuffer:
+    """
+    Copy of model_base_autoencoder_td3/MemoryBuffers.RingBuffer without its checkpoint snapshots, this folder is run
+    on its own. Typed numpy arrays, one per field of the experience tuple, created on the first append (uint8 images
+    keep their type, the rest is float32), grown up to max_capacity and sampled with vectorized indexes.
+    The copies in 4DoF_Gripper, gripper_AE_environment, gripper_aruco_environment and openAI_gym_envs change together.
+    """
+    def __init__(self, max_capacity):
+        self.max_capacity = max_capacity
+        self.allocated    = 0
+        self.fields       = None
+
+        self.idx  = 0
+        self.full = False
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def allocate(self, experience):
+        self.fields = []
+        for value in experience:
+            value = np.asarray(value)
+            dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+            self.fields.append(np.empty((0, *value.shape), dtype=dtype))
+
+    def reserve(self, size):
+        if size <= self.allocated:
+            return
+        new_size = min(self.max_capacity, max(size, 2 * self.allocated, 1024))
+        for i, field in enumerate(self.fields):
+            grown = np.empty((new_size, *field.shape[1:]), dtype=field.dtype)
+            grown[:self.idx] = field[:self.idx]
+            self.fields[i] = grown
+        self.allocated = new_size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.allocate(experience)
+        if not self.full:
+            self.reserve(self.idx + 1)
+
+        for field, value in zip(self.fields, experience):
+            field[self.idx] = value
+
+        self.idx  = (self.idx + 1) % self.max_capacity
+        self.full = self.full or self.idx == 0
+
+    def extend(self, experience_batch):
+        # one array per field with the batch in the first dimension, written with a single slice per field
+        experience_batch = [np.asarray(values) for values in experience_batch]
+        if len(experience_batch) == 0:
+            return
+        if self.fields is None:
+            self.allocate([values[0] for values in experience_batch])
+
+        batch_size = len(experience_batch[0])
+        if not self.full:
+            self.reserve(min(self.idx + batch_size, self.max_capacity))
+
+        idxs = (self.idx + np.arange(batch_size)) % self.max_capacity
+        for field, values in zip(self.fields, experience_batch):
+            field[idxs] = values
+
+        self.full = self.full or self.idx + batch_size >= self.max_capacity
+        self.idx  = (self.idx + batch_size) % self.max_capacity
+
+    def sample(self, sample_size):
+        idxs = np.random.randint(0, len(self), size=sample_size)
+        return tuple(field[idxs] for field in self.fields)
+
+
+class EpisodeBuffer:
+    """
+    The open episode, kept in typed numpy arrays like the RingBuffer ones until it ends and is moved to the
+    replay as a whole with one write per field. The arrays are created on the first append and doubled when an
+    episode is longer than them, so after the longest episode they are only reused.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.fields   = None
+        self.size     = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.fields = []
+            for value in experience:
+                value = np.asarray(value)
+                dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+                self.fields.append(np.empty((self.capacity, *value.shape), dtype=dtype))
+        if self.size == self.capacity:
+            self.capacity *= 2
+            self.fields = [np.concatenate((field, np.empty_like(field))) for field in self.fields]
+
+        # the values are copied, frames the env keeps overwriting can be appended as they are
+        for field, value in zip(self.fields, experience):
+            field[self.size] = value
+        self.size += 1
+
+    def experience(self):
+        # one array per field, views of the episode that stay valid until clear()
+        return [field[:self.size] for field in self.fields]
+
+    def clear(self):
+        self.size = 0
 
 
 class MemoryBuffer:
     def __init__(self, max_capacity):
-        self.buffer = deque([], maxlen=max_capacity)
+        self.buffer = RingBuffer(max_capacity)
 
     def add(self, *experience):
         self.buffer.append(experience)
 
     def extend(self, experience):
+        # experience is one array per field (states, actions, rewards, next_states, dones) e.g. a whole episode
         self.buffer.extend(experience)
 
     def sample(self, batch_size):
-        experience_batch = random.sample(self.buffer, batch_size)
-        states, actions, rewards, next_states, dones = zip(*experience_batch)
+        states, actions, rewards, next_states, dones = self.buffer.sample(batch_size)
         return states, actions, rewards, next_states, dones
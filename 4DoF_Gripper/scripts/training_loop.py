@@ -1,6 +1,5 @@
 
 
-import pandas as pd
 import matplotlib.pyplot as plt
 
 import cv2
@@ -15,6 +14,7 @@ from argparse import ArgumentParser
 import TD3
 import TD3_AE
 import MemoryBuffer
+from Metrics_Log import MetricsLog
 from Four_DoF_Environment import GripperEnvironment
 
 logging.basicConfig(level=logging.INFO)
@@ -35,23 +35,6 @@ def create_directories():
     if not os.path.exists("./checkpoints"):
         os.makedirs("./checkpoints")
 
-def plot_reward_curve(data_reward, filename, check_point=False):
-    if check_point:
-        data = pd.DataFrame.from_dict(data_reward)
-        data.to_csv(f"checkpoints/{filename}_check_point", index=False)
-        data.plot(x='episode', y='reward', title=filename)
-        plt.savefig(f"checkpoints/{filename}_check_point")
-        plt.close()
-
-    else:
-        data = pd.DataFrame.from_dict(data_reward)
-        data.to_csv(f"data_plots/{filename}", index=False)
-        data.plot(x='episode', y='reward', title=filename)
-        plt.savefig(f"results/{filename}")
-        plt.show()
-
-
-
 def train(args, agent, memory, env, act_dim, file_name):
     episode_timesteps = 0
     episode_reward    = 0
@@ -60,8 +43,8 @@ def train(args, agent, memory, env, act_dim, file_name):
     state = env.reset()
     done  = False
 
-    episode_experiences = []
-    historical_reward = {"episode": [], "reward": []}
+    episode_experiences = MemoryBuffer.EpisodeBuffer()
+    historical_reward = MetricsLog(f"data_plots/{file_name}", ["episode", "reward"])  # plot it with script_combination/plot_metrics.py
 
     for total_step_counter in range(int(args.max_steps_training)):
         episode_timesteps += 1
@@ -98,14 +81,14 @@ def train(args, agent, memory, env, act_dim, file_name):
 
             logging.info(f"Total T:{total_step_counter+1} Episode {episode_num+1} was completed with {episode_timesteps} steps taken and a Reward= {episode_reward:.3f}\n")
 
-            historical_reward["episode"].append(episode_num)
-            historical_reward["reward"].append(episode_reward)
+            historical_reward.append(episode=episode_num, reward=episode_reward)
 
             if args.discriminate_reward:
+                # only the episodes that got some reward go to the replay, the others are dropped
                 if not episode_reward == 0.0:
-                    memory.extend(episode_experiences)
+                    memory.extend(episode_experiences.experience())
                     logging.info(f"Buffer_size: {len(memory.buffer)}")
-                    episode_experiences = []
+                episode_experiences.clear()
 
             # Reset environment
             state = env.reset()
@@ -115,12 +98,10 @@ def train(args, agent, memory, env, act_dim, file_name):
             episode_num += 1
 
             if episode_num % args.plot_freq == 0:
-                check_point = True
-                plot_reward_curve(historical_reward, file_name, check_point)
-                check_point = False
+                historical_reward.flush()
 
     agent.save_models(file_name)
-    plot_reward_curve(historical_reward, file_name)
+    historical_reward.flush()
 
 
 def encoder_models_evaluation(args, agent, env, device, file_name):
@@ -179,7 +160,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
 
     state = env.reset()
     done  = False
-    historical_reward = {"episode": [], "reward": []}
+    historical_reward = MetricsLog(f"data_plots/{file_name}_EVALUATION", ["episode", "reward"])
 
     for total_step_counter in range(args.max_evaluation_steps):
         episode_timesteps += 1
@@ -194,8 +175,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
         if (done == True) or (episode_timesteps >= args.episode_horizont):
 
             logging.info(f" Evaluation Episode {episode_num} was completed with {episode_timesteps} steps taken and a Reward= {episode_reward:.3f}\n")
-            historical_reward["episode"].append(episode_num)
-            historical_reward["reward"].append(episode_reward)
+            historical_reward.append(episode=episode_num, reward=episode_reward)
 
             # Reset environment
             state = env.reset()
@@ -204,8 +184,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
             episode_timesteps = 0
             episode_num += 1
 
-    file_name = file_name+"_EVALUATION"
-    plot_reward_curve(historical_reward, file_name)
+    historical_reward.flush()
 
 def parse_args():
     parser = ArgumentParser()
@@ -227,7 +206,7 @@ def parse_args():
     parser.add_argument("--buffer_capacity", type=int, default=1_000_000)
 
     parser.add_argument("--G",         type=int, default=10)
-    parser.add_argument('--plot_freq', type=int, default=25)
+    parser.add_argument('--plot_freq', type=int, default=25)  # episodes between two flushes of the metrics file
 
     parser.add_argument('--usb_port',   type=str, default='/dev/ttyUSB1')  # '/dev/ttyUSB1', '/dev/ttyUSB0'
     parser.add_argument('--robot_id',   type=str, default='RR')  # RR, RL
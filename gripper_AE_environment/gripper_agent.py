@@ -5,6 +5,7 @@ import torch.nn.functional as F
 import numpy as np
 import matplotlib.pyplot as plt
 from gripper_architectures import Actor, Critic, Decoder
+from gripper_telemetry_utilities import LossTelemetry
 
 
 class Td3Agent:
@@ -34,7 +35,7 @@ class Td3Agent:
         self.batch_size         = batch_size
 
         # ---------------- Extras  -------------------------#
-        self.ae_loss_record = []
+        self.loss_telemetry = LossTelemetry(["ae_loss"], self.device)
         self.include_goal_angle_on = include_goal_angle_on
 
         # by include_goal_angle_on True, the  target angle is concatenated with the latent vector
@@ -152,7 +153,7 @@ class Td3Agent:
                 rec_loss    = F.mse_loss(state_batch, rec_obs)
                 latent_loss = (0.5 * z_vector.pow(2).sum(1)).mean()  # add L2 penalty on latent representation
                 ae_loss     = rec_loss + 1e-6 * latent_loss
-                self.ae_loss_record.append(ae_loss.item())
+                self.loss_telemetry.add("ae_loss", ae_loss)
 
                 self.encoder_optimizer.zero_grad()
                 self.decoder_optimizer.zero_grad()
@@ -160,6 +161,8 @@ class Td3Agent:
                 self.encoder_optimizer.step()
                 self.decoder_optimizer.step()
 
+                self.loss_telemetry.step()
+
 
     def save_models(self):
         torch.save(self.actor.state_dict(), f'trained_models/AE-TD3_actor_gripper_{self.include_goal_angle_on}.pht')
@@ -180,15 +183,15 @@ class Td3Agent:
 
         plt.subplot(3, 1, 3)
         plt.title("AE Loss Curve")
-        plt.plot(self.ae_loss_record)
+        plt.plot(self.loss_telemetry.history("ae_loss"))  # mean of each LossTelemetry interval
 
         if check_point:
             plt.savefig(f"plot_results/AE-TD3_gripper_check_point_image_include_goal_{self.include_goal_angle_on}.png")
             np.savetxt(f"plot_results/AE-TD3_gripper_check_point_reward_curve_include_goal_{self.include_goal_angle_on}.txt", rewards)
             np.savetxt(f"plot_results/AE-TD3_gripper_check_point_distance_curve_include_goal_{self.include_goal_angle_on}.txt", distance)
-            np.savetxt(f"plot_results/AE-TD3_gripper_check_point_ae_loss_curve_include_goal_{self.include_goal_angle_on}.txt", self.ae_loss_record)
+            np.savetxt(f"plot_results/AE-TD3_gripper_check_point_ae_loss_curve_include_goal_{self.include_goal_angle_on}.txt", self.loss_telemetry.history("ae_loss"))
         else:
             plt.savefig(f"plot_results/AE-TD3_gripper_reward_curve_include_goal_{self.include_goal_angle_on}.png")
             np.savetxt(f"plot_results/AE-TD3_gripper_reward_curve_include_goal_{self.include_goal_angle_on}.txt", rewards)
             np.savetxt(f"plot_results/AE-TD3_gripper_distance_curve_include_goal_{self.include_goal_angle_on}.txt", distance)
-            np.savetxt(f"plot_results/AE-TD3_gripper_ae_loss_curve_include_goal_{self.include_goal_angle_on}.txt", self.ae_loss_record)
\ No newline at end of file
+            np.savetxt(f"plot_results/AE-TD3_gripper_ae_loss_curve_include_goal_{self.include_goal_angle_on}.txt", self.loss_telemetry.history("ae_loss"))
\ No newline at end of file
@@ -1,16 +1,85 @@
 import torch
-import random
 import numpy as np
-from collections import deque
 
 
 
+class RingBuffer:
+    """
+    Copy of model_base_autoencoder_td3/MemoryBuffers.RingBuffer without its checkpoint snapshots, this folder is run
+    on its own. Typed numpy arrays, one per field of the experience tuple, created on the first append (uint8 images
+    keep their type, the rest is float32), grown up to max_capacity and sampled with vectorized indexes.
+    The copies in 4DoF_Gripper, gripper_AE_environment, gripper_aruco_environment and openAI_gym_envs change together.
+    """
+    def __init__(self, max_capacity):
+        self.max_capacity = max_capacity
+        self.allocated    = 0
+        self.fields       = None
+
+        self.idx  = 0
+        self.full = False
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def allocate(self, experience):
+        self.fields = []
+        for value in experience:
+            value = np.asarray(value)
+            dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+            self.fields.append(np.empty((0, *value.shape), dtype=dtype))
+
+    def reserve(self, size):
+        if size <= self.allocated:
+            return
+        new_size = min(self.max_capacity, max(size, 2 * self.allocated, 1024))
+        for i, field in enumerate(self.fields):
+            grown = np.empty((new_size, *field.shape[1:]), dtype=field.dtype)
+            grown[:self.idx] = field[:self.idx]
+            self.fields[i] = grown
+        self.allocated = new_size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.allocate(experience)
+        if not self.full:
+            self.reserve(self.idx + 1)
+
+        for field, value in zip(self.fields, experience):
+            field[self.idx] = value
+
+        self.idx  = (self.idx + 1) % self.max_capacity
+        self.full = self.full or self.idx == 0
+
+    def extend(self, experience_batch):
+        # one array per field with the batch in the first dimension, written with a single slice per field
+        experience_batch = [np.asarray(values) for values in experience_batch]
+        if len(experience_batch) == 0:
+            return
+        if self.fields is None:
+            self.allocate([values[0] for values in experience_batch])
+
+        batch_size = len(experience_batch[0])
+        if not self.full:
+            self.reserve(min(self.idx + batch_size, self.max_capacity))
+
+        idxs = (self.idx + np.arange(batch_size)) % self.max_capacity
+        for field, values in zip(self.fields, experience_batch):
+            field[idxs] = values
+
+        self.full = self.full or self.idx + batch_size >= self.max_capacity
+        self.idx  = (self.idx + batch_size) % self.max_capacity
+
+    def sample(self, sample_size):
+        idxs = np.random.randint(0, len(self), size=sample_size)
+        return tuple(field[idxs] for field in self.fields)
+
+
 class MemoryClass:
 
     def __init__(self, replay_max_size, device):
 
         self.replay_max_size = replay_max_size
-        self.replay_buffer   = deque(maxlen=replay_max_size)  
+        self.replay_buffer   = RingBuffer(replay_max_size)
         self.device          = device
 
 
@@ -20,27 +89,10 @@ class MemoryClass:
 
 
     def sample_experience(self, batch_size):
-        state_batch      = []
-        action_batch     = []
-        reward_batch     = []
-        next_state_batch = []
-        done_batch       = []
-
-        batch = random.sample(self.replay_buffer, batch_size)
-
-        for experience in batch:
-            state, action, reward, next_state, done = experience
-            state_batch.append(state)
-            action_batch.append(action)
-            reward_batch.append(reward)
-            next_state_batch.append(next_state)
-            done_batch.append(done)
-
-        state_batch      = np.array(state_batch)
-        action_batch     = np.array(action_batch)
-        reward_batch     = np.array(reward_batch).reshape(-1, 1)
-        done_batch       = np.array(done_batch).reshape(-1, 1)
-        next_state_batch = np.array(next_state_batch)
+        state_batch, action_batch, reward_batch, next_state_batch, done_batch = self.replay_buffer.sample(batch_size)
+
+        reward_batch     = reward_batch.reshape(-1, 1)
+        done_batch       = done_batch.reshape(-1, 1)
 
 
         state_batch_tensor      = torch.FloatTensor(state_batch).to(self.device)
@@ -4,6 +4,7 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
+from MemoryBuffers import to_device_tensor
 from Networks import Actor_AE as Actor
 from Networks import Critic_AE as Critic
 from Networks import Decoder
@@ -82,8 +83,8 @@ class AE_TD3:
 
     def select_action_from_policy(self, state):
         with torch.no_grad():
-            state_tensor = torch.FloatTensor(state)
-            state_tensor = state_tensor.unsqueeze(0).to(self.device)  # torch.Size([1, 3, 84, 84])
+            state_tensor = to_device_tensor(state, self.device)
+            state_tensor = state_tensor.unsqueeze(0)  # torch.Size([1, 3, 84, 84])
             action = self.actor(state_tensor)
             action = action.cpu().data.numpy().flatten()
         return action
@@ -92,20 +93,23 @@ class AE_TD3:
     def train_policy(self, experiences):
         self.update_counter += 1
 
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
         batch_size = len(states)
 
         # Convert into tensor
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards     = torch.FloatTensor(np.asarray(rewards)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
-        dones       = torch.FloatTensor(np.asarray(dones)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        rewards     = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
+        dones       = to_device_tensor(dones, self.device)
 
         # Reshape in the right order
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
         dones   = dones.unsqueeze(0).reshape(batch_size, 1)
 
+        # an n-step batch carries the discount of each sample (gamma ** steps taken), a 1-step one uses gamma
+        discounts = self.gamma if len(experiences) == 5 else to_device_tensor(experiences[5], self.device).reshape(batch_size, 1)
+
         # update the critic part
         with torch.no_grad():
             next_actions = self.actor_target(next_states)
@@ -117,7 +121,7 @@ class AE_TD3:
             target_q_values_one, target_q_values_two = self.critic_target(next_states, next_actions)
             target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
 
-            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+            q_target = rewards + discounts * (1 - dones) * target_q_values
 
         q_vals_q1, q_vals_q2 = self.critic(states, actions)
 
@@ -184,3 +188,15 @@ class AE_TD3:
         self.decoder.load_state_dict(torch.load(f'models/{filename}_decoder_model.pht'))
 
         logging.info("models has been loaded...")
+
+    def state_dict(self):
+        # everything needed to continue training: networks, targets, optimizers and the update counter
+        state = {name: value.state_dict() for name, value in vars(self).items() if isinstance(value, (torch.nn.Module, torch.optim.Optimizer))}
+        state["update_counter"] = self.update_counter
+        return state
+
+    def load_state_dict(self, state):
+        for name, value in vars(self).items():
+            if isinstance(value, (torch.nn.Module, torch.optim.Optimizer)):
+                value.load_state_dict(state[name])
+        self.update_counter = state["update_counter"]
@@ -0,0 +1,56 @@
+
+import os
+import random
+import logging
+
+import torch
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+
+def rng_state():
+    return {"random": random.getstate(),
+            "numpy":  np.random.get_state(),
+            "torch":  torch.get_rng_state(),
+            "cuda":   torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+
+def set_rng_state(state):
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def save_checkpoint(directory, agent, memory, loop_state):
+    """
+    Same as script_combination/Checkpoint.py, this folder is run on its own; change both together.
+    Writes the replay (the experiences added since the previous checkpoint), then the agent, RNG states and
+    loop_state to training_state.pt through a temporary file renamed over the previous one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = {"agent":      agent.state_dict(),
+             "replay":     memory.snapshot(os.path.join(directory, "replay")),
+             "rng":        rng_state(),
+             "loop_state": loop_state}
+
+    path      = os.path.join(directory, "training_state.pt")
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        torch.save(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    logging.info(f"Checkpoint saved in {directory} at {loop_state}")
+
+
+def load_checkpoint(directory, agent, memory):
+    # returns the loop_state given to save_checkpoint
+    state = torch.load(os.path.join(directory, "training_state.pt"), map_location="cpu", weights_only=False)
+    agent.load_state_dict(state["agent"])
+    memory.restore(os.path.join(directory, "replay"), state["replay"])
+    set_rng_state(state["rng"])
+    logging.info(f"Checkpoint loaded from {directory} at {state['loop_state']}")
+    return state["loop_state"]
@@ -2,7 +2,42 @@
 import cv2
 import gym
 import numpy as np
-from collections import deque
+
+
+class FrameRing:
+    """
+    Preallocated store for the last k frames. Each frame is written once, in place, and the stack is returned as a
+    view of k consecutive slots instead of a new concatenated array. When the writes reach the end of the store,
+    the newest k-1 frames are moved back to its start. The store has 4k slots, so a returned stack keeps its values
+    for at least one more step (state and next_state can be used together), copy it to keep it longer.
+    """
+    def __init__(self, k, concatenate=True):
+        self.k           = k
+        self.concatenate = concatenate  # (k*C, H, W) stacks if True, (k, H, W) if False
+        self.frames      = None         # allocated with the first frame, (4k, *frame_shape)
+        self.position    = 0            # slot of the newest frame
+        self.stack_shape = None
+
+    def reset(self, frame):
+        if self.frames is None:
+            frame = np.asarray(frame)
+            self.frames      = np.empty((4 * self.k, *frame.shape), dtype=frame.dtype)
+            self.position    = self.k - 1
+            self.stack_shape = (self.k * frame.shape[0], *frame.shape[1:]) if self.concatenate else (self.k, *frame.shape)
+        for _ in range(self.k):
+            self.append(frame)
+        return self.stack()
+
+    def append(self, frame):
+        if self.position + 1 == len(self.frames):
+            self.frames[:self.k - 1] = self.frames[len(self.frames) - self.k + 1:]
+            self.position = self.k - 2
+        self.position += 1
+        np.copyto(self.frames[self.position], frame)
+        return self.stack()
+
+    def stack(self):
+        return self.frames[self.position - self.k + 1:self.position + 1].reshape(self.stack_shape)
 
 
 class CreateEnvironment:
@@ -10,7 +45,9 @@ class CreateEnvironment:
 
         self.env = gym.make(env_name)
         self.k   = k  # number of frames to be stacked
-        self.frames_stacked = deque([], maxlen=k)
+        self.frames_stacked = FrameRing(k, concatenate=False)
+        self.gray_image     = None  # preprocessing output buffers
+        self.resized_image  = None
 
         self.act_dim    = self.env.action_space.shape[0]
         self.max_action = self.env.action_space.high.max()
@@ -19,25 +56,23 @@ class CreateEnvironment:
         self.env.reset()
         obs = self.env.render(mode='rgb_array')
         obs = self.preprocessing_image(obs)
-        for _ in range(self.k):
-            self.frames_stacked.append(obs)
-        stacked_vector = np.array(list(self.frames_stacked))
+        stacked_vector = self.frames_stacked.reset(obs)  # --> shape = (k, 84, 84) uint8
         return stacked_vector
 
     def step(self, action):
         _, reward, done, info = self.env.step(action)
         obs = self.env.render(mode='rgb_array')
         obs = self.preprocessing_image(obs)
-        self.frames_stacked.append(obs)
-        stacked_vector = np.array(list(self.frames_stacked))
+        stacked_vector = self.frames_stacked.append(obs)
         return stacked_vector, reward, done, info
 
     def preprocessing_image(self, image_array):
         #img_cropped = image_array[100:400, 100:400]
-        resized = cv2.resize(image_array, (84, 84), interpolation=cv2.INTER_AREA)
-        gray_image = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-        norm_image = cv2.normalize(gray_image, None, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_32F)
-        return norm_image
+        # grayscale first so a single channel is resized, then min-max stretched into uint8 (4x smaller than float32
+        # in the replay, the learner rescales it to [0, 1] on its device). The output buffers are reused every step
+        self.gray_image    = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY, dst=self.gray_image)
+        self.resized_image = cv2.resize(self.gray_image, (84, 84), dst=self.resized_image, interpolation=cv2.INTER_AREA)
+        return cv2.normalize(self.resized_image, self.resized_image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
 
     def seed(self, seed):
         self.env.seed(seed)
@@ -5,6 +5,7 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
+from MemoryBuffers import to_device_tensor
 from Networks import WorldModel
 from Networks import Decoder
 from Networks import RewardModel
@@ -17,7 +18,7 @@ logging.basicConfig(level=logging.INFO)
 
 
 class MB_AE_TD3:
-    def __init__(self, device, latent_dim, action_dim, max_action_value):
+    def __init__(self, device, latent_dim, action_dim, max_action_value, world_model_loss_weight=1.0, reward_model_loss_weight=1.0):
 
         # ------------------- Hyperparameters ---------------------- #
         encoder_lr = 1e-3
@@ -36,6 +37,10 @@ class MB_AE_TD3:
         self.update_counter     = 0
         self.policy_freq_update = 2
 
+        # weights of the two losses in the joint step of train_models
+        self.world_model_loss_weight  = world_model_loss_weight
+        self.reward_model_loss_weight = reward_model_loss_weight
+
         self.device     = device
         self.latent_dim = latent_dim
         self.action_dim = action_dim
@@ -76,8 +81,9 @@ class MB_AE_TD3:
         self.actor_optimizer  = torch.optim.Adam(self.actor.parameters(),  lr=actor_lr)
         self.critic_optimizer = torch.optim.Adam(self.critic.parameters(), lr=critic_lr)
 
-        self.world_model_optimizer  = torch.optim.Adam(self.world_model.parameters(), lr=world_model_lr)
-        self.reward_model_optimizer = torch.optim.Adam(self.reward_model.parameters(), lr=reward_model_lr)
+        # one step for both models, only their heads, the encoder they share with the critic is not trained by them
+        self.models_optimizer = torch.optim.Adam([{"params": self.world_model.model_net.parameters(),   "lr": world_model_lr},
+                                                  {"params": self.reward_model.reward_net.parameters(), "lr": reward_model_lr}])
         # ----------------------------------------------------------------------------------------------- #
 
         self.actor.train(True)
@@ -90,102 +96,91 @@ class MB_AE_TD3:
 
     def select_action_from_policy(self, state):
         with torch.no_grad():
-            state_tensor = torch.FloatTensor(state)
-            state_tensor = state_tensor.unsqueeze(0).to(self.device)  # torch.Size([1, 3, 84, 84])
+            state_tensor = to_device_tensor(state, self.device)
+            state_tensor = state_tensor.unsqueeze(0)  # torch.Size([1, 3, 84, 84])
             action = self.actor(state_tensor)
             action = action.cpu().data.numpy().flatten()
         return action
 
 
-    def generate_dream_samples(self, experiences):
-        states, _, _, _, _ = experiences
-        batch = len(states)
-
-        states = np.asarray(states)
-        states_tensor = torch.FloatTensor(states).to(self.device)
-
-        # batch of actions from currently policy
-        with torch.no_grad():
-            action_tensor = self.actor(states_tensor, detach_encoder=True)
-            actions       = action_tensor.cpu().data.numpy()
+    def generate_dream_samples(self, experiences, horizon=1):
+        """
+        Imagined transitions in latent space. The states of experiences are encoded once, then the policy, the
+        world model and the reward model are rolled forward horizon steps from every start state together,
+        without decoding the predicted latents. The batch*horizon transitions (z, action, reward, z_next, done)
+        come back to the host in one transfer, as numpy arrays for the dream buffer.
+        """
+        states = experiences[0]  # only the start states are used, the batch can be 1-step or n-step
+        states_tensor = to_device_tensor(states, self.device)
 
-        # predict batch new "dream" samples
         with torch.no_grad():
-            z_vector_next_tensor = self.world_model(states_tensor, action_tensor, detach_encoder=True)
-            next_rec_obs_tensor  = self.decoder(z_vector_next_tensor)
-            next_rec_prediction  = next_rec_obs_tensor.cpu().data.numpy()
-
-        # predict batch new "dream" reward
-        with torch.no_grad():
-            reward_prediction_tensor = self.reward_model(states_tensor, action_tensor, detach_encoder=True)
-            reward_prediction        = reward_prediction_tensor.cpu().data.numpy()
-
-        # I will assume the done as terminator states here are always False the generated data
-        dones = np.full((batch, 1), False)
-
-        # keep in mind that those values are already numpy arrays
-        return states, actions, reward_prediction, next_rec_prediction, dones
-
-
-    def train_world_model(self, experiences):
-
-        states, actions, _, next_states, _ = experiences
-
-        # Convert into tensor
-        # State and Next State are images here
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
+            z_vector = self.critic.encoder_net(states_tensor)  # the actor and models share this encoder
 
-        z_vector_next_true       = self.world_model.encoder_net(next_states, detach=True)
-        z_vector_next_prediction = self.world_model(states, actions, detach_encoder=True)
+            rollout = []
+            for _ in range(horizon):
+                action_tensor     = self.actor.forward_latent(z_vector)
+                z_vector_next     = self.world_model.forward_latent(z_vector, action_tensor)
+                reward_prediction = self.reward_model.forward_latent(z_vector, action_tensor)
+                rollout.append(torch.cat([z_vector, action_tensor, reward_prediction, z_vector_next], dim=1))
+                z_vector = z_vector_next
 
-        model_loss = F.mse_loss(z_vector_next_true, z_vector_next_prediction)
+            rollout = torch.cat(rollout).cpu().numpy()
 
-        self.world_model_optimizer.zero_grad()
-        model_loss.backward()
-        self.world_model_optimizer.step()
+        z_vectors, actions, rewards, z_vectors_next = np.split(rollout, np.cumsum([self.latent_dim, self.action_dim, 1]), axis=1)
 
-        #logging.info(f"Transition model loss: {model_loss.item()}")
+        # I will assume the done as terminator states here are always False the generated data
+        dones = np.zeros((len(rollout), 1), dtype=np.float32)
 
-    def train_reward_model(self, experiences):
+        return z_vectors, actions, rewards, z_vectors_next, dones
 
-        states, actions, rewards, _, _ = experiences
+    def train_models(self, experiences):
+        # world model and reward model on the same batch, states and next states go through the encoder in one pass
+        states, actions, rewards, next_states, _ = experiences
         batch_size = len(states)
 
-        states  = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards = torch.FloatTensor(np.asarray(rewards)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        rewards     = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
 
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
 
-        reward_prediction = self.reward_model(states, actions, detach_encoder=True)
+        z_vectors = self.world_model.encoder_net(torch.cat([states, next_states]), detach=True)
+        z_vector, z_vector_next_true = z_vectors[:batch_size], z_vectors[batch_size:]
 
+        z_vector_next_prediction = self.world_model.forward_latent(z_vector, actions)
+        reward_prediction        = self.reward_model.forward_latent(z_vector, actions)
+
+        model_loss        = F.mse_loss(z_vector_next_true, z_vector_next_prediction)
         reward_model_loss = F.mse_loss(rewards, reward_prediction)
+        total_loss        = self.world_model_loss_weight * model_loss + self.reward_model_loss_weight * reward_model_loss
 
-        self.reward_model_optimizer.zero_grad()
-        reward_model_loss.backward()
-        self.reward_model_optimizer.step()
+        self.models_optimizer.zero_grad()
+        total_loss.backward()
+        self.models_optimizer.step()
 
-        #logging.info(f"Reward model loss: {reward_model_loss.item()}")
+        #logging.info(f"Transition model loss: {model_loss.item()}, Reward model loss: {reward_model_loss.item()}")
 
     def train_policy(self, experiences):
         self.update_counter += 1
 
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
         batch_size = len(states)
 
         # Convert into tensor
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards     = torch.FloatTensor(np.asarray(rewards)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
-        dones       = torch.FloatTensor(np.asarray(dones)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        rewards     = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
+        dones       = to_device_tensor(dones, self.device)
 
         # Reshape in the right order
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
         dones   = dones.unsqueeze(0).reshape(batch_size, 1)
 
+        # an n-step batch carries the discount of each sample (gamma ** steps taken), a 1-step one uses gamma
+        discounts = self.gamma if len(experiences) == 5 else to_device_tensor(experiences[5], self.device).reshape(batch_size, 1)
+
         # print("states:", states.shape)
         # print("actions:", actions.shape)
         # print("rewards:", rewards.shape)
@@ -204,7 +199,7 @@ class MB_AE_TD3:
             target_q_values_one, target_q_values_two = self.critic_target(next_states, next_actions)
 
             target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
-            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+            q_target = rewards + discounts * (1 - dones) * target_q_values
 
         q_vals_q1, q_vals_q2 = self.critic(states, actions)
 
@@ -229,13 +224,7 @@ class MB_AE_TD3:
             actor_loss.backward()
             self.actor_optimizer.step()
 
-            # Update target networks
-            for target_param, param in zip(self.critic_target.parameters(), self.critic.parameters()):
-                target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
-
-            for target_param, param in zip(self.actor_target.parameters(), self.actor.parameters()):
-                target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
-
+            self.update_target_networks()
 
         # Update the autoencoder part
         z_vector = self.critic.encoder_net(states)
@@ -252,6 +241,53 @@ class MB_AE_TD3:
         self.encoder_optimizer.step()
         self.decoder_optimizer.step()
 
+    def train_policy_latent(self, experiences):
+        # TD3 update of the actor and critic heads on latent dream transitions, the encoder is not involved
+        self.update_counter += 1
+
+        z_vectors, actions, rewards, z_vectors_next, dones = (to_device_tensor(values, self.device) for values in experiences)
+
+        with torch.no_grad():
+            next_actions = self.actor_target.forward_latent(z_vectors_next)
+            target_noise = 0.2 * torch.randn_like(next_actions)
+            target_noise = torch.clamp(target_noise, -0.5, 0.5)
+            next_actions = next_actions + target_noise
+            next_actions = torch.clamp(next_actions, min=-self.max_action_value, max=self.max_action_value)
+
+            # the predicted latent is in the space of the online encoder, the target encoder trails it by tau
+            target_q_values_one, target_q_values_two = self.critic_target.forward_latent(z_vectors_next, next_actions)
+
+            target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
+            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+
+        q_vals_q1, q_vals_q2 = self.critic.forward_latent(z_vectors, actions)
+
+        critic_loss_total = F.mse_loss(q_vals_q1, q_target) + F.mse_loss(q_vals_q2, q_target)
+
+        self.critic_optimizer.zero_grad()
+        critic_loss_total.backward()
+        self.critic_optimizer.step()
+
+        if self.update_counter % self.policy_freq_update == 0:
+            actor_action        = self.actor.forward_latent(z_vectors)
+            actor_q1, actor_q2  = self.critic.forward_latent(z_vectors, actor_action)
+
+            actor_q_min = torch.minimum(actor_q1, actor_q2)
+            actor_loss  = - actor_q_min.mean()
+
+            self.actor_optimizer.zero_grad()
+            actor_loss.backward()
+            self.actor_optimizer.step()
+
+            self.update_target_networks()
+
+    def update_target_networks(self):
+        for target_param, param in zip(self.critic_target.parameters(), self.critic.parameters()):
+            target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
+
+        for target_param, param in zip(self.actor_target.parameters(), self.actor.parameters()):
+            target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
+
     def save_models(self, filename):
         torch.save(self.actor.state_dict(), f'models/{filename}_actor_model.pht')
         torch.save(self.critic.state_dict(), f'models/{filename}_critic_mode.pht')
@@ -275,3 +311,15 @@ class MB_AE_TD3:
         self.reward_model.load_state_dict(torch.load(f'models/{filename}_reward_model.pht'))
 
         logging.info("models has been loaded...")
+
+    def state_dict(self):
+        # everything needed to continue training: networks, targets, optimizers and the update counter
+        state = {name: value.state_dict() for name, value in vars(self).items() if isinstance(value, (torch.nn.Module, torch.optim.Optimizer))}
+        state["update_counter"] = self.update_counter
+        return state
+
+    def load_state_dict(self, state):
+        for name, value in vars(self).items():
+            if isinstance(value, (torch.nn.Module, torch.optim.Optimizer)):
+                value.load_state_dict(state[name])
+        self.update_counter = state["update_counter"]
@@ -1,33 +1,247 @@
 
-from collections import deque
-import random
+import os
+import torch
+import numpy as np
+
+
+def to_device_tensor(array, device):
+    # the batches of MBAETD3 and AETD3 and the evaluation states, uint8 stacks are rescaled to [0, 1] on the device
+    tensor = array if torch.is_tensor(array) else torch.from_numpy(np.asarray(array))
+    tensor = tensor.to(device, non_blocking=True)
+    if tensor.dtype == torch.uint8:
+        return tensor * (1.0 / 255)
+    return tensor.float()
+
+
+class RingBuffer:
+    """
+    Ring of typed numpy arrays, one per field of the experience tuple, sampled with vectorized indexes.
+    The arrays are created on the first append from the shape of each field (uint8 images keep their type,
+    everything else is stored as float32) and grow geometrically up to max_capacity, so memory follows the
+    number of stored experiences as the deque did.
+
+    snapshot() writes the experiences appended since the previous snapshot into a checkpoint folder and
+    restore() reads them back when a run is resumed.
+
+    4DoF_Gripper, gripper_AE_environment, gripper_aruco_environment and openAI_gym_envs are run on their own and keep
+    a copy of this class without the snapshots, a change here goes to them too.
+    """
+    def __init__(self, max_capacity):
+        self.max_capacity = max_capacity
+        self.allocated    = 0
+        self.fields       = None
+
+        self.idx  = 0
+        self.full = False
+
+        self.snapshot_idx = None  # cursor at the last snapshot, None if there is none
+        self.unsaved      = 0     # experiences appended since the last snapshot
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def allocate(self, experience):
+        self.fields = []
+        for value in experience:
+            value = np.asarray(value)
+            dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+            self.fields.append(np.empty((0, *value.shape), dtype=dtype))
+
+    def reserve(self, size):
+        if size <= self.allocated:
+            return
+        new_size = min(self.max_capacity, max(size, 2 * self.allocated, 1024))
+        for i, field in enumerate(self.fields):
+            grown = np.empty((new_size, *field.shape[1:]), dtype=field.dtype)
+            grown[:self.idx] = field[:self.idx]
+            self.fields[i] = grown
+        self.allocated = new_size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.allocate(experience)
+        if not self.full:
+            self.reserve(self.idx + 1)
+
+        for field, value in zip(self.fields, experience):
+            field[self.idx] = value
+
+        self.idx  = (self.idx + 1) % self.max_capacity
+        self.full = self.full or self.idx == 0
+        self.unsaved += 1
+
+    def extend(self, experience_batch):
+        # one array per field with the batch in the first dimension, written with a single slice per field
+        experience_batch = [np.asarray(values) for values in experience_batch]
+        if len(experience_batch) == 0:
+            return
+        if self.fields is None:
+            self.allocate([values[0] for values in experience_batch])
+
+        batch_size = len(experience_batch[0])
+        if not self.full:
+            self.reserve(min(self.idx + batch_size, self.max_capacity))
+
+        idxs = (self.idx + np.arange(batch_size)) % self.max_capacity
+        for field, values in zip(self.fields, experience_batch):
+            field[idxs] = values
+
+        self.full = self.full or self.idx + batch_size >= self.max_capacity
+        self.idx  = (self.idx + batch_size) % self.max_capacity
+        self.unsaved += batch_size
+
+    def sample(self, sample_size):
+        idxs = np.random.randint(0, len(self), size=sample_size)
+        return tuple(field[idxs] for field in self.fields)
+
+    def snapshot_ranges(self):
+        # contiguous index ranges written since the last snapshot
+        if self.snapshot_idx is None or self.unsaved >= len(self):
+            return [(0, len(self))]
+        start = self.snapshot_idx
+        end   = start + self.unsaved
+        if end <= self.max_capacity:
+            return [(start, end)]
+        return [(start, self.max_capacity), (0, end - self.max_capacity)]
+
+    def snapshot(self, directory, name):
+        # the new experiences go to <name>_<field>.npy in directory, the returned cursor is kept by the checkpoint
+        if self.fields is not None:
+            os.makedirs(directory, exist_ok=True)
+            for i, field in enumerate(self.fields):
+                path = os.path.join(directory, f"{name}_{i}.npy")
+                mode = "r+" if os.path.exists(path) else "w+"
+                file = np.lib.format.open_memmap(path, mode=mode, dtype=field.dtype, shape=(self.max_capacity, *field.shape[1:]))
+                for start, end in self.snapshot_ranges():
+                    file[start:end] = field[start:end]
+                file.flush()
+                del file
+
+        self.snapshot_idx = self.idx
+        self.unsaved      = 0
+        return {"idx": self.idx, "full": self.full, "fields": 0 if self.fields is None else len(self.fields)}
+
+    def restore(self, directory, name, snapshot):
+        size = self.max_capacity if snapshot["full"] else snapshot["idx"]
+        if snapshot["fields"] > 0:
+            files = [np.lib.format.open_memmap(os.path.join(directory, f"{name}_{i}.npy"), mode="r") for i in range(snapshot["fields"])]
+            self.fields    = [np.empty((0, *file.shape[1:]), dtype=file.dtype) for file in files]
+            self.allocated = 0
+            self.idx       = 0
+            self.reserve(size)
+            for field, file in zip(self.fields, files):
+                field[:size] = file[:size]
+            del files
+
+        self.idx  = snapshot["idx"]
+        self.full = snapshot["full"]
+        self.snapshot_idx = self.idx
+        self.unsaved      = 0
+
+
+class EpisodeBuffer:
+    """
+    The open episode, kept in typed numpy arrays like the RingBuffer ones until it ends and is moved to the
+    replay as a whole with one write per field. The arrays are created on the first append and doubled when an
+    episode is longer than them, so after the longest episode they are only reused.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.fields   = None
+        self.size     = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.fields = []
+            for value in experience:
+                value = np.asarray(value)
+                dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+                self.fields.append(np.empty((self.capacity, *value.shape), dtype=dtype))
+        if self.size == self.capacity:
+            self.capacity *= 2
+            self.fields = [np.concatenate((field, np.empty_like(field))) for field in self.fields]
+
+        # the values are copied, frames the env keeps overwriting can be appended as they are
+        for field, value in zip(self.fields, experience):
+            field[self.size] = value
+        self.size += 1
+
+    def experience(self):
+        # one array per field, views of the episode that stay valid until clear()
+        return [field[:self.size] for field in self.fields]
+
+    def clear(self):
+        self.size = 0
+
 
 class MemoryBuffer:
-    def __init__(self, max_capacity=int(1e6)):
+    """
+    Environment and dream (model) replay. With n_step > 1 sample_env() returns n-step transitions, computed at
+    sample time from the consecutive experiences of the episode: the discounted sum of up to n_step rewards, the
+    next state and done of the last step taken and a sixth array with the discount gamma ** (steps taken).
+    """
+    def __init__(self, max_capacity=int(1e6), n_step=1, gamma=0.99):
+
+        self.buffer_env    = RingBuffer(max_capacity)
+        self.buffer_model  = RingBuffer(50_000)
 
-        self.buffer_env    = deque([], maxlen=max_capacity)
-        self.buffer_model  = deque([], maxlen=50_000)
+        self.n_step = n_step
+        self.gamma  = gamma
 
     def add_env(self,  *experience):
         self.buffer_env.append(experience)
 
     def extend_env(self, experience):
+        # experience is one array per field (states, actions, rewards, next_states, dones) e.g. a whole episode
         self.buffer_env.extend(experience)
 
     def add_model(self,  *experience):
-        # need the for loop because each experiences is a batch e.g action is a [batch_size, 4]
-        # I take each element of the batch and store in the buffer
-        for single_state, single_action, single_reward, single_next_state, single_done in zip(*experience):
-            self.buffer_model.append((single_state, single_action, single_reward, single_next_state, single_done))
+        # dream transitions in latent space (z, action, reward, z_next, done), each field is a batch
+        # e.g action is a [batch_size * horizon, 4], stored with one slice write per field
+        self.buffer_model.extend(experience)
 
-
-    def sample_env(self, sample_size):
-        experience_batch = random.sample(self.buffer_env, sample_size)
-        states, actions, rewards, next_states, dones = zip(*experience_batch)
+    def sample_env(self, sample_size, n_step=None):
+        # n_step overrides the one of the buffer, e.g. n_step=1 for the world and reward models
+        n_step = self.n_step if n_step is None else n_step
+        if n_step > 1:
+            return self.sample_env_n_step(sample_size, n_step)
+        states, actions, rewards, next_states, dones = self.buffer_env.sample(sample_size)
         return states, actions, rewards, next_states, dones
 
+    def sample_env_n_step(self, sample_size, n_step):
+        buffer = self.buffer_env
+        states, actions, rewards, next_states, dones = buffer.fields
+
+        idxs    = np.random.randint(0, len(buffer), size=sample_size)
+        offsets = np.arange(n_step)
+
+        # the experiences that follow each index, up to n_step, stopping after a done or at the cursor
+        written = offsets < ((buffer.idx - idxs - 1) % buffer.max_capacity + 1)[:, None]
+        slots   = np.where(written, (idxs[:, None] + offsets) % buffer.max_capacity, idxs[:, None])  # --> shape = (batch, n_step)
+
+        ended = dones[slots] > 0
+        taken = written.copy()
+        taken[:, 1:] &= ~ended[:, :-1]
+        taken = np.logical_and.accumulate(taken, axis=1)
+
+        num_steps = taken.sum(axis=1)
+        last      = (idxs + num_steps - 1) % buffer.max_capacity
+
+        n_step_rewards = (rewards[slots] * taken * self.gamma ** offsets).sum(axis=1).astype(np.float32)
+        discounts      = (self.gamma ** num_steps).astype(np.float32)[:, None]
+        return states[idxs], actions[idxs], n_step_rewards, next_states[last], dones[last], discounts
+
     def sample_model(self, sample_size):
-        experience_batch = random.sample(self.buffer_model, sample_size)
-        states, actions, rewards, next_states, dones = zip(*experience_batch)
-        return states, actions, rewards, next_states, dones
+        z_vectors, actions, rewards, z_vectors_next, dones = self.buffer_model.sample(sample_size)
+        return z_vectors, actions, rewards, z_vectors_next, dones
+
+    def snapshot(self, directory):
+        return {"env": self.buffer_env.snapshot(directory, "env"), "model": self.buffer_model.snapshot(directory, "model")}
+
+    def restore(self, directory, snapshot):
+        self.buffer_env.restore(directory, "env", snapshot["env"])
+        self.buffer_model.restore(directory, "model", snapshot["model"])
 
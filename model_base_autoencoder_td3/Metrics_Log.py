@@ -0,0 +1,55 @@
+
+import os
+import numpy as np
+
+
+class MetricsLog:
+    """
+    Copy of script_combination/Metrics_Log.py, this folder is run on its own; change the copies together.
+    Append-only CSV of training metrics, e.g. MetricsLog("data_plots/run", ["episode", "reward"]), written a
+    chunk of rows at a time. Plot it offline with script_combination/plot_metrics.py.
+    """
+    def __init__(self, path, columns, chunk_size=1000, append=False, truncate=None):
+        self.path    = path
+        self.columns = list(columns)
+        self.chunk   = np.empty((chunk_size, len(self.columns)), dtype=np.float64)
+        self.size    = 0  # rows waiting in the chunk
+
+        if not append or not os.path.exists(path):
+            with open(path, "w") as file:
+                file.write(",".join(self.columns) + "\n")
+        elif truncate is not None:
+            # the file_size() of a checkpoint, the rows written after it are dropped, the resumed run writes them again
+            with open(path, "r+") as file:
+                file.truncate(truncate)
+
+    def append(self, **values):
+        self.chunk[self.size] = [values[column] for column in self.columns]
+        self.size += 1
+        if self.size == len(self.chunk):
+            self.flush()
+
+    def extend(self, values):
+        # values is a dict of equally long sequences, one per column
+        rows = np.column_stack([np.asarray(values[column], dtype=np.float64) for column in self.columns])
+        if self.size + len(rows) > len(self.chunk):
+            self.flush()
+        if len(rows) >= len(self.chunk):
+            self.write(rows)
+            return
+        self.chunk[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def flush(self):
+        if self.size > 0:
+            self.write(self.chunk[:self.size])
+            self.size = 0
+
+    def file_size(self):
+        # bytes on disk once every row is flushed, a checkpoint keeps it to truncate the file on resume
+        self.flush()
+        return os.path.getsize(self.path)
+
+    def write(self, rows):
+        with open(self.path, "a") as file:
+            np.savetxt(file, rows, delimiter=",", fmt="%.10g")
@@ -137,7 +137,11 @@ class WorldModel(nn.Module):
         )
 
     def forward(self, state, action, detach_encoder=False):
-        z_vector      = self.encoder_net(state, detach=detach_encoder)
+        z_vector = self.encoder_net(state, detach=detach_encoder)
+        return self.forward_latent(z_vector, action)
+
+    def forward_latent(self, z_vector, action):
+        # next latent from a latent, used to roll the model forward without decoding
         z_n_action    = torch.cat([z_vector, action], dim=1)
         z_vector_next = self.model_net(z_n_action)
         return z_vector_next
@@ -161,7 +165,10 @@ class RewardModel(nn.Module):
         )
 
     def forward(self, state, action, detach_encoder=False):
-        z_vector   = self.encoder_net(state, detach=detach_encoder)
+        z_vector = self.encoder_net(state, detach=detach_encoder)
+        return self.forward_latent(z_vector, action)
+
+    def forward_latent(self, z_vector, action):
         z_n_action = torch.cat([z_vector, action], dim=1)
         reward     = self.reward_net(z_n_action)
         return reward
@@ -188,9 +195,11 @@ class Actor_AE(nn.Module):
         self.apply(weight_init)
 
     def forward(self, state, detach_encoder=False):
-
         z_vector = self.encoder_net(state, detach=detach_encoder)
+        return self.forward_latent(z_vector)
 
+    def forward_latent(self, z_vector):
+        # policy head only, for latent states that are already encoded (or imagined by the world model)
         a = F.relu(self.l1(z_vector))
         a = F.relu(self.l2(a))
 
@@ -226,8 +235,11 @@ class Critic_AE(nn.Module):
         self.apply(weight_init)
 
     def forward(self, state, action, detach_encoder=False):
+        z_vector = self.encoder_net(state, detach=detach_encoder)
+        return self.forward_latent(z_vector, action)
 
-        z_vector   = self.encoder_net(state, detach=detach_encoder)
+    def forward_latent(self, z_vector, action):
+        # Q heads only, for latent states that are already encoded (or imagined by the world model)
         obs_action = torch.cat([z_vector, action], dim=1)
 
         q1 = F.relu(self.l1(obs_action))
@@ -64,7 +64,7 @@ class TD3:
 
         self.update_counter += 1
 
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
         batch_size = len(states)
 
         # Convert into tensor
@@ -78,6 +78,9 @@ class TD3:
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
         dones   = dones.unsqueeze(0).reshape(batch_size, 1)
 
+        # an n-step batch carries the discount of each sample (gamma ** steps taken), a 1-step one uses gamma
+        discounts = self.gamma if len(experiences) == 5 else torch.FloatTensor(np.asarray(experiences[5])).to(self.device).reshape(batch_size, 1)
+
         # update the critic part
         with torch.no_grad():
             next_actions = self.actor_target(next_states)
@@ -89,7 +92,7 @@ class TD3:
             target_q_values_one, target_q_values_two = self.critic_target(next_states, next_actions)
             target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
 
-            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+            q_target = rewards + discounts * (1 - dones) * target_q_values
 
         q_vals_q1, q_vals_q2 = self.critic(states, actions)
 
@@ -131,4 +134,16 @@ class TD3:
     def load_models(self, filename):
         self.actor.load_state_dict(torch.load(f'models/{filename}_actor_model.pht'))
         self.critic.load_state_dict(torch.load(f'models/{filename}_critic_mode.pht'))
-        logging.info("models has been loaded...")
\ No newline at end of file
+        logging.info("models has been loaded...")
+
+    def state_dict(self):
+        # everything needed to continue training: networks, targets, optimizers and the update counter
+        state = {name: value.state_dict() for name, value in vars(self).items() if isinstance(value, (torch.nn.Module, torch.optim.Optimizer))}
+        state["update_counter"] = self.update_counter
+        return state
+
+    def load_state_dict(self, state):
+        for name, value in vars(self).items():
+            if isinstance(value, (torch.nn.Module, torch.optim.Optimizer)):
+                value.load_state_dict(state[name])
+        self.update_counter = state["update_counter"]
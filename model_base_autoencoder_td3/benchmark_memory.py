@@ -0,0 +1,57 @@
+"""
+Sampling cost of the replay buffer as it fills, against the previous deque + random.sample buffer.
+random.sample on a deque indexes it element by element (O(n) each), the ring buffer draws a vector of
+indexes and gathers each field with one fancy-indexed read, so its cost should stay flat.
+
+python benchmark_memory.py --max_size 1000000
+"""
+import time
+import random
+import numpy as np
+from collections import deque
+from argparse import ArgumentParser
+
+from MemoryBuffers import MemoryBuffer
+
+
+def sample_deque(buffer, batch_size):
+    experience_batch = random.sample(buffer, batch_size)
+    states, actions, rewards, next_states, dones = zip(*experience_batch)
+    return np.asarray(states), np.asarray(actions), np.asarray(rewards), np.asarray(next_states), np.asarray(dones)
+
+
+def time_call(function, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions * 1e6  # micro seconds per call
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--max_size",    type=int, default=1_000_000)
+    parser.add_argument("--batch_size",  type=int, default=32)
+    parser.add_argument("--obs_dim",     type=int, default=17)
+    parser.add_argument("--act_dim",     type=int, default=6)
+    parser.add_argument("--repetitions", type=int, default=200)
+    args = parser.parse_args()
+
+    memory = MemoryBuffer(max_capacity=args.max_size)
+    buffer = deque([], maxlen=args.max_size)
+
+    checkpoints = [size for size in (1_000, 10_000, 100_000, 1_000_000, 10_000_000) if size <= args.max_size]
+
+    print(f"{'size':>10} | {'deque (us)':>12} | {'ring (us)':>12}")
+    for size in checkpoints:
+        while len(buffer) < size:
+            experience = (np.random.rand(args.obs_dim), np.random.rand(args.act_dim), np.random.rand(), np.random.rand(args.obs_dim), False)
+            buffer.append(experience)
+            memory.add_env(*experience)
+
+        deque_time = time_call(lambda: sample_deque(buffer, args.batch_size), args.repetitions)
+        ring_time  = time_call(lambda: memory.sample_env(args.batch_size), args.repetitions)
+        print(f"{size:>10} | {deque_time:>12.1f} | {ring_time:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
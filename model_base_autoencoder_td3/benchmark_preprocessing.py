@@ -0,0 +1,69 @@
+"""
+Cost of preprocessing one rendered Pendulum-v1 rgb_array frame, the previous chain
+(resize -> grayscale -> min-max normalize to float32, new arrays every call) against the grayscale-first one
+(grayscale -> resize -> min-max stretch to uint8, into reused buffers) now in Gym_Environment and the FrameStacks.
+The uint8 frame is rescaled to [0, 1] on the learner device, the difference column compares both after that.
+
+python benchmark_preprocessing.py --frames 200 --repetitions 20
+"""
+import time
+import cv2
+import gym
+import numpy as np
+from argparse import ArgumentParser
+
+
+def preprocessing_previous(image_array):
+    resized    = cv2.resize(image_array, (84, 84), interpolation=cv2.INTER_AREA)
+    gray_image = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+    norm_image = cv2.normalize(gray_image, None, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_32F)
+    return norm_image
+
+
+class PreprocessingGrayFirst:
+    def __init__(self):
+        self.gray_image    = None
+        self.resized_image = None
+
+    def __call__(self, image_array):
+        self.gray_image    = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY, dst=self.gray_image)
+        self.resized_image = cv2.resize(self.gray_image, (84, 84), dst=self.resized_image, interpolation=cv2.INTER_AREA)
+        return cv2.normalize(self.resized_image, self.resized_image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
+
+
+def time_call(function, frames, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for frame in frames:
+            function(frame)
+    return (time.perf_counter() - start) / (repetitions * len(frames)) * 1e6  # micro seconds per frame
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--frames",      type=int, default=200)
+    parser.add_argument("--repetitions", type=int, default=20)
+    args = parser.parse_args()
+
+    env = gym.make("Pendulum-v1", render_mode="rgb_array", disable_env_checker=True)
+    env.reset(seed=1)
+    frames = []
+    for _ in range(args.frames):
+        env.step(env.action_space.sample())
+        frames.append(env.render())
+    env.close()
+
+    gray_first = PreprocessingGrayFirst()
+    difference = max(np.abs(preprocessing_previous(frame) - gray_first(frame) / 255).max() for frame in frames)
+
+    previous_time   = time_call(preprocessing_previous, frames, args.repetitions)
+    gray_first_time = time_call(gray_first, frames, args.repetitions)
+
+    print(f"frame {frames[0].shape} {frames[0].dtype}")
+    print(f"previous   : {previous_time:8.1f} us/frame | stored {preprocessing_previous(frames[0]).nbytes} bytes")
+    print(f"gray first : {gray_first_time:8.1f} us/frame | stored {gray_first(frames[0]).nbytes} bytes")
+    print(f"max abs difference in [0, 1]: {difference:.4f}")
+
+
+if __name__ == '__main__':
+    main()
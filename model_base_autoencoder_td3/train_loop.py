@@ -3,7 +3,6 @@ This will be used only with gym/control suite
 
 """
 import cv2
-import pandas as pd
 import matplotlib.pyplot as plt
 
 import os
@@ -19,6 +18,8 @@ import MBAETD3
 import AETD3
 import TD3
 import Gym_Environment
+from Metrics_Log import MetricsLog
+from Checkpoint import save_checkpoint, load_checkpoint
 
 logging.basicConfig(level=logging.INFO)
 
@@ -42,40 +43,9 @@ def create_directories():
     if not os.path.exists("./checkpoints"):
         os.makedirs("./checkpoints")
 
-def plot_reward_curve(data_reward, filename, check_point=False):
-    if check_point:
-        data = pd.DataFrame.from_dict(data_reward)
-        data.to_csv(f"checkpoints/{filename}_checkpoint", index=False)
-        data.plot(x='episode', y='reward', title=filename)
-        plt.savefig(f"checkpoints/{filename}_checkpoint")
-        plt.close()
-
-    else:
-        data = pd.DataFrame.from_dict(data_reward)
-        data.to_csv(f"data_plots/{filename}", index=False)
-        data.plot(x='episode', y='reward', title=filename)
-        plt.savefig(f"results/{filename}")
-        plt.show()
-
-
-
-def backward_episode_reward(episode_experience, episode_reward):
-
-    experience_length = len(episode_experience)
-    discount_reward = []
-    discount        = 0.98
-
-    for i in range(experience_length):
-        discount_reward.append(episode_reward * discount ** i)
-
-    discount_reward = reversed(discount_reward)
-
-    discounted_experience = []
-    for experience, dis_reward in zip(episode_experience, discount_reward):
-        state, action, reward, next_state, done = experience
-        new_reward = reward + dis_reward
-        discounted_experience.append((state, action, new_reward, next_state, done))
-    return discounted_experience
+def backward_episode_reward(rewards, episode_reward, discount=0.98):
+    # the last step of the episode gets the whole episode reward, each step before it one more discount factor
+    return rewards + episode_reward * discount ** np.arange(len(rewards) - 1, -1, -1, dtype=np.float32)
 
 
 def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
@@ -83,15 +53,25 @@ def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
     episode_reward    = 0
     episode_num       = 0
 
+    start_step   = 0
+    metrics_size = {}
+    if args.resume:
+        # agent, optimizers, replay and RNG come back as they were, the run continues after its last checkpoint
+        loop_state   = load_checkpoint(args.checkpoint_dir, agent, memory)
+        start_step   = loop_state["total_step_counter"]
+        episode_num  = loop_state["episode_num"]
+        file_name    = loop_state["file_name"]
+        metrics_size = loop_state.get("metrics_size", {})  # the episodes logged after the checkpoint are logged again
+    last_checkpoint = start_step
+
     state = env.reset()
     done  = False
 
-    episode_experiences = []
+    episode_experiences = MemoryBuffers.EpisodeBuffer()
 
-    historical_reward   = {"episode": [], "reward": []}
-    #historical_reward   = {"step": [], "reward": []}
+    historical_reward   = MetricsLog(f"data_plots/{file_name}", ["episode", "reward"], append=args.resume, truncate=metrics_size.get("reward"))  # plot it with script_combination/plot_metrics.py
 
-    for total_step_counter in range(int(args.max_steps_training)):
+    for total_step_counter in range(start_step, int(args.max_steps_training)):
         episode_timesteps += 1
 
         if total_step_counter < args.max_steps_exploration:
@@ -111,7 +91,7 @@ def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
 
         new_state, reward, done, _ = env.step(action)
         if reward_type == "backward_reward":
-            episode_experiences.append((state, action, reward, new_state, done))
+            episode_experiences.append((state, action, reward, new_state, done))  # copied into the episode arrays
         else:
             memory.add_env(state, action, reward, new_state, done)
         state = new_state
@@ -120,24 +100,23 @@ def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
         if total_step_counter >= args.max_steps_exploration:
             if args.agent == "MB_AE_TD3":
                 logging.info("Training World and Reward Model")
-                experiences = memory.sample_env(args.batch_size)
-                agent.train_world_model(experiences)
-                agent.train_reward_model(experiences)
+                experiences = memory.sample_env(args.batch_size, n_step=1)  # the models learn one step ahead
+                agent.train_models(experiences)
                 p = np.random.random()
                 for _ in range(args.G):
                     if len(memory.buffer_model) >= args.batch_size:
                         if p < 0.6:
                             logging.info(" Training Agent Model with Model Data")
                             experiences = memory.sample_model(args.batch_size)
-                            agent.train_policy(experiences)
+                            agent.train_policy_latent(experiences)
                         else:
                             logging.info(" Training Agent Model with Env Data")
                             experiences = memory.sample_env(args.batch_size)
                             agent.train_policy(experiences)
                 for _ in range(args.M):
                     experiences = memory.sample_env(args.batch_size)
-                    d_state, d_action, d_reward, d_next_state, d_done = agent.generate_dream_samples(experiences)
-                    memory.add_model(d_state, d_action, d_reward, d_next_state, d_done)
+                    d_z, d_action, d_reward, d_next_z, d_done = agent.generate_dream_samples(experiences, args.H)
+                    memory.add_model(d_z, d_action, d_reward, d_next_z, d_done)
 
             else:
                 for _ in range(args.G):
@@ -147,13 +126,12 @@ def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
 
         if done:
             logging.info(f"Total T:{total_step_counter} Episode {episode_num} was completed with {episode_timesteps} steps taken and a Reward= {episode_reward:.3f}\n")
-            historical_reward["episode"].append(episode_num)
-            historical_reward["reward"].append(episode_reward)
+            historical_reward.append(episode=episode_num, reward=episode_reward)
 
             if reward_type == "backward_reward":
-                discounted_episode_experience = backward_episode_reward(episode_experiences, episode_reward)
-                memory.extend_env(discounted_episode_experience)
-                episode_experiences = []
+                states, actions, rewards, next_states, dones = episode_experiences.experience()
+                memory.extend_env((states, actions, backward_episode_reward(rewards, episode_reward), next_states, dones))
+                episode_experiences.clear()
 
             # Reset environment
             state = env.reset()
@@ -163,12 +141,15 @@ def train(args, agent, memory, env, act_dim, max_value, file_name, reward_type):
             episode_num += 1
 
             if episode_num % args.plot_freq == 0:
-                check_point = True
-                plot_reward_curve(historical_reward, file_name, check_point)
-                check_point = False
+                historical_reward.flush()
+
+            if args.checkpoint_dir is not None and total_step_counter + 1 - last_checkpoint >= args.checkpoint_interval:
+                save_checkpoint(args.checkpoint_dir, agent, memory, {"total_step_counter": total_step_counter + 1, "episode_num": episode_num, "file_name": file_name,
+                                                                     "metrics_size": {"reward": historical_reward.file_size()}})
+                last_checkpoint = total_step_counter + 1
 
     agent.save_models(file_name)
-    plot_reward_curve(historical_reward, file_name)
+    historical_reward.flush()
 
 
 def encoder_models_evaluation(args, agent, env, device, file_name):
@@ -185,11 +166,11 @@ def encoder_models_evaluation(args, agent, env, device, file_name):
     action = env.action_sample()
     new_state, reward, done, _ = env.step(action)
 
-    state_image_tensor = torch.FloatTensor(state)
-    state_image_tensor = state_image_tensor.unsqueeze(0).to(device)
+    state_image_tensor = MemoryBuffers.to_device_tensor(state, device)  # uint8 stacks, rescaled to [0, 1] on the device
+    state_image_tensor = state_image_tensor.unsqueeze(0)
 
-    new_state_tensor = torch.FloatTensor(new_state)
-    new_state_tensor = new_state_tensor.unsqueeze(0).to(device)
+    new_state_tensor = MemoryBuffers.to_device_tensor(new_state, device)
+    new_state_tensor = new_state_tensor.unsqueeze(0)
 
     action_tensor = torch.FloatTensor(action)
     action_tensor = action_tensor.unsqueeze(0).to(device)
@@ -208,8 +189,8 @@ def encoder_models_evaluation(args, agent, env, device, file_name):
             rec_prediction = agent.decoder(z_next_prediction_tensor)
             rec_prediction = rec_prediction.cpu().data.numpy()
 
-        current_state_true  = state[2]
-        next_state_true     = new_state[2]
+        current_state_true  = state[2] * np.float32(1 / 255)
+        next_state_true     = new_state[2] * np.float32(1 / 255)
         reconstructed_image = rec_prediction[0][2]
 
         diff = cv2.subtract(next_state_true, reconstructed_image)
@@ -244,7 +225,7 @@ def encoder_models_evaluation(args, agent, env, device, file_name):
             rec_prediction = agent.decoder(z_vector)
             rec_prediction = rec_prediction.cpu().data.numpy()
 
-        current_state_true  = state[2]
+        current_state_true  = state[2] * np.float32(1 / 255)
         reconstructed_image = rec_prediction[0][2]
 
         diff = cv2.subtract(current_state_true, reconstructed_image)
@@ -279,7 +260,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
 
     state = env.reset()
     done  = False
-    historical_reward = {"episode": [], "reward": []}
+    historical_reward = MetricsLog(f"data_plots/{file_name}_EVALUATION", ["episode", "reward"])
 
     for total_step_counter in range(evaluation_steps_max):
         env.render()
@@ -291,8 +272,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
 
         if done:
             logging.info(f" Evaluation Episode {episode_num} was completed with {episode_timesteps} steps taken and a Reward= {episode_reward:.3f}\n")
-            historical_reward["episode"].append(episode_num)
-            historical_reward["reward"].append(episode_reward)
+            historical_reward.append(episode=episode_num, reward=episode_reward)
 
             # Reset environment
             state = env.reset()
@@ -301,8 +281,7 @@ def agent_models_evaluation(args, agent, env, device, file_name):
             episode_timesteps = 0
             episode_num += 1
 
-    file_name = file_name+"_EVALUATION"
-    plot_reward_curve(historical_reward, file_name)
+    historical_reward.flush()
 
 
 
@@ -324,8 +303,17 @@ def parse_args():
     parser.add_argument("--M", type=int, default=1)
     parser.add_argument("--G", type=int, default=10)
     parser.add_argument("--F", type=int, default=10)
+    parser.add_argument("--n_step", type=int, default=1)  # rewards summed in the critic target of the env batches, the dreams stay 1-step
+    parser.add_argument("--H", type=int, default=1)  # horizon of the imagined rollouts, each start state adds H dream transitions
+
+    parser.add_argument("--world_model_loss_weight",  type=float, default=1.0)  # weights of the two losses in the joint model update
+    parser.add_argument("--reward_model_loss_weight", type=float, default=1.0)
+
+    parser.add_argument("--plot_freq", type=int, default=10)  # episodes between two flushes of the metrics file
 
-    parser.add_argument("--plot_freq", type=int, default=10)
+    parser.add_argument("--checkpoint_dir",      type=str, default=None)    # folder for the periodic checkpoints, None disables them
+    parser.add_argument("--checkpoint_interval", type=int, default=10_000)  # steps between two checkpoints, taken at the end of an episode
+    parser.add_argument("--resume", action='store_true')                    # continue the run saved in checkpoint_dir
 
     return parser.parse_args()
 
@@ -343,7 +331,7 @@ def main():
         act_dim = env.act_dim
         obs_dim = args.latent_dim  # latent dimension
         max_action_value = env.max_action
-        agent   = MBAETD3.MB_AE_TD3(device, obs_dim, act_dim, max_action_value)
+        agent   = MBAETD3.MB_AE_TD3(device, obs_dim, act_dim, max_action_value, args.world_model_loss_weight, args.reward_model_loss_weight)
 
     elif args.agent == "AE_TD3":
         logging.info("Training with Autoencoder TD3")
@@ -367,7 +355,7 @@ def main():
         exit()
 
     set_seeds(args.seed, env)
-    replay_buffers = MemoryBuffers.MemoryBuffer()
+    replay_buffers = MemoryBuffers.MemoryBuffer(n_step=args.n_step, gamma=agent.gamma)
 
     train(args, agent, replay_buffers, env, act_dim, max_action_value, file_name, args.reward_type)
     encoder_models_evaluation(args, agent, env, device, file_name)
@@ -7,6 +7,8 @@ import torch.optim as optim
 import torch.nn.functional as F
 
 from openAI_architectures_utilities  import Actor_Normal, Critic_Normal, Actor, Critic, Decoder
+from openAI_memory_utilities import to_device_tensor
+from openAI_telemetry_utilities import LossTelemetry
 
 
 class TD3:
@@ -39,10 +41,7 @@ class TD3:
         self.actor.train(True)
         self.critic.train(True)
 
-        self.critic_one_loss_data   = []
-        self.critic_two_loss_data   = []
-        self.critic_loss_total_data = []
-        self.actor_loss_data        = []
+        self.loss_telemetry = LossTelemetry(["critic_one", "critic_two", "critic_total", "actor"], self.device)
 
 
     def get_action_from_policy(self, state):
@@ -83,9 +82,9 @@ class TD3:
         torch.nn.utils.clip_grad_norm_(self.critic.parameters(), 1)
         self.critic_optimizer.step()
 
-        self.critic_one_loss_data.append(critic_loss_1.item())
-        self.critic_two_loss_data.append(critic_loss_2.item())
-        self.critic_loss_total_data.append(critic_loss_total.item())
+        self.loss_telemetry.add("critic_one", critic_loss_1)
+        self.loss_telemetry.add("critic_two", critic_loss_2)
+        self.loss_telemetry.add("critic_total", critic_loss_total)
 
         # Delayed policy updates
         if self.update_counter % self.policy_freq_update == 0:
@@ -128,7 +127,7 @@ class TD3:
             torch.nn.utils.clip_grad_norm_(self.actor.parameters(), 1)
             self.actor_optimizer.step()
 
-            self.actor_loss_data.append(actor_loss.item())
+            self.loss_telemetry.add("actor", actor_loss)
             # ------------------------------------- Update target networks --------------- #
             for target_param, param in zip(self.actor_target.parameters(), self.actor.parameters()):
                 target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
@@ -136,13 +135,16 @@ class TD3:
             for target_param, param in zip(self.critic_target.parameters(), self.critic.parameters()):
                 target_param.data.copy_(param.data * self.tau + target_param.data * (1.0 - self.tau))
 
+        self.loss_telemetry.step()
+
     def save_models(self):
         torch.save(self.actor.state_dict(), f'trained_models/Normal-TD3_actor_{self.env_name}.pht')
         print("models have been saved...")
 
     def plot_loss(self):
-        data_dict_critic = {"Critic One": self.critic_one_loss_data, "Critic Two": self.critic_two_loss_data}
-        data_dict_actor  = {"Actor Loss": self.actor_loss_data}
+        # one row per LossTelemetry interval, the mean of the losses over those updates
+        data_dict_critic = {"Critic One": self.loss_telemetry.history("critic_one"), "Critic Two": self.loss_telemetry.history("critic_two")}
+        data_dict_actor  = {"Actor Loss": self.loss_telemetry.history("actor")}
 
         df_critic = pd.DataFrame(data=data_dict_critic)
         df_actor  = pd.DataFrame(data=data_dict_actor)
@@ -209,8 +211,8 @@ class TD3AE:
 
     def get_action_from_policy(self, state_image_pixel):
         with torch.no_grad():
-            state_image_tensor = torch.FloatTensor(state_image_pixel)
-            state_image_tensor = state_image_tensor.unsqueeze(0).to(self.device)
+            state_image_tensor = to_device_tensor(state_image_pixel, self.device)  # uint8 stack, rescaled on the device
+            state_image_tensor = state_image_tensor.unsqueeze(0)
             action = self.actor(state_image_tensor)
             action = action.cpu().data.numpy().flatten()
         return action
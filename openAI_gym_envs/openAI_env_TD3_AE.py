@@ -25,7 +25,7 @@ from tqdm import tqdm
 import matplotlib.pyplot as plt
 from argparse import ArgumentParser
 
-from openAI_memory_utilities import Memory, FrameStack
+from openAI_memory_utilities import Memory, FrameStack, to_device_tensor
 from openAI_architectures_utilities import Actor, Critic, Decoder
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
@@ -97,8 +97,8 @@ class RLAgent:
 
     def select_action_from_policy(self, state_image_pixel):
         with torch.no_grad():
-            state_image_tensor = torch.FloatTensor(state_image_pixel)
-            state_image_tensor = state_image_tensor.unsqueeze(0).to(self.device)
+            state_image_tensor = to_device_tensor(state_image_pixel, self.device)  # uint8 stack, rescaled on the device
+            state_image_tensor = state_image_tensor.unsqueeze(0)
             action = self.actor(state_image_tensor)
             action = action.cpu().data.numpy()#.flatten()
         return action[0]
@@ -295,8 +295,8 @@ def run_training_rl_method(env, agent, max_action_value, env_name, frames_stack,
 def autoencoder_evaluation(agent, frames_stack, env_name, device):
     agent.load_models()
     state_image = frames_stack.reset()
-    state_image_tensor = torch.FloatTensor(state_image)
-    state_image_tensor = state_image_tensor.unsqueeze(0).to(device)
+    state_image_tensor = to_device_tensor(state_image, device)
+    state_image_tensor = state_image_tensor.unsqueeze(0)
 
     with torch.no_grad():
         z_vector = agent.critic.encoder_net(state_image_tensor)
@@ -1,15 +1,91 @@
 import cv2
 import torch
-import random
 import numpy as np
-from collections import deque
 
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+def to_device_tensor(array, device):
+    tensor = torch.from_numpy(np.asarray(array)).to(device, non_blocking=True)
+    if tensor.dtype == torch.uint8:
+        return tensor * (1.0 / 255)
+    return tensor.float()
+
+
+class RingBuffer:
+    """
+    Copy of model_base_autoencoder_td3/MemoryBuffers.RingBuffer without its checkpoint snapshots, this folder is run
+    on its own. Typed numpy arrays, one per field of the experience tuple, created on the first append (uint8 images
+    keep their type, the rest is float32), grown up to max_capacity and sampled with vectorized indexes.
+    The copies in 4DoF_Gripper, gripper_AE_environment, gripper_aruco_environment and openAI_gym_envs change together.
+    """
+    def __init__(self, max_capacity):
+        self.max_capacity = max_capacity
+        self.allocated    = 0
+        self.fields       = None
+
+        self.idx  = 0
+        self.full = False
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def allocate(self, experience):
+        self.fields = []
+        for value in experience:
+            value = np.asarray(value)
+            dtype = np.uint8 if value.dtype == np.uint8 else np.float32
+            self.fields.append(np.empty((0, *value.shape), dtype=dtype))
+
+    def reserve(self, size):
+        if size <= self.allocated:
+            return
+        new_size = min(self.max_capacity, max(size, 2 * self.allocated, 1024))
+        for i, field in enumerate(self.fields):
+            grown = np.empty((new_size, *field.shape[1:]), dtype=field.dtype)
+            grown[:self.idx] = field[:self.idx]
+            self.fields[i] = grown
+        self.allocated = new_size
+
+    def append(self, experience):
+        if self.fields is None:
+            self.allocate(experience)
+        if not self.full:
+            self.reserve(self.idx + 1)
+
+        for field, value in zip(self.fields, experience):
+            field[self.idx] = value
+
+        self.idx  = (self.idx + 1) % self.max_capacity
+        self.full = self.full or self.idx == 0
+
+    def extend(self, experience_batch):
+        # one array per field with the batch in the first dimension, written with a single slice per field
+        experience_batch = [np.asarray(values) for values in experience_batch]
+        if len(experience_batch) == 0:
+            return
+        if self.fields is None:
+            self.allocate([values[0] for values in experience_batch])
+
+        batch_size = len(experience_batch[0])
+        if not self.full:
+            self.reserve(min(self.idx + batch_size, self.max_capacity))
+
+        idxs = (self.idx + np.arange(batch_size)) % self.max_capacity
+        for field, values in zip(self.fields, experience_batch):
+            field[idxs] = values
+
+        self.full = self.full or self.idx + batch_size >= self.max_capacity
+        self.idx  = (self.idx + batch_size) % self.max_capacity
+
+    def sample(self, sample_size):
+        idxs = np.random.randint(0, len(self), size=sample_size)
+        return tuple(field[idxs] for field in self.fields)
+
+
 class Memory:
     def __init__(self, replay_max_size, device):
         self.device          = device
         self.replay_max_size = replay_max_size
-        self.memory_buffer   = deque(maxlen=replay_max_size)
+        self.memory_buffer   = RingBuffer(replay_max_size)
 
 
     def save_experience_to_buffer(self, state, action, reward, next_state, done):
@@ -17,64 +93,82 @@ class Memory:
         self.memory_buffer.append(experience)
 
     def sample_experiences_from_buffer(self, sample_size):
-        state_batch       = []
-        action_batch      = []
-        reward_batch      = []
-        next_state_batch  = []
-        done_batch        = []
-
-        batch = random.sample(self.memory_buffer, sample_size)
-        for experience in batch:
-            state, action, reward, next_state, done = experience
-            state_batch.append(state)
-            action_batch.append(action)
-            reward_batch.append(reward)
-            next_state_batch.append(next_state)
-            done_batch.append(done)
-
-        state_batch  = np.array(state_batch)
-        action_batch = np.array(action_batch)
-        reward_batch = np.array(reward_batch).reshape(-1, 1)
-        done_batch = np.array(done_batch).reshape(-1, 1)
-        next_state_batch = np.array(next_state_batch)
-
-        state_batch_tensor  = torch.FloatTensor(state_batch).to(self.device)
-        action_batch_tensor = torch.FloatTensor(action_batch).to(self.device)
-        reward_batch_tensor = torch.FloatTensor(reward_batch).to(self.device)
-        done_batch_tensor   = torch.FloatTensor(done_batch).to(self.device)
-        next_batch_state_tensor = torch.FloatTensor(next_state_batch).to(self.device)
+        state_batch, action_batch, reward_batch, next_state_batch, done_batch = self.memory_buffer.sample(sample_size)
+
+        reward_batch = reward_batch.reshape(-1, 1)
+        done_batch = done_batch.reshape(-1, 1)
+
+        state_batch_tensor  = to_device_tensor(state_batch, self.device)
+        action_batch_tensor = to_device_tensor(action_batch, self.device)
+        reward_batch_tensor = to_device_tensor(reward_batch, self.device)
+        done_batch_tensor   = to_device_tensor(done_batch, self.device)
+        next_batch_state_tensor = to_device_tensor(next_state_batch, self.device)
 
         return state_batch_tensor, action_batch_tensor, reward_batch_tensor, next_batch_state_tensor, done_batch_tensor
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+class FrameRing:
+    """
+    Preallocated store for the last k frames. Each frame is written once, in place, and the stack is returned as a
+    view of k consecutive slots instead of a new concatenated array. When the writes reach the end of the store,
+    the newest k-1 frames are moved back to its start. The store has 4k slots, so a returned stack keeps its values
+    for at least one more step (state and next_state can be used together), copy it to keep it longer.
+    """
+    def __init__(self, k, concatenate=True):
+        self.k           = k
+        self.concatenate = concatenate  # (k*C, H, W) stacks if True, (k, H, W) if False
+        self.frames      = None         # allocated with the first frame, (4k, *frame_shape)
+        self.position    = 0            # slot of the newest frame
+        self.stack_shape = None
+
+    def reset(self, frame):
+        if self.frames is None:
+            frame = np.asarray(frame)
+            self.frames      = np.empty((4 * self.k, *frame.shape), dtype=frame.dtype)
+            self.position    = self.k - 1
+            self.stack_shape = (self.k * frame.shape[0], *frame.shape[1:]) if self.concatenate else (self.k, *frame.shape)
+        for _ in range(self.k):
+            self.append(frame)
+        return self.stack()
+
+    def append(self, frame):
+        if self.position + 1 == len(self.frames):
+            self.frames[:self.k - 1] = self.frames[len(self.frames) - self.k + 1:]
+            self.position = self.k - 2
+        self.position += 1
+        np.copyto(self.frames[self.position], frame)
+        return self.stack()
+
+    def stack(self):
+        return self.frames[self.position - self.k + 1:self.position + 1].reshape(self.stack_shape)
+
+
 class FrameStack:
     def __init__(self, k, env):
         self.env = env
         self.k   = k  # number of frames to be stacked
-        self.frames_stacked = deque([], maxlen=k)
+        self.frames_stacked = FrameRing(k, concatenate=False)
+        self.gray_image     = None  # preprocessing output buffers
+        self.resized_image  = None
 
     def reset(self):
         self.env.reset()
         obs = self.env.render()
         obs = self.preprocessing_image(obs)
-        for _ in range(self.k):
-            self.frames_stacked.append(obs)
-        # stacked_vector = np.concatenate(list(self.frames_stacked), axis=0)
-        stacked_vector = np.array(list(self.frames_stacked))
+        stacked_vector = self.frames_stacked.reset(obs)  # --> shape = (k, 84, 84)
         return stacked_vector
 
     def step(self, action):
         _, reward, done, truncated, info = self.env.step(action)
         obs = self.env.render()
         obs = self.preprocessing_image(obs)
-        self.frames_stacked.append(obs)
-        stacked_vector = np.array(list(self.frames_stacked))
-        # stacked_vector = np.concatenate(list(self.frames_stacked), axis=0)
+        stacked_vector = self.frames_stacked.append(obs)
         return stacked_vector, reward, done, truncated, info
 
     def preprocessing_image(self, image_array):
-        resized    = cv2.resize(image_array, (84, 84), interpolation=cv2.INTER_AREA)
-        gray_image = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-        norm_image = cv2.normalize(gray_image, None, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_32F)
-        return norm_image
+        # grayscale first so a single channel is resized, then min-max stretched into uint8 (4x smaller than float32
+        # in the replay, the learner rescales it to [0, 1] on its device). The output buffers are reused every step
+        self.gray_image    = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY, dst=self.gray_image)
+        self.resized_image = cv2.resize(self.gray_image, (84, 84), dst=self.resized_image, interpolation=cv2.INTER_AREA)
+        return cv2.normalize(self.resized_image, self.resized_image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
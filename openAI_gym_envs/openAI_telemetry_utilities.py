@@ -0,0 +1,58 @@
+
+import torch
+import numpy as np
+
+
+class LossTelemetry:
+    """
+    Running means of the training losses that do not stop the learner, e.g. LossTelemetry(["critic", "actor"], device).
+    add() accumulates the detached loss into a sum tensor that stays on the device, so logging a loss costs one
+    queued kernel instead of the device sync and host allocation of .item(). Every interval updates (counted by
+    step()) the sums of all the losses are brought to the host in one transfer, divided by the number of values
+    added to each and stored as one row of a ring of history_size rows; the oldest rows are overwritten.
+    gripper_AE_environment/gripper_telemetry_utilities.py keeps a copy of this class.
+    """
+    def __init__(self, names, device, interval=100, history_size=10_000):
+        self.names    = list(names)
+        self.columns  = {name: column for column, name in enumerate(self.names)}
+        self.interval = interval
+
+        self.sums   = torch.zeros(len(self.names), device=device)
+        self.counts = np.zeros(len(self.names), dtype=np.int64)  # host side, the count of a loss is known without the device
+        self.steps  = 0  # updates since the last reduce
+
+        self.ring = np.full((history_size, len(self.names)), np.nan, dtype=np.float32)
+        self.idx  = 0
+        self.full = False
+
+    def add(self, name, loss):
+        column = self.columns[name]
+        self.sums[column] += loss.detach()
+        self.counts[column] += 1
+
+    def step(self):
+        self.steps += 1
+        if self.steps == self.interval:
+            self.reduce()
+
+    def reduce(self):
+        # also called before reading the history, so the means of an incomplete interval are not lost
+        if self.steps == 0 and not self.counts.any():
+            return
+        sums = self.sums.cpu().numpy()  # --> the only device sync
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.ring[self.idx] = np.where(self.counts > 0, sums / self.counts, np.nan)  # nan for a loss not computed in the interval
+
+        self.idx  = (self.idx + 1) % len(self.ring)
+        self.full = self.full or self.idx == 0
+        self.sums.zero_()
+        self.counts[:] = 0
+        self.steps     = 0
+
+    def history(self, name=None):
+        # rows in the order they were reduced, all the losses or the column of name
+        self.reduce()
+        rows = np.concatenate((self.ring[self.idx:], self.ring[:self.idx])) if self.full else self.ring[:self.idx]
+        if name is None:
+            return rows
+        return rows[:, self.columns[name]]
@@ -0,0 +1,199 @@
+
+from scipy.spatial import distance
+import numpy as np
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+class CustomMemoryBuffer:
+    """
+    Replay buffer for stacked pixel observations that keeps every rendered frame only once.
+    Slot t holds the newest frame of the observation at time t; when valid[t] is True it also holds the
+    transition (action, reward, done) that goes from the observation at t to the observation at t+1.
+    The (k*3, 84, 84) stacks are rebuilt at sample time from the k frames that end at t (or t+1),
+    repeating the first frame of the episode as FrameStack.reset() does.
+
+    With storage_dir the arrays are np.memmap files in that folder instead of RAM, so the OS page cache
+    holds the hot part of the buffer and a buffer found there is reopened when the run restarts.
+
+    With n_step > 1 the batches hold n-step transitions, computed at sample time from the consecutive slots of
+    the episode: the discounted sum of up to n_step rewards, the observation to bootstrap from, its done and a
+    sixth array with the discount gamma ** (steps taken) of each sample for the critic target.
+    """
+    def __init__(self, action_size, max_capacity=int(1e6), k=3, storage_dir=None, n_step=1, gamma=0.99):
+        self.max_capacity = max_capacity
+        self.k            = k  # number of frames stacked in each observation
+        self.storage_dir  = storage_dir
+        self.n_step       = n_step
+        self.gamma        = gamma
+
+        frame_shape  = (3, 84, 84)
+        action_shape = action_size
+        latent_size  = 50
+
+        self.frame_channels = frame_shape[0]
+
+        if self.storage_dir is not None:
+            os.makedirs(self.storage_dir, exist_ok=True)
+
+        self.frames  = self.allocate("frames",  (max_capacity, *frame_shape), np.uint8)
+        self.actions = self.allocate("actions", (max_capacity, action_shape), np.float32)
+        self.rewards = self.allocate("rewards", (max_capacity, 1), np.float32)
+        self.dones   = self.allocate("dones",   (max_capacity, 1), np.float32)
+        self.steps   = self.allocate("steps",   (max_capacity,), np.int64)  # position of the frame inside its episode
+        self.valid   = self.allocate("valid",   (max_capacity,), bool)      # True if the slot holds a transition ready to sample
+        self.cursor  = self.allocate("cursor",  (2,), np.int64)             # idx and full, kept next to the data
+        #self.z_vectors   = np.empty((max_capacity, latent_size), dtype=np.float32)
+
+        self.idx  = int(self.cursor[0])
+        self.full = bool(self.cursor[1])
+        self.new_episode = True  # a reopened buffer also continues with a new episode
+
+        if self.idx > 0 or self.full:
+            logging.info(f"Replay buffer reopened from {self.storage_dir} with {len(self)} frames")
+
+    def allocate(self, name, shape, dtype):
+        if self.storage_dir is None:
+            return np.zeros(shape, dtype=dtype)
+
+        path = os.path.join(self.storage_dir, f"{name}.npy")
+        if not os.path.exists(path):
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+        array = np.lib.format.open_memmap(path, mode="r+")
+        if array.shape != shape or array.dtype != np.dtype(dtype):
+            raise ValueError(f"{path} holds {array.dtype} {array.shape}, expected {np.dtype(dtype)} {shape}")
+        return array
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def flush(self):
+        if self.storage_dir is None:
+            return
+        for array in (self.frames, self.actions, self.rewards, self.dones, self.steps, self.valid, self.cursor):
+            array.flush()
+
+    def add(self, **experience):
+
+        state      = experience["state"]
+        action     = experience["action"]
+        reward     = experience["reward"]
+        next_state = experience["next_state"]
+        done       = experience["done"]
+        #latent_z   = experience["latent_z"]
+
+        if self.new_episode:
+            # the first state of an episode is the reset frame repeated k times, so its newest frame is enough
+            self.add_frame(state[-self.frame_channels:], step=0)
+
+        slot = (self.idx - 1) % self.max_capacity  # slot holding the newest frame of state
+        np.copyto(self.actions[slot], action)
+        np.copyto(self.rewards[slot], reward)
+        np.copyto(self.dones[slot], done)
+        self.valid[slot] = True
+        #np.copyto(self.z_vectors[self.idx], latent_z)
+
+        self.add_frame(next_state[-self.frame_channels:], step=self.steps[slot] + 1)
+
+        # after the last transition of an episode, the next state given is a reset one and starts a new slot
+        self.new_episode = bool(done)
+
+    def add_frame(self, frame, step):
+        np.copyto(self.frames[self.idx], frame)
+        self.steps[self.idx] = step
+        self.valid[self.idx] = False
+
+        # the k-1 oldest slots ahead of the cursor may stack frames that have just been overwritten
+        self.valid[(self.idx + np.arange(1, self.k)) % self.max_capacity] = False
+
+        self.idx  = (self.idx + 1) % self.max_capacity
+        self.full = self.full or self.idx == 0
+        self.cursor[0] = self.idx
+        self.cursor[1] = self.full
+
+    def stack_frames(self, idxs):
+        # offsets back from each slot, clamped at the start of the episode
+        offsets    = np.minimum(np.arange(self.k - 1, -1, -1), self.steps[idxs][:, None])
+        frame_idxs = (idxs[:, None] - offsets) % self.max_capacity
+        stacks     = self.frames[frame_idxs]  # --> shape = (batch, k, 3, 84, 84)
+        return stacks.reshape(len(idxs), -1, *self.frames.shape[2:])  # --> shape = (batch, k*3, 84, 84)
+
+    def uniform_idxs(self, batch_size):
+        size = len(self)
+        if size == 0:
+            raise ValueError("The replay buffer has no complete transition to sample")
+        idxs = np.random.randint(0, size, size=batch_size)
+
+        # the newest frame of each episode (and the slots next to the cursor) are not transitions, draw again
+        invalid = ~self.valid[idxs]
+        for _ in range(8):
+            if not invalid.any():
+                return idxs
+            idxs[invalid] = np.random.randint(0, size, size=invalid.sum())
+            invalid = ~self.valid[idxs]
+
+        # still invalid after the redraws (a buffer of few transitions), take them among the valid slots
+        candidates = np.flatnonzero(self.valid[:size])
+        if len(candidates) == 0:
+            raise ValueError("The replay buffer has no complete transition to sample")
+        idxs[invalid] = candidates[np.random.randint(0, len(candidates), size=invalid.sum())]
+        return idxs
+
+    def sample(self, batch_size):
+        idxs = self.uniform_idxs(batch_size)
+
+        states  = self.stack_frames(idxs)
+        actions = self.actions[idxs]
+        if self.n_step == 1:
+            rewards     = self.rewards[idxs]
+            next_states = self.stack_frames((idxs + 1) % self.max_capacity)
+            dones       = self.dones[idxs]
+            return states, actions, rewards, next_states, dones
+
+        rewards, bootstrap_idxs, dones, discounts = self.n_step_returns(idxs)
+        next_states = self.stack_frames(bootstrap_idxs)
+        return states, actions, rewards, next_states, dones, discounts
+
+    def n_step_returns(self, idxs):
+        # the transitions that follow each slot in its episode, up to n_step, stopping after a done or before
+        # a slot that is not a transition (the newest frame of the running episode)
+        offsets = np.arange(self.n_step)
+        slots   = (idxs[:, None] + offsets) % self.max_capacity  # --> shape = (batch, n_step)
+
+        ended = self.dones[slots, 0] > 0
+        taken = self.valid[slots] & (self.steps[slots] == self.steps[idxs][:, None] + offsets)
+        taken[:, 1:] &= ~ended[:, :-1]
+        taken = np.logical_and.accumulate(taken, axis=1)
+
+        num_steps = taken.sum(axis=1)
+        last      = (idxs + num_steps - 1) % self.max_capacity
+
+        rewards   = (self.rewards[slots, 0] * taken * self.gamma ** offsets).sum(axis=1, keepdims=True).astype(np.float32)
+        discounts = (self.gamma ** num_steps).astype(np.float32)[:, None]
+        return rewards, (last + 1) % self.max_capacity, self.dones[last], discounts
+
+
+
+    # def search_state(self, z_arrive):
+    #     # search if the new z_arrive vector  already exist in memory (identically)
+    #     # logging.info("----------")
+    #     # new_idendical = z_arrive in self.z_vectors
+    #     # logging.info(f" {new_idendical}, for identical searching")
+    #
+    #     # search if the new z_arrive vector or a "very similar" one already exist in memory
+    #     threshold_novelty = 0.5
+    #     range_to_search   = (range(0, self.max_capacity) if self.full else range(0, self.idx))
+    #     new = True
+    #     for previous_z_idx in range_to_search:
+    #         dist  = np.linalg.norm(z_arrive - self.z_vectors[previous_z_idx])
+    #         if dist <= threshold_novelty:
+    #             logging.info(f" State Representation found in memory, it is not new")
+    #             new = False
+    #             break
+    #     if new:
+    #         logging.info(f" State Representation No found in memory, it is new")
+    #     logging.info("********************")
+    #
+    #     return new
@@ -10,6 +10,14 @@ from networks import Actor
 from networks import Critic
 
 
+def to_device_tensor(array, device):
+    tensor = array if torch.is_tensor(array) else torch.from_numpy(np.asarray(array))
+    tensor = tensor.to(device, non_blocking=True)
+    if tensor.dtype == torch.uint8:
+        return tensor * (1.0 / 255)
+    return tensor.float()
+
+
 class TD3_Pixel:
     def __init__(self, latent_size=50, action_num=1, device="cuda", k=3):
 
@@ -45,7 +53,7 @@ class TD3_Pixel:
     def select_action_from_policy(self, state, evaluation=False, noise_scale=0.1):
         self.actor.eval()
         with torch.no_grad():
-            state_tensor = torch.FloatTensor(state).to(self.device)
+            state_tensor = to_device_tensor(state, self.device)
             state_tensor = state_tensor.unsqueeze(0)
             action = self.actor(state_tensor)
             action = action.cpu().data.numpy().flatten()
@@ -63,20 +71,23 @@ class TD3_Pixel:
         self.critic.train()
 
         self.learn_counter += 1
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
         batch_size = len(states)
 
         # Convert into tensor
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards     = torch.FloatTensor(np.asarray(rewards)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
-        dones       = torch.LongTensor(np.asarray(dones)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        rewards     = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
+        dones       = to_device_tensor(dones, self.device)
 
         # Reshape to batch_size
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
         dones   = dones.unsqueeze(0).reshape(batch_size, 1)
 
+        # an n-step batch carries the discount of each sample (gamma ** steps taken), a 1-step one uses gamma
+        discounts = self.gamma if len(experiences) == 5 else to_device_tensor(experiences[5], self.device).reshape(batch_size, 1)
+
         with torch.no_grad():
             next_actions = self.actor_target(next_states)
             target_noise = 0.2 * torch.randn_like(next_actions)
@@ -87,7 +98,7 @@ class TD3_Pixel:
             target_q_values_one, target_q_values_two = self.critic_target(next_states, next_actions)
             target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
 
-            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+            q_target = rewards + discounts * (1 - dones) * target_q_values
 
         q_values_one, q_values_two = self.critic(states, actions)
 
@@ -1,7 +1,6 @@
 
 
 import os
-import cv2
 import time
 import torch
 import random
@@ -17,7 +16,9 @@ logging.basicConfig(level=logging.INFO)
 from TD3_Pixels import TD3_Pixel
 from dm_control import suite
 from FrameStack import FrameStack
-from cares_reinforcement_learning.memory import MemoryBuffer
+from Custom_Memory import CustomMemoryBuffer
+from Video_Recorder import VideoRecorder
+from Evaluation_Worker import EvaluationWorker
 
 
 
@@ -40,7 +41,7 @@ def plot_reward_curve(data_reward, filename):
     plt.close()
 
 
-def train(env, agent, file_name, number_stack_frames):
+def train(env, agent, file_name, number_stack_frames, domain_name, task_name, seed, buffer_dir=None):
 
     # Training-parameters
     # ------------------------------------#
@@ -50,6 +51,8 @@ def train(env, agent, file_name, number_stack_frames):
     batch_size = 128
     G = 1
     k = number_stack_frames
+    n_step = 1  # rewards summed in the critic target, e.g. 3 for sparse rewards as ball_in_cup catch
+    evaluation_in_worker = True  # evaluate in a separate process while training goes on, False pauses the training for it
 
     # Action size and format
     # ------------------------------------#
@@ -60,8 +63,12 @@ def train(env, agent, file_name, number_stack_frames):
 
     # Needed classes
     # ------------------------------------#
-    memory       = MemoryBuffer()
+    memory       = CustomMemoryBuffer(action_size, k=k, storage_dir=buffer_dir, n_step=n_step, gamma=agent.gamma)
     frames_stack = FrameStack(env, k)
+    evaluator    = None
+    if evaluation_in_worker:
+        evaluator = EvaluationWorker(domain_name, task_name, seed, k, agent.latent_size, log_file=f"plot_results/{file_name}_evaluation",
+                                     video_name=f"videos_evaluation/{file_name}_{{step}}.mp4", num_episodes=10)
 
     # Training Loop
     # ------------------------------------#
@@ -96,15 +103,8 @@ def train(env, agent, file_name, number_stack_frames):
 
         if total_step_counter > max_steps_exploration:
             for _ in range(G):
-                experience = memory.sample(batch_size)
-
-                agent.train_policy((
-                    experience['state'],
-                    experience['action'],
-                    experience['reward'],
-                    experience['next_state'],
-                    experience['done'],
-                ))
+                experiences = memory.sample(batch_size)
+                agent.train_policy(experiences)
 
         if done:
             episode_duration = time.time() - start_time
@@ -122,11 +122,18 @@ def train(env, agent, file_name, number_stack_frames):
             if episode_num % 10 == 0:
                 print("*************--Evaluation--*************")
                 plot_reward_curve(historical_reward, filename=file_name)
-                evaluation_loop(env, agent, frames_stack, total_step_counter, file_name, historical_reward_evaluation)
+                if evaluator is not None:
+                    # a snapshot of the actor is evaluated in the worker process while training goes on
+                    evaluator.submit(total_step_counter, agent.actor)
+                else:
+                    evaluation_loop(env, agent, frames_stack, total_step_counter, file_name, historical_reward_evaluation)
                 print("--------------------------------------------")
 
     agent.save_models(filename=file_name)
     plot_reward_curve(historical_reward, filename=file_name)
+    memory.flush()
+    if evaluator is not None:
+        evaluator.close()  # waits for the evaluations still queued
     logging.info("All GOOD AND DONE :)")
 
 
@@ -137,14 +144,12 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name, historic
     episode_num          = 0
 
     state = frames_stack.reset()
-    frame = grab_frame(env)
 
     historical_episode_reward_evaluation = []
 
     fps = 30
     video_name = f'videos_evaluation/{file_name}_{total_counter}.mp4'
-    height, width, channels = frame.shape
-    video = cv2.VideoWriter(video_name, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    video = VideoRecorder(video_name, fps, max_episodes=1, frame_skip=1)  # a video of the first episode only, encoded in its own thread
 
     for total_step_counter in range(int(max_steps_evaluation)):
         episode_timesteps += 1
@@ -152,15 +157,14 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name, historic
         state, reward_extrinsic, done = frames_stack.step(action)
         episode_reward += reward_extrinsic
 
-        # Render a video just for one episode
-        if episode_num == 0:
-            video.write(grab_frame(env))
+        video.capture(env)
 
         if done:
             logging.info(f" EVALUATION | Eval Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f}")
             historical_episode_reward_evaluation.append(episode_reward)
 
             state = frames_stack.reset()
+            video.end_episode()
             episode_reward = 0
             episode_timesteps = 0
             episode_num += 1
@@ -169,18 +173,14 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name, historic
     historical_reward_evaluation["avg_episode_reward"].append(mean_reward_evaluation)
     historical_reward_evaluation["step"].append(total_counter)
     save_evaluation_values(historical_reward_evaluation, file_name)
-    video.release()
-
-def grab_frame(env):
-    frame = env.physics.render(camera_id=0, height=480, width=600)
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Convert to BGR for use with OpenCV
-    return frame
+    video.close()
 
 def define_parse_args():
     parser = ArgumentParser()
     parser.add_argument('--seed', type=int, default=1)
     parser.add_argument('--env',  type=str, default="ball_in_cup")
     parser.add_argument('--task', type=str, default="catch")
+    parser.add_argument('--buffer_dir', type=str, default=None)  # keep the replay buffer on disk in this folder
     args   = parser.parse_args()
     return args
 
@@ -240,7 +240,7 @@ def main():
     logging.info(f" File name for this training loop: {file_name}")
 
     logging.info("Initializing Training Loop....")
-    train(env, agent, file_name, number_stack_frames)
+    train(env, agent, file_name, number_stack_frames, domain_name, task_name, seed, args.buffer_dir)
 
 
 if __name__ == '__main__':
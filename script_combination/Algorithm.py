@@ -8,14 +8,24 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
 
 
 from networks import Actor
 from networks import Critic
 from networks import Encoder
 from networks import Decoder
-from networks import EPDM  # Deterministic Ensemble
+from networks import EPDMEnsemble  # Deterministic Ensemble, all members in one fused module
+from SSIM import structural_similarity
+
+
+def to_device_tensor(array, device):
+    # the batch crosses to the device as it is stored (uint8 images are 4x smaller than float32), without a host copy.
+    # uint8 images are cast and rescaled to [0, 1] on the device in one op, everything else is only cast to float32
+    tensor = array if torch.is_tensor(array) else torch.from_numpy(np.asarray(array))
+    tensor = tensor.to(device, non_blocking=True)
+    if tensor.dtype == torch.uint8:
+        return tensor * (1.0 / 255)
+    return tensor.float()
 
 
 class Algorithm:
@@ -46,10 +56,7 @@ class Algorithm:
         self.critic_target.load_state_dict(self.critic.state_dict())
         self.actor_target.load_state_dict(self.actor.state_dict())
 
-        self.epm = nn.ModuleList()
-        networks = [EPDM(self.latent_size, self.action_num) for _ in range(self.ensemble_size)]
-        self.epm.extend(networks)
-        self.epm.to(self.device)
+        self.epm = EPDMEnsemble(self.latent_size, self.action_num, self.ensemble_size).to(self.device)
 
         lr_actor   = 1e-4
         lr_critic  = 1e-3
@@ -63,24 +70,28 @@ class Algorithm:
 
         lr_epm      = 1e-4
         w_decay_epm = 1e-3
-        self.epm_optimizers = [torch.optim.Adam(self.epm[i].parameters(), lr=lr_epm, weight_decay=w_decay_epm) for i in range(self.ensemble_size)]
+        self.epm_optimizer = torch.optim.Adam(self.epm.parameters(), lr=lr_epm, weight_decay=w_decay_epm)
 
     def select_action_from_policy(self, state, evaluation=False, noise_scale=0.1):
+        actions = self.select_actions_from_policy(np.expand_dims(state, axis=0), evaluation, noise_scale)
+        return actions[0]
+
+    def select_actions_from_policy(self, states, evaluation=False, noise_scale=0.1):
+        # one forward pass for a batch of observations, e.g. (num_envs, 9, 84, 84) from VectorFrameStack
         self.actor.eval()
         with torch.no_grad():
-            state_tensor = torch.FloatTensor(state).to(self.device)
-            state_tensor = state_tensor.unsqueeze(0)
-            action = self.actor(state_tensor)
-            action = action.cpu().data.numpy().flatten()
+            states_tensor = to_device_tensor(states, self.device)
+            actions = self.actor(states_tensor)
+            actions = actions.cpu().data.numpy()
             if not evaluation:
                 # this is part the TD3 too, add noise to the action
-                noise = np.random.normal(0, scale=noise_scale, size=self.action_num)
-                action = action + noise
-                action = np.clip(action, -1, 1)
+                noise   = np.random.normal(0, scale=noise_scale, size=actions.shape)
+                actions = actions + noise
+                actions = np.clip(actions, -1, 1)
         self.actor.train()
-        return action
+        return actions
 
-    def train_policy(self, experiences):
+    def train_policy(self, experiences, intrinsic_reward=None, weights=None, priorities=None):
         self.encoder.train()
         self.decoder.train()
         self.actor.train()
@@ -88,63 +99,86 @@ class Algorithm:
 
         self.learn_counter += 1
 
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
         batch_size = len(states)
 
         # Convert into tensor
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards     = torch.FloatTensor(np.asarray(rewards)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
-        dones       = torch.LongTensor(np.asarray(dones)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        rewards     = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
+        dones       = to_device_tensor(dones, self.device)
 
         # Reshape to batch_size
         rewards = rewards.unsqueeze(0).reshape(batch_size, 1)
         dones   = dones.unsqueeze(0).reshape(batch_size, 1)
 
+        # an n-step batch carries the discount of each sample (gamma ** steps taken), a 1-step one uses gamma
+        discounts = self.gamma if len(experiences) == 5 else to_device_tensor(experiences[5], self.device).reshape(batch_size, 1)
+
+        # replay that only stores the extrinsic reward adds the intrinsic one here, e.g. IntrinsicRewardCache
+        if intrinsic_reward is not None:
+            rewards = rewards + intrinsic_reward(states, actions, next_states)
+
+
+        # Encode each batch once, critic, targets, actor and decoder heads all work from these latents
+        # (actor, critic and both targets share self.encoder)
+        z_vector = self.encoder(states)
 
         with torch.no_grad():
-            next_actions = self.actor_target(next_states)
+            z_vector_next = self.encoder(next_states)
+
+            next_actions = self.actor_target.forward_latent(z_vector_next)
             target_noise = 0.2 * torch.randn_like(next_actions)
             target_noise = torch.clamp(target_noise, -0.5, 0.5)
             next_actions = next_actions + target_noise
             next_actions = torch.clamp(next_actions, min=-1, max=1)
 
-            target_q_values_one, target_q_values_two = self.critic_target(next_states, next_actions)
+            target_q_values_one, target_q_values_two = self.critic_target.forward_latent(z_vector_next, next_actions)
             target_q_values = torch.minimum(target_q_values_one, target_q_values_two)
 
-            q_target = rewards + self.gamma * (1 - dones) * target_q_values
+            q_target = rewards + discounts * (1 - dones) * target_q_values
 
-        q_values_one, q_values_two = self.critic(states, actions)
+        q_values_one, q_values_two = self.critic.forward_latent(z_vector, actions)
 
-        critic_loss_1 = F.mse_loss(q_values_one, q_target)
-        critic_loss_2 = F.mse_loss(q_values_two, q_target)
+        if weights is None:
+            critic_loss_1 = F.mse_loss(q_values_one, q_target)
+            critic_loss_2 = F.mse_loss(q_values_two, q_target)
+        else:
+            # importance-sampling weights of a prioritized batch, e.g. from PrioritizedReplay
+            weights = to_device_tensor(weights, self.device).reshape(batch_size, 1)
+            critic_loss_1 = (weights * (q_values_one - q_target).pow(2)).mean()
+            critic_loss_2 = (weights * (q_values_two - q_target).pow(2)).mean()
         critic_loss_total = critic_loss_1 + critic_loss_2
 
+        # Autoencoder loss from the same latent
+        rec_obs = self.decoder(z_vector)
+
+        rec_loss = F.mse_loss(states, rec_obs)  # states are already [0-1], the Unit8 experiences are rescaled in to_device_tensor
+
+        latent_loss = (0.5 * z_vector.pow(2).sum(1)).mean()  # add L2 penalty on latent representation
+        ae_loss = rec_loss + 1e-6 * latent_loss
+
+        # Both losses train the encoder, each one through its own optimizer. The AE gradients are taken before
+        # the critic step changes the encoder weights in place, then each optimizer steps with its own gradients
+        ae_parameters = list(self.encoder.parameters()) + list(self.decoder.parameters())
+        ae_gradients  = torch.autograd.grad(ae_loss, ae_parameters, retain_graph=True)
+
         # Update the Critic
         self.critic_optimizer.zero_grad()
         critic_loss_total.backward()
         self.critic_optimizer.step()
 
         # Update Autoencoder
-        z_vector = self.encoder(states)
-        rec_obs  = self.decoder(z_vector)
-
-        target_images = states / 255  # this because the image is [0-255] and the prediction is [0-1], I did not normalized before to save experiences as Unit8
-        rec_loss = F.mse_loss(target_images, rec_obs)
-
-        latent_loss = (0.5 * z_vector.pow(2).sum(1)).mean()  # add L2 penalty on latent representation
-        ae_loss = rec_loss + 1e-6 * latent_loss
-
-        self.encoder_optimizer.zero_grad()
-        self.decoder_optimizer.zero_grad()
-        ae_loss.backward()
+        for parameter, gradient in zip(ae_parameters, ae_gradients):
+            parameter.grad = gradient
         self.encoder_optimizer.step()
         self.decoder_optimizer.step()
 
         # Update Actor
         if self.learn_counter % self.policy_update_freq == 0:
-            actor_q_one, actor_q_two = self.critic(states, self.actor(states, detach_encoder=True), detach_encoder=True)
+            z_vector_detached        = z_vector.detach()  # the actor loss does not train the encoder
+            actor_q_one, actor_q_two = self.critic.forward_latent(z_vector_detached, self.actor.forward_latent(z_vector_detached))
             actor_q_values           = torch.minimum(actor_q_one, actor_q_two)
             actor_loss               = -actor_q_values.mean()
 
@@ -164,17 +198,22 @@ class Algorithm:
 
             # the encoders in target networks are the same of main networks, so I will not update them
 
+        # new priorities of a prioritized batch, from the TD errors of this update (or the batch itself)
+        if priorities is not None:
+            td_errors = 0.5 * ((q_values_one - q_target).abs() + (q_values_two - q_target).abs())
+            priorities(states, actions, next_states, td_errors.detach().squeeze(1))
+
     def get_intrinsic_values(self, state, action, next_state, plot_flag=False):
         with torch.no_grad():
-            state_tensor      = torch.FloatTensor(state).to(self.device)
+            state_tensor      = to_device_tensor(state, self.device)
             state_tensor      = state_tensor.unsqueeze(0)
-            next_state_tensor = torch.FloatTensor(next_state).to(self.device)
+            next_state_tensor = to_device_tensor(next_state, self.device)
             next_state_tensor = next_state_tensor.unsqueeze(0)
-            action_tensor     = torch.FloatTensor(action).to(self.device)
+            action_tensor     = to_device_tensor(action, self.device)
             action_tensor     = action_tensor.unsqueeze(0)
 
-            surprise_rate = self.get_surprise_rate(state_tensor, action_tensor, next_state_tensor)
-            novelty_rate  = self.get_novelty_rate(state_tensor)
+            surprise_rate = self.get_surprise_rate(state_tensor, action_tensor, next_state_tensor)[0].item()
+            novelty_rate  = self.get_novelty_rate(state_tensor)[0].item()
         return surprise_rate, novelty_rate
 
 
@@ -182,58 +221,53 @@ class Algorithm:
         with torch.no_grad():
             latent_state      = self.encoder(state_tensor, detach=True)
             latent_next_state = self.encoder(next_state_tensor, detach=True)
-            predict_vector_set = []
-            for network in self.epm:
-                network.eval()
-                predicted_vector = network(latent_state, action_tensor)
-                predict_vector_set.append(predicted_vector.detach().cpu().numpy())
-            ensemble_vector = np.concatenate(predict_vector_set, axis=0)
-            z_next_latent_prediction = np.mean(ensemble_vector, axis=0) # prediction vector average among the ensembles models
-            z_next_latent_true       = latent_next_state.detach().cpu().numpy()[0]
-            mse = (np.square(z_next_latent_prediction - z_next_latent_true)).mean()
+            self.epm.eval()
+            ensemble_vector = self.epm(latent_state, action_tensor)  # --> (ensemble_size, batch, latent_size)
+            self.epm.train()
+            z_next_latent_prediction = ensemble_vector.mean(dim=0)  # prediction vector average among the ensembles models
+            mse = (z_next_latent_prediction - latent_next_state).pow(2).mean(dim=1)  # one surprise rate per sample
         return mse
 
     def get_novelty_rate(self, state_tensor):
         with torch.no_grad():
             z_vector = self.encoder(state_tensor)
-            rec_img  = self.decoder(z_vector) # Note: rec_img is a stack of k images --> (1, k , 84 ,84),
+            rec_img  = self.decoder(z_vector) # Note: rec_img is a stack of k images --> (batch, k , 84 ,84),
 
-            original_stack_imgs  = state_tensor.cpu().numpy()[0]  # --> (k , 84 ,84)
-            reconstruction_stack = rec_img.cpu().numpy()[0]           # --> (k , 84 ,84)
-
-        target_images     = original_stack_imgs / 255
-        ssim_index_total  = ssim(target_images, reconstruction_stack, full=False, data_range=target_images.max() - target_images.min(), channel_axis=0)
-        novelty_rate      = 1 - ssim_index_total
+            # SSIM of each reconstruction against its (already [0-1]) input, on the device, one per sample
+            target_images    = state_tensor
+            data_range       = target_images.amax(dim=(1, 2, 3)) - target_images.amin(dim=(1, 2, 3))
+            ssim_index_total = structural_similarity(rec_img, target_images, data_range)
+            novelty_rate     = 1 - ssim_index_total
         return novelty_rate
 
 
     def train_predictive_model(self, experiences):
         states, actions, next_states = experiences
 
-        states      = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions     = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
+        states      = to_device_tensor(states, self.device)
+        actions     = to_device_tensor(actions, self.device)
+        next_states = to_device_tensor(next_states, self.device)
 
         with torch.no_grad():
             latent_state      = self.encoder(states, detach=True)
             latent_next_state = self.encoder(next_states, detach=True)
 
-        for predictive_network, optimizer in zip(self.epm, self.epm_optimizers):
-            predictive_network.train()
-            # Get the deterministic prediction of each model
-            prediction_vector = predictive_network(latent_state, actions)
-            # Calculate Loss
-            loss = F.mse_loss(prediction_vector, latent_next_state)
-            # Update weights and bias
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+        self.epm.train()
+        # Get the deterministic prediction of each model --> (ensemble_size, batch, latent_size)
+        prediction_vector = self.epm(latent_state, actions)
+        # Calculate Loss, the mse of each member summed so each member gets the gradient of its own loss
+        member_loss = F.mse_loss(prediction_vector, latent_next_state.expand_as(prediction_vector), reduction='none').mean(dim=(1, 2))
+        loss = member_loss.sum()
+        # Update weights and bias of all the members in one step
+        self.epm_optimizer.zero_grad()
+        loss.backward()
+        self.epm_optimizer.step()
 
     def get_reconstruction_for_evaluation(self, state):
         self.encoder.eval()
         self.decoder.eval()
         with torch.no_grad():
-            state_tensor_img = torch.FloatTensor(state).to(self.device)
+            state_tensor_img = to_device_tensor(state, self.device)
             state_tensor_img = state_tensor_img.unsqueeze(0)
             z_vector = self.encoder(state_tensor_img)
             rec_img  = self.decoder(z_vector)
@@ -258,3 +292,15 @@ class Algorithm:
         torch.save(self.decoder.state_dict(), f'models/{filename}_decoder.pht')
         torch.save(self.epm.state_dict(),     f'models/{filename}_ensemble.pht')  # no sure if this is the correct way to solve ensemble
         print("models has been saved...")
+
+    def state_dict(self):
+        # everything needed to continue training: networks, targets, optimizers and the update counter
+        state = {name: value.state_dict() for name, value in vars(self).items() if isinstance(value, (torch.nn.Module, torch.optim.Optimizer))}
+        state["learn_counter"] = self.learn_counter
+        return state
+
+    def load_state_dict(self, state):
+        for name, value in vars(self).items():
+            if isinstance(value, (torch.nn.Module, torch.optim.Optimizer)):
+                value.load_state_dict(state[name])
+        self.learn_counter = state["learn_counter"]
@@ -0,0 +1,106 @@
+
+import time
+import queue
+
+import torch
+import numpy as np
+
+
+class SharedPolicy:
+    """
+    CPU copy of the actor weights (encoder included) in shared memory, published by the learner every
+    few updates and read by the actor processes. version tells the actors when there is something new to copy.
+    """
+    def __init__(self, actor, context):
+        self.weights = {name: tensor.detach().cpu().clone().share_memory_() for name, tensor in actor.state_dict().items()}
+        self.version = context.Value('i', 0)
+        self.lock    = context.Lock()
+
+    def publish(self, actor):
+        with self.lock:
+            for name, tensor in actor.state_dict().items():
+                self.weights[name].copy_(tensor)
+            self.version.value += 1
+
+    def pull(self, actor, local_version):
+        if self.version.value == local_version:
+            return local_version
+        with self.lock:
+            actor.load_state_dict(self.weights)
+            return self.version.value
+
+
+def put_until_stopped(transitions, message, stop):
+    # the learner keeps the queue bounded, give up when the run is stopping so the actor can exit
+    while not stop.value:
+        try:
+            transitions.put(message, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def actor_worker(actor_idx, domain_name, task_name, seed, k, latent_size, shared_policy, transitions, counters, settings):
+    # imported here, the worker is spawned and loads (and renders) its own dm_control instance
+    from dm_control import suite
+    from FrameStack_DMCS import FrameStack
+    from Algorithm import to_device_tensor
+    from networks import Actor
+    from networks import Encoder
+
+    torch.set_num_threads(1)  # one core per actor, the learner keeps the rest
+    np.random.seed(seed)
+
+    env_steps, updates, stop = counters
+    env          = suite.load(domain_name, task_name, task_kwargs={'random': seed})
+    frames_stack = FrameStack(env, k, settings["action_repeat"])
+
+    action_spec      = env.action_spec()
+    action_size      = action_spec.shape[0]
+    max_action_value = action_spec.maximum[0]
+    min_action_value = action_spec.minimum[0]
+
+    actor = Actor(latent_size, action_size, Encoder(latent_dim=latent_size, k=k*3))
+    actor.eval()
+    policy_version = -1
+
+    state = frames_stack.reset()
+    episode_reward    = 0
+    episode_timesteps = 0
+
+    while not stop.value:
+        collected = env_steps.value
+        if collected < settings["max_steps_exploration"]:
+            action = np.random.uniform(min_action_value, max_action_value, size=action_size)
+        else:
+            # throttle, wait while the learner is more than max_lag transitions behind the update-to-data ratio
+            # (env_steps counts physics steps, action_repeat of them per transition)
+            learned = updates.value / settings["G"] * settings["action_repeat"] + settings["max_steps_exploration"]
+            if collected - learned > settings["max_lag"] * settings["action_repeat"]:
+                time.sleep(0.001)
+                continue
+
+            policy_version = shared_policy.pull(actor, policy_version)
+            with torch.no_grad():
+                action = actor(to_device_tensor(state[None], torch.device('cpu')))[0].numpy()
+            noise  = np.random.normal(0, scale=0.1, size=action_size)
+            action = np.clip(action + noise, -1, 1)
+
+        next_state, reward_extrinsic, done = frames_stack.step(action)
+        episode_reward    += reward_extrinsic
+        episode_timesteps += 1
+
+        # the queue pickles in a background thread, send copies of the FrameStack views
+        put_until_stopped(transitions, ("transition", actor_idx, (state.copy(), action, reward_extrinsic, next_state.copy(), done)), stop)
+        with env_steps.get_lock():
+            env_steps.value += settings["action_repeat"]
+
+        state = next_state
+        if done:
+            put_until_stopped(transitions, ("episode", actor_idx, (episode_reward, episode_timesteps)), stop)
+            state = frames_stack.reset()
+            episode_reward    = 0
+            episode_timesteps = 0
+
+    # whatever is left in the queue is dropped, do not wait for it to be flushed before exiting
+    transitions.cancel_join_thread()
@@ -1,27 +1,111 @@
 
 from scipy.spatial import distance
 import numpy as np
+import os
 import logging
+import threading
+
+from Prioritized_Replay import SumTree
 
 logging.basicConfig(level=logging.INFO)
 
 class CustomMemoryBuffer:
-    def __init__(self, action_size, max_capacity=int(1e6)):
+    """
+    Replay buffer for stacked pixel observations that keeps every rendered frame only once.
+    Slot t holds the newest frame of the observation at time t; when valid[t] is True it also holds the
+    transition (action, reward, done) that goes from the observation at t to the observation at t+1.
+    The (k*3, 84, 84) stacks are rebuilt at sample time from the k frames that end at t (or t+1),
+    repeating the first frame of the episode as FrameStack.reset() does.
+
+    With storage_dir the arrays are np.memmap files in that folder instead of RAM, so the OS page cache
+    holds the hot part of the buffer and a buffer found there is reopened when the run restarts.
+
+    add() and sample() hold a lock, so a PrefetchSampler thread can draw batches while the loop keeps adding.
+
+    A transition added with pending=True is stored but not sampled until add_intrinsic_rewards() adds its
+    intrinsic reward, so an IntrinsicRewardEngine can score the transitions in batches a few steps later.
+    intrinsic / intrinsic_version / intrinsic_cached hold the bonus an IntrinsicRewardCache computed for a slot
+    at sample time and the update it was computed at, they are cleared when the slot is overwritten.
+
+    snapshot() copies the buffer into a checkpoint folder, only the slots written since the previous snapshot
+    go to the frame files there, and restore() reads it back when a run is resumed.
+
+    With prioritized=True a SumTree holds priority ** alpha for every slot, 0 for the slots that are not valid
+    transitions, and a new transition gets the highest priority seen so far. sample_prioritized() draws in
+    proportion to it and update_priorities() sets the priorities of a trained batch, e.g. through PrioritizedReplay.
+
+    With n_step > 1 the batches hold n-step transitions, computed at sample time from the consecutive slots of
+    the episode: the discounted sum of up to n_step rewards, the observation to bootstrap from, its done and a
+    sixth array with the discount gamma ** (steps taken) of each sample for the critic target.
+    """
+    def __init__(self, action_size, max_capacity=int(1e6), k=3, storage_dir=None, prioritized=False, alpha=0.6, n_step=1, gamma=0.99):
         self.max_capacity = max_capacity
+        self.k            = k  # number of frames stacked in each observation
+        self.storage_dir  = storage_dir
+        self.alpha        = alpha
+        self.n_step       = n_step
+        self.gamma        = gamma
 
-        obs_shape    = (9, 84, 84)
+        frame_shape  = (3, 84, 84)
         action_shape = action_size
         latent_size  = 50
 
-        self.states      = np.empty((max_capacity, *obs_shape), dtype=np.uint8)
-        self.next_states = np.empty((max_capacity, *obs_shape), dtype=np.uint8)
-        self.actions     = np.empty((max_capacity, action_shape), dtype=np.float32)
-        self.rewards     = np.empty((max_capacity, 1), dtype=np.float32)
-        self.dones       = np.empty((max_capacity, 1), dtype=np.float32)
+        self.frame_channels = frame_shape[0]
+
+        if self.storage_dir is not None:
+            os.makedirs(self.storage_dir, exist_ok=True)
+
+        self.frames  = self.allocate("frames",  (max_capacity, *frame_shape), np.uint8)
+        self.actions = self.allocate("actions", (max_capacity, action_shape), np.float32)
+        self.rewards = self.allocate("rewards", (max_capacity, 1), np.float32)
+        self.dones   = self.allocate("dones",   (max_capacity, 1), np.float32)
+        self.steps   = self.allocate("steps",   (max_capacity,), np.int64)  # position of the frame inside its episode
+        self.valid   = self.allocate("valid",   (max_capacity,), bool)      # True if the slot holds a transition ready to sample
+        self.pending = self.allocate("pending", (max_capacity,), bool)      # True if the transition waits for its intrinsic reward
+        self.intrinsic         = self.allocate("intrinsic",         (max_capacity,), np.float32)
+        self.intrinsic_version = self.allocate("intrinsic_version", (max_capacity,), np.int64)
+        self.intrinsic_cached  = self.allocate("intrinsic_cached",  (max_capacity,), bool)
+        self.cursor  = self.allocate("cursor",  (2,), np.int64)             # idx and full, kept next to the data
         #self.z_vectors   = np.empty((max_capacity, latent_size), dtype=np.float32)
 
-        self.idx  = 0
-        self.full = False
+        self.idx  = int(self.cursor[0])
+        self.full = bool(self.cursor[1])
+        self.new_episode = True  # a reopened buffer also continues with a new episode
+        self.lock        = threading.Lock()
+
+        self.snapshot_idx = None  # cursor at the last snapshot, None if there is none
+        self.unsaved      = 0     # frames added since the last snapshot
+
+        self.priorities   = SumTree(max_capacity) if prioritized else None
+        self.max_priority = 1.0  # priority ** alpha given to new transitions
+        if self.priorities is not None:
+            self.reset_priorities(np.flatnonzero(self.valid), True)
+
+        if self.idx > 0 or self.full:
+            logging.info(f"Replay buffer reopened from {self.storage_dir} with {len(self)} frames")
+
+    def allocate(self, name, shape, dtype):
+        if self.storage_dir is None:
+            return np.zeros(shape, dtype=dtype)
+
+        path = os.path.join(self.storage_dir, f"{name}.npy")
+        if not os.path.exists(path):
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+        array = np.lib.format.open_memmap(path, mode="r+")
+        if array.shape != shape or array.dtype != np.dtype(dtype):
+            raise ValueError(f"{path} holds {array.dtype} {array.shape}, expected {np.dtype(dtype)} {shape}")
+        return array
+
+    def __len__(self):
+        return self.max_capacity if self.full else self.idx
+
+    def flush(self):
+        if self.storage_dir is None:
+            return
+        for array in (self.frames, self.actions, self.rewards, self.dones, self.steps, self.valid, self.pending,
+                      self.intrinsic, self.intrinsic_version, self.intrinsic_cached, self.cursor):
+            array.flush()
 
     def add(self, **experience):
 
@@ -30,28 +114,233 @@ class CustomMemoryBuffer:
         reward     = experience["reward"]
         next_state = experience["next_state"]
         done       = experience["done"]
+        pending    = experience.get("pending", False)
         #latent_z   = experience["latent_z"]
 
-        np.copyto(self.states[self.idx], state)
-        np.copyto(self.actions[self.idx], action)
-        np.copyto(self.rewards[self.idx], reward)
-        np.copyto(self.next_states[self.idx], next_state)
-        np.copyto(self.dones[self.idx], done)
-        #np.copyto(self.z_vectors[self.idx], latent_z)
+        with self.lock:
+            if self.new_episode:
+                # the first state of an episode is the reset frame repeated k times, so its newest frame is enough
+                self.add_frame(state[-self.frame_channels:], step=0)
+
+            slot = (self.idx - 1) % self.max_capacity  # slot holding the newest frame of state
+            np.copyto(self.actions[slot], action)
+            np.copyto(self.rewards[slot], reward)
+            np.copyto(self.dones[slot], done)
+            self.valid[slot]   = not pending
+            self.pending[slot] = pending
+            self.reset_priorities(slot, not pending)
+            #np.copyto(self.z_vectors[self.idx], latent_z)
+
+            self.add_frame(next_state[-self.frame_channels:], step=self.steps[slot] + 1)
+
+            # after the last transition of an episode, the next state given is a reset one and starts a new slot
+            self.new_episode = bool(done)
+            return slot
+
+    def add_frame(self, frame, step):
+        np.copyto(self.frames[self.idx], frame)
+        self.steps[self.idx] = step
+        self.valid[self.idx]   = False
+        self.pending[self.idx] = False
+        self.intrinsic_cached[self.idx] = False
+
+        # the k-1 oldest slots ahead of the cursor may stack frames that have just been overwritten
+        overwritten = (self.idx + np.arange(1, self.k)) % self.max_capacity
+        self.valid[overwritten]   = False
+        self.pending[overwritten] = False
+        self.reset_priorities(np.append(overwritten, self.idx), False)
 
         self.idx  = (self.idx + 1) % self.max_capacity
         self.full = self.full or self.idx == 0
+        self.cursor[0] = self.idx
+        self.cursor[1] = self.full
+        self.unsaved  += 1
+
+    def stack_frames(self, idxs):
+        # offsets back from each slot, clamped at the start of the episode
+        offsets    = np.minimum(np.arange(self.k - 1, -1, -1), self.steps[idxs][:, None])
+        frame_idxs = (idxs[:, None] - offsets) % self.max_capacity
+        stacks     = self.frames[frame_idxs]  # --> shape = (batch, k, 3, 84, 84)
+        return stacks.reshape(len(idxs), -1, *self.frames.shape[2:])  # --> shape = (batch, k*3, 84, 84)
+
+    def pending_transitions(self, slots):
+        with self.lock:
+            states      = self.stack_frames(slots)
+            actions     = self.actions[slots]
+            rewards     = self.rewards[slots]
+            next_states = self.stack_frames((slots + 1) % self.max_capacity)
+            return states, actions, rewards, next_states
+
+    def add_intrinsic_rewards(self, slots, intrinsic_rewards):
+        with self.lock:
+            # a slot overwritten while it was waiting is no longer pending, its reward is dropped
+            keep  = self.pending[slots]
+            slots = slots[keep]
+            self.rewards[slots, 0] += intrinsic_rewards[keep]
+            self.pending[slots] = False
+            self.valid[slots]   = True
+            self.reset_priorities(slots, True)
+
+    def reset_priorities(self, slots, valid):
+        # the slots that become transitions get the highest priority, the ones that stop being one get 0
+        if self.priorities is not None:
+            self.priorities.update(np.atleast_1d(slots), self.max_priority if valid else 0.0)
+
+    def update_priorities(self, idxs, errors, epsilon=1e-6):
+        with self.lock:
+            # a slot overwritten since it was sampled is no longer valid and keeps its 0
+            keep       = self.valid[idxs]
+            priorities = (np.abs(errors[keep]) + epsilon) ** self.alpha
+            if len(priorities) > 0:
+                self.priorities.update(idxs[keep], priorities)
+                self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def snapshot_ranges(self):
+        # contiguous slot ranges written since the last snapshot, the slot before the old cursor gets its action then
+        if self.snapshot_idx is None or self.unsaved + 1 >= len(self):
+            return [(0, len(self))]
+        start = (self.snapshot_idx - 1) % self.max_capacity
+        end   = start + self.unsaved + 1
+        if end <= self.max_capacity:
+            return [(start, end)]
+        return [(start, self.max_capacity), (0, end - self.max_capacity)]
+
+    def snapshot(self, directory):
+        """
+        Writes the slots added since the last snapshot into the .npy files in directory and returns the rest of
+        the state, the per-slot flags and rewards that change after a slot is written (a few MB) and the cursor.
+        The checkpoint stores that dict, so the buffer is only restored up to the last complete snapshot.
+        With storage_dir the checkpoint still keeps its own copy, the files of storage_dir go on being overwritten
+        by the slots added after it and would no longer match the flags and rewards of the snapshot.
+        """
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            for name in ("frames", "actions", "dones", "steps"):
+                array = getattr(self, name)
+                path  = os.path.join(directory, f"{name}.npy")
+                mode  = "r+" if os.path.exists(path) else "w+"
+                file  = np.lib.format.open_memmap(path, mode=mode, dtype=array.dtype, shape=array.shape)
+                for start, end in self.snapshot_ranges():
+                    file[start:end] = array[start:end]
+                file.flush()
+                del file
+            self.flush()
+
+            self.snapshot_idx = self.idx
+            self.unsaved      = 0
+            snapshot = {"idx": self.idx, "full": self.full, "rewards": self.rewards.copy(), "valid": self.valid.copy(), "pending": self.pending.copy(),
+                        "intrinsic": self.intrinsic.copy(), "intrinsic_version": self.intrinsic_version.copy(), "intrinsic_cached": self.intrinsic_cached.copy()}
+            if self.priorities is not None:
+                snapshot["priorities"]   = self.priorities.get(np.arange(self.max_capacity))
+                snapshot["max_priority"] = self.max_priority
+            return snapshot
+
+    def restore(self, directory, snapshot):
+        with self.lock:
+            size = snapshot["idx"] if not snapshot["full"] else self.max_capacity
+            for name in ("frames", "actions", "dones", "steps"):
+                file = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="r")
+                getattr(self, name)[:size] = file[:size]
+                del file
+            for name in ("rewards", "valid", "pending", "intrinsic", "intrinsic_version", "intrinsic_cached"):
+                getattr(self, name)[:] = snapshot[name]
+
+            self.idx  = snapshot["idx"]
+            self.full = snapshot["full"]
+            self.cursor[0] = self.idx
+            self.cursor[1] = self.full
+            self.new_episode  = True
+            self.snapshot_idx = self.idx
+            self.unsaved      = 0
+
+            if self.priorities is not None:
+                if "priorities" in snapshot:
+                    self.priorities.update(np.arange(self.max_capacity), snapshot["priorities"])
+                    self.max_priority = snapshot["max_priority"]
+                else:
+                    # checkpoint of a uniform run, every transition starts with the same priority
+                    self.priorities.update(np.arange(self.max_capacity), np.where(self.valid, self.max_priority, 0.0))
+            logging.info(f"Replay buffer restored from {directory} with {len(self)} frames")
+
+    def uniform_idxs(self, batch_size):
+        size = len(self)
+        if size == 0:
+            raise ValueError("The replay buffer has no complete transition to sample")
+        idxs = np.random.randint(0, size, size=batch_size)
+
+        # the newest frame of each episode (and the slots next to the cursor) are not transitions, draw again
+        invalid = ~self.valid[idxs]
+        for _ in range(8):
+            if not invalid.any():
+                return idxs
+            idxs[invalid] = np.random.randint(0, size, size=invalid.sum())
+            invalid = ~self.valid[idxs]
+
+        # still invalid after the redraws (a buffer of few transitions), take them among the valid slots
+        candidates = np.flatnonzero(self.valid[:size])
+        if len(candidates) == 0:
+            raise ValueError("The replay buffer has no complete transition to sample")
+        idxs[invalid] = candidates[np.random.randint(0, len(candidates), size=invalid.sum())]
+        return idxs
+
+    def sample(self, batch_size, return_idxs=False, n_step=None):
+        # n_step overrides the one of the buffer, e.g. n_step=1 for the models that learn one step ahead
+        with self.lock:
+            idxs = self.uniform_idxs(batch_size)
+
+            experiences = self.gather(idxs, self.n_step if n_step is None else n_step)
+
+            if return_idxs:
+                return (*experiences, idxs)
+            return experiences
+
+    def sample_prioritized(self, batch_size, beta=0.4, n_step=None):
+        # one draw in each of batch_size equal parts of the total priority, with the importance-sampling weights
+        with self.lock:
+            total = self.priorities.total()
+            if total <= 0:
+                # no valid transition holds a priority, every draw would be slot 0 with a NaN weight
+                raise ValueError("The replay buffer has no complete transition to sample")
+            targets = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+            idxs    = self.priorities.find(targets)
+
+            probabilities = self.priorities.get(idxs) / total
+            weights = (len(self) * probabilities) ** -beta
+            weights = (weights / weights.max()).astype(np.float32)[:, None]  # scaled by the largest weight of the batch
+
+            experiences = self.gather(idxs, self.n_step if n_step is None else n_step)
+            return (*experiences, idxs, weights)
+
+    def gather(self, idxs, n_step=1):
+        states  = self.stack_frames(idxs)
+        actions = self.actions[idxs]
+        if n_step == 1:
+            rewards     = self.rewards[idxs]
+            next_states = self.stack_frames((idxs + 1) % self.max_capacity)
+            dones       = self.dones[idxs]
+            return states, actions, rewards, next_states, dones
+
+        rewards, bootstrap_idxs, dones, discounts = self.n_step_returns(idxs, n_step)
+        next_states = self.stack_frames(bootstrap_idxs)
+        return states, actions, rewards, next_states, dones, discounts
+
+    def n_step_returns(self, idxs, n_step):
+        # the transitions that follow each slot in its episode, up to n_step, stopping after a done or before a slot
+        # that is not a transition (the newest frame of the running episode or one waiting for its intrinsic reward)
+        offsets = np.arange(n_step)
+        slots   = (idxs[:, None] + offsets) % self.max_capacity  # --> shape = (batch, n_step)
 
-    def sample(self, batch_size):
-        idxs = np.random.randint(0, self.max_capacity if self.full else self.idx, size=batch_size)
+        ended = self.dones[slots, 0] > 0
+        taken = self.valid[slots] & (self.steps[slots] == self.steps[idxs][:, None] + offsets)
+        taken[:, 1:] &= ~ended[:, :-1]
+        taken = np.logical_and.accumulate(taken, axis=1)
 
-        states      = self.states[idxs]
-        rewards     = self.rewards[idxs]
-        actions     = self.actions[idxs]
-        next_states = self.next_states[idxs]
-        dones       = self.dones[idxs]
+        num_steps = taken.sum(axis=1)
+        last      = (idxs + num_steps - 1) % self.max_capacity
 
-        return states, actions, rewards, next_states, dones
+        rewards   = (self.rewards[slots, 0] * taken * self.gamma ** offsets).sum(axis=1, keepdims=True).astype(np.float32)
+        discounts = (self.gamma ** num_steps).astype(np.float32)[:, None]
+        return rewards, (last + 1) % self.max_capacity, self.dones[last], discounts
 
 
 
@@ -0,0 +1,101 @@
+
+import os
+import queue
+
+import torch
+import logging
+import torch.multiprocessing as mp
+
+logging.basicConfig(level=logging.INFO)
+
+
+def evaluation_worker(domain_name, task_name, seed, k, latent_size, jobs, settings):
+    # imported here, the worker is spawned and loads (and renders) its own dm_control instance
+    from dm_control import suite
+    from FrameStack_DMCS import FrameStack
+    from Algorithm import to_device_tensor
+    from Video_Recorder import VideoRecorder
+    from networks import Actor
+    from networks import Encoder
+
+    torch.set_num_threads(1)  # one core for the evaluation, the learner keeps the rest
+
+    env          = suite.load(domain_name, task_name, task_kwargs={'random': seed})
+    frames_stack = FrameStack(env, k, settings["action_repeat"])
+    action_size  = env.action_spec().shape[0]
+
+    actor = Actor(latent_size, action_size, Encoder(latent_dim=latent_size, k=k*3))
+    actor.eval()
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        step, weights = job
+        actor.load_state_dict(weights)
+
+        video_name = settings["video_name"].format(step=step) if settings["video_name"] else None
+        video      = VideoRecorder(video_name, max_episodes=1) if video_name else None
+
+        episode_rewards = []
+        for episode_num in range(settings["num_episodes"]):
+            state = frames_stack.reset()
+            episode_reward = 0
+            done = False
+            while not done:
+                with torch.no_grad():
+                    action = actor(to_device_tensor(state[None], torch.device('cpu')))[0].numpy()
+                state, reward_extrinsic, done = frames_stack.step(action)
+                episode_reward += reward_extrinsic
+                if video is not None:
+                    video.capture(env)
+            if video is not None:
+                video.end_episode()
+            episode_rewards.append(episode_reward)
+
+        if video is not None:
+            video.close()
+
+        avg_episode_reward = sum(episode_rewards) / len(episode_rewards)
+        logging.info(f" EVALUATION | Total T:{step} | {len(episode_rewards)} episodes | Avg Reward= {avg_episode_reward:.3f}")
+
+        # one line per evaluation, appended so the file can be read while training runs
+        write_header = not os.path.exists(settings["log_file"])
+        with open(settings["log_file"], "a") as log:
+            if write_header:
+                log.write("step,avg_episode_reward\n")
+            log.write(f"{step},{avg_episode_reward}\n")
+
+
+class EvaluationWorker:
+    """
+    Evaluates snapshots of the actor in a separate process, so training does not stop for the evaluation.
+    submit() copies the actor (encoder included) weights to the CPU and queues them with the step they belong to.
+    The worker runs num_episodes noise-free episodes on its own dm_control instance and appends the average
+    reward to log_file. video_name, e.g. 'videos/run_{step}.mp4', records the first episode of each evaluation.
+    When max_pending snapshots are still waiting, the new one is skipped instead of blocking the training.
+    script_TD3_pixels keeps a copy of this file for TD3_Pixels.
+    """
+    def __init__(self, domain_name, task_name, seed, k, latent_size, log_file, video_name=None, num_episodes=1,
+                 action_repeat=1, max_pending=2):
+        settings = {"log_file": log_file, "video_name": video_name, "num_episodes": num_episodes, "action_repeat": action_repeat}
+
+        context    = mp.get_context("spawn")  # a forked copy of a rendering context is not safe to use
+        self.jobs  = context.Queue(maxsize=max_pending)
+        self.process = context.Process(
+            target=evaluation_worker,
+            args=(domain_name, task_name, seed, k, latent_size, self.jobs, settings),
+            daemon=True)
+        self.process.start()
+
+    def submit(self, step, actor):
+        weights = {name: tensor.detach().cpu().clone() for name, tensor in actor.state_dict().items()}
+        try:
+            self.jobs.put_nowait((step, weights))
+        except queue.Full:
+            logging.warning(f"EvaluationWorker: still busy, the evaluation at step {step} is skipped")
+
+    def close(self):
+        # waits for the queued evaluations to finish
+        self.jobs.put(None)
+        self.process.join()
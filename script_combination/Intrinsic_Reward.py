@@ -0,0 +1,100 @@
+
+import torch
+import numpy as np
+
+from Algorithm import to_device_tensor
+
+
+class IntrinsicRewardEngine:
+    """
+    Scores the intrinsic reward of the transitions added to a CustomMemoryBuffer in batches instead of one by one.
+    The loop adds each transition with pending=True and passes its slot to add(). Once batch_size slots are
+    waiting, they are scored together through get_surprise_rate and get_novelty_rate. The weighted bonus is then
+    added to their stored (extrinsic) reward, which makes them sampleable, so a transition joins the replay
+    at most batch_size env steps after it happened.
+    """
+    def __init__(self, agent, memory, batch_size=32, surprise_weight=0.5, novelty_weight=0.5):
+        self.agent           = agent
+        self.memory          = memory
+        self.batch_size      = batch_size
+        self.surprise_weight = surprise_weight
+        self.novelty_weight  = novelty_weight
+
+        self.slots = []
+        self.steps = []
+
+    def add(self, slot, step):
+        # returns the values of the scored transitions when this one completes a batch, None otherwise
+        self.slots.append(slot)
+        self.steps.append(step)
+        if len(self.slots) >= self.batch_size:
+            return self.score()
+        return None
+
+    def score(self):
+        if not self.slots:
+            return None
+        slots = np.array(self.slots)
+        states, actions, rewards, next_states = self.memory.pending_transitions(slots)
+
+        with torch.no_grad():
+            states_tensor      = to_device_tensor(states, self.agent.device)
+            actions_tensor     = to_device_tensor(actions, self.agent.device)
+            next_states_tensor = to_device_tensor(next_states, self.agent.device)
+
+            surprise_rate = self.agent.get_surprise_rate(states_tensor, actions_tensor, next_states_tensor)
+            novelty_rate  = self.agent.get_novelty_rate(states_tensor)
+            bonus = self.surprise_weight * surprise_rate + self.novelty_weight * novelty_rate
+            surprise_rate, novelty_rate, bonus = torch.stack([surprise_rate, novelty_rate, bonus]).cpu().numpy()
+
+        self.memory.add_intrinsic_rewards(slots, bonus)
+
+        values = {"step": self.steps, "extrinsic_reward": rewards[:, 0].tolist(), "novelty_rate": novelty_rate.tolist(), "surprise_rate": surprise_rate.tolist()}
+        self.slots = []
+        self.steps = []
+        return values
+
+
+class IntrinsicRewardCache:
+    """
+    Intrinsic reward computed at sample time, for replay that stores only the extrinsic reward.
+    train_policy calls rewards() with the device tensors of the sampled batch. The bonus of each index is kept
+    in the memory with the agent update (learn_counter) that computed it, and only the indexes whose bonus is
+    missing or older than max_staleness updates go through get_surprise_rate and get_novelty_rate again.
+    """
+    def __init__(self, agent, memory, max_staleness=1000, surprise_weight=0.5, novelty_weight=0.5):
+        self.agent           = agent
+        self.memory          = memory
+        self.max_staleness   = max_staleness
+        self.surprise_weight = surprise_weight
+        self.novelty_weight  = novelty_weight
+
+        self.recomputed = 0  # bonuses computed, against len(idxs) asked for
+
+    def sample(self, batch_size):
+        # returns the batch and the function train_policy uses to add the intrinsic reward to it
+        # 1-step batches even from an n-step replay, the surprise rate compares one step ahead
+        states, actions, rewards, next_states, dones, idxs = self.memory.sample(batch_size, return_idxs=True, n_step=1)
+        return (states, actions, rewards, next_states, dones), lambda *batch: self.rewards(idxs, *batch)
+
+    def rewards(self, idxs, states, actions, next_states):
+        version = self.agent.learn_counter
+        cached_version = self.memory.intrinsic_version[idxs]
+        # a version ahead of the agent comes from a buffer reopened after a restart
+        stale = ~self.memory.intrinsic_cached[idxs] | (cached_version < version - self.max_staleness) | (cached_version > version)
+
+        if stale.any():
+            stale_rows = torch.from_numpy(np.flatnonzero(stale)).to(states.device)
+            with torch.no_grad():
+                surprise_rate = self.agent.get_surprise_rate(states[stale_rows], actions[stale_rows], next_states[stale_rows])
+                novelty_rate  = self.agent.get_novelty_rate(states[stale_rows])
+                bonus = self.surprise_weight * surprise_rate + self.novelty_weight * novelty_rate
+
+            stale_idxs = idxs[stale]
+            self.memory.intrinsic[stale_idxs]         = bonus.cpu().numpy()
+            self.memory.intrinsic_version[stale_idxs] = version
+            self.memory.intrinsic_cached[stale_idxs]  = True
+            self.recomputed += len(stale_idxs)
+
+        # duplicated indexes in a batch read the same, freshly written, value
+        return torch.from_numpy(self.memory.intrinsic[idxs]).to(states.device).unsqueeze(1)
@@ -0,0 +1,59 @@
+
+import os
+import numpy as np
+
+
+class MetricsLog:
+    """
+    Append-only CSV of training metrics, e.g. MetricsLog("data_plots/run", ["step", "episode_reward"]).
+    The rows are kept in a preallocated (chunk_size, columns) float64 array and appended to the file when it
+    is full or on flush(), so every row is written once and the cost of a flush does not grow with the run.
+    The file keeps the header and layout the pandas DataFrame.to_csv version wrote, plot it offline with
+    plot_metrics.py. append=True continues an existing file instead of starting a new one, cut back to the
+    truncate bytes a checkpoint kept from file_size() when a run is resumed.
+    4DoF_Gripper/scripts and model_base_autoencoder_td3 keep a copy of this file.
+    """
+    def __init__(self, path, columns, chunk_size=1000, append=False, truncate=None):
+        self.path    = path
+        self.columns = list(columns)
+        self.chunk   = np.empty((chunk_size, len(self.columns)), dtype=np.float64)
+        self.size    = 0  # rows waiting in the chunk
+
+        if not append or not os.path.exists(path):
+            with open(path, "w") as file:
+                file.write(",".join(self.columns) + "\n")
+        elif truncate is not None:
+            # the file_size() of a checkpoint, the rows written after it are dropped, the resumed run writes them again
+            with open(path, "r+") as file:
+                file.truncate(truncate)
+
+    def append(self, **values):
+        self.chunk[self.size] = [values[column] for column in self.columns]
+        self.size += 1
+        if self.size == len(self.chunk):
+            self.flush()
+
+    def extend(self, values):
+        # values is a dict of equally long sequences, one per column
+        rows = np.column_stack([np.asarray(values[column], dtype=np.float64) for column in self.columns])
+        if self.size + len(rows) > len(self.chunk):
+            self.flush()
+        if len(rows) >= len(self.chunk):
+            self.write(rows)
+            return
+        self.chunk[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def flush(self):
+        if self.size > 0:
+            self.write(self.chunk[:self.size])
+            self.size = 0
+
+    def file_size(self):
+        # bytes on disk once every row is flushed, a checkpoint keeps it to truncate the file on resume
+        self.flush()
+        return os.path.getsize(self.path)
+
+    def write(self, rows):
+        with open(self.path, "a") as file:
+            np.savetxt(file, rows, delimiter=",", fmt="%.10g")
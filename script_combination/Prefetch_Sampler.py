@@ -0,0 +1,117 @@
+
+import time
+import queue
+import threading
+
+import torch
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class PrefetchSampler:
+    """
+    Draws the next batches from a CustomMemoryBuffer in a background thread while the learner trains.
+    Every batch is collated into one of a fixed set of reusable host tensors (pinned when CUDA is used, so the
+    copy to the device in to_device_tensor is asynchronous) and handed over through a bounded queue.
+
+    A batch returned by sample() stays valid until the next call to sample(), then its buffers go back to the
+    thread. The prefetched batches are drawn up to `prefetch` steps ahead, so they can miss the newest transitions.
+    blocked_time counts the seconds the learner spent waiting for a batch.
+    """
+    def __init__(self, memory, batch_size, prefetch=10, pin_memory=torch.cuda.is_available()):
+        self.memory     = memory
+        self.batch_size = batch_size
+        self.prefetch   = prefetch
+        self.pin_memory = pin_memory
+
+        # one extra slot for the batch the learner is holding
+        self.slots       = [None] * (prefetch + 1)
+        self.slot_events = [None] * (prefetch + 1)
+        self.free_slots  = queue.Queue()
+        self.ready_slots = queue.Queue(maxsize=prefetch)
+        for slot in range(prefetch + 1):
+            self.free_slots.put(slot)
+
+        self.held_slot     = None
+        self.blocked_time  = 0.0  # seconds the learner waited on the queue
+        self.batches_taken = 0
+
+        self.stop_event = threading.Event()
+        self.error      = None
+        self.thread     = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.worker, name="PrefetchSampler", daemon=True)
+        self.thread.start()
+
+    def allocate_slot(self, experiences):
+        tensors = []
+        for array in experiences:
+            tensor = torch.empty(array.shape, dtype=torch.from_numpy(array).dtype)
+            tensors.append(tensor.pin_memory() if self.pin_memory else tensor)
+        return tuple(tensors)
+
+    def worker(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    slot = self.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                # the last copy to the device read from these pinned buffers must be done before they are overwritten
+                if self.slot_events[slot] is not None:
+                    self.slot_events[slot].synchronize()
+
+                experiences = self.memory.sample(self.batch_size)
+                if self.slots[slot] is None:
+                    self.slots[slot] = self.allocate_slot(experiences)
+                for tensor, array in zip(self.slots[slot], experiences):
+                    tensor.copy_(torch.from_numpy(array))
+
+                while not self.stop_event.is_set():
+                    try:
+                        self.ready_slots.put(slot, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as error:
+            self.error = error
+
+    def release_held_slot(self):
+        if self.held_slot is None:
+            return
+        if self.pin_memory:
+            event = torch.cuda.Event()
+            event.record()
+            self.slot_events[self.held_slot] = event
+        self.free_slots.put(self.held_slot)
+        self.held_slot = None
+
+    def sample(self):
+        if self.thread is None:
+            self.start()
+        self.release_held_slot()
+
+        start = time.perf_counter()
+        while True:
+            try:
+                slot = self.ready_slots.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self.error is not None:
+                    raise RuntimeError("Prefetch thread failed while sampling the memory buffer") from self.error
+        self.blocked_time  += time.perf_counter() - start
+        self.batches_taken += 1
+
+        self.held_slot = slot
+        return self.slots[slot]  # states, actions, rewards, next_states, dones
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        logging.info(f"Prefetch sampler: learner blocked {self.blocked_time:.2f} Seg over {self.batches_taken} batches")
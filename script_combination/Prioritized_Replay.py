@@ -0,0 +1,101 @@
+
+import torch
+import numpy as np
+
+
+class SumTree:
+    """
+    Array-backed sum tree over capacity priorities. The leaves are tree[size:size + capacity] and every node
+    holds the sum of its two children, so tree[1] is the total. size is the next power of two, all the leaves are
+    at the same depth and a batch of updates or searches is one vectorized numpy step per level, O(log n).
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size     = 1 << max(0, (capacity - 1).bit_length())
+        self.depth    = self.size.bit_length() - 1
+        self.tree     = np.zeros(2 * self.size, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idxs):
+        return self.tree[self.size + idxs]
+
+    def update(self, idxs, priorities):
+        idxs = np.asarray(idxs)
+        self.tree[self.size + idxs] = priorities
+
+        if len(idxs) <= 4:
+            # the few slots of an add, scalar walks up are cheaper than depth numpy calls
+            for idx in idxs.tolist():
+                node = self.size + idx >> 1
+                while node >= 1:
+                    self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+                    node >>= 1
+        elif len(idxs) >= self.capacity // 2:
+            # bulk load, every level is rebuilt from the one below
+            for level in range(self.depth - 1, -1, -1):
+                start, end = 1 << level, 2 << level
+                self.tree[start:end] = self.tree[2 * start:2 * end:2] + self.tree[2 * start + 1:2 * end:2]
+        else:
+            # a node repeated in nodes is written twice with the same sum
+            nodes = self.size + idxs
+            for _ in range(self.depth):
+                nodes = nodes >> 1
+                self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        # the leaf whose prefix-sum interval holds each value, values in [0, total)
+        values = np.array(values, dtype=np.float64)
+        nodes  = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left     = 2 * nodes
+            left_sum = self.tree[left]
+            # rounding can leave a value past the left sum when the right side is empty, it stays left then
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values  -= left_sum * go_right
+            nodes    = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplay:
+    """
+    Prioritized sampling from a CustomMemoryBuffer created with prioritized=True.
+    sample() draws the batch in proportion to the stored priorities and returns it with the importance-sampling
+    weights train_policy scales the critic loss with, and the function train_policy calls back after the update
+    to set the new priorities of the batch: the TD error of the critic (source="td_error") or the surprise
+    rate of the ensemble (source="surprise"). beta goes from beta_start to 1 over beta_updates agent updates.
+    With an IntrinsicRewardCache the sampled batch also gets the function that adds its intrinsic reward.
+    """
+    def __init__(self, agent, memory, source="td_error", beta_start=0.4, beta_updates=1_000_000, intrinsic_cache=None):
+        if source not in ("td_error", "surprise"):
+            raise ValueError(f"Unknown priority source {source}, use td_error or surprise")
+        if memory.n_step > 1 and (source == "surprise" or intrinsic_cache is not None):
+            # the surprise rate compares one step ahead, an n-step batch ends n steps later
+            raise ValueError("The surprise priority and the intrinsic reward at sample time need a 1-step replay")
+        self.agent           = agent
+        self.memory          = memory
+        self.source          = source
+        self.beta_start      = beta_start
+        self.beta_updates    = beta_updates
+        self.intrinsic_cache = intrinsic_cache
+
+    def beta(self):
+        progress = min(1.0, self.agent.learn_counter / self.beta_updates)
+        return self.beta_start + (1.0 - self.beta_start) * progress
+
+    def sample(self, batch_size):
+        *experiences, idxs, weights = self.memory.sample_prioritized(batch_size, self.beta())
+
+        intrinsic_reward = None
+        if self.intrinsic_cache is not None:
+            intrinsic_reward = lambda *batch: self.intrinsic_cache.rewards(idxs, *batch)
+        priorities = lambda *batch: self.update(idxs, *batch)
+        return tuple(experiences), intrinsic_reward, weights, priorities
+
+    def update(self, idxs, states, actions, next_states, td_errors):
+        if self.source == "surprise":
+            values = self.agent.get_surprise_rate(states, actions, next_states)
+        else:
+            values = td_errors
+        self.memory.update_priorities(idxs, values.cpu().numpy())
@@ -0,0 +1,95 @@
+
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+
+def env_worker(pipe, domain_name, task_name, seed, k, action_repeat, env_idx, shm_names, obs_shape):
+    # imported here, the worker is spawned and loads (and renders) its own dm_control instance
+    from dm_control import suite
+    from FrameStack_DMCS import FrameStack
+
+    env          = suite.load(domain_name, task_name, task_kwargs={'random': seed})
+    frames_stack = FrameStack(env, k, action_repeat)
+
+    shms        = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    states      = np.ndarray(obs_shape, dtype=np.uint8, buffer=shms[0].buf)
+    next_states = np.ndarray(obs_shape, dtype=np.uint8, buffer=shms[1].buf)
+
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "reset":
+                states[env_idx] = frames_stack.reset()
+                pipe.send(None)
+            elif command == "step":
+                next_states[env_idx], reward, done = frames_stack.step(data)
+                # a finished env resets straight away, the next action is taken from its first state
+                states[env_idx] = frames_stack.reset() if done else next_states[env_idx]
+                pipe.send((reward, done))
+            elif command == "close":
+                break
+    finally:
+        for shm in shms:
+            shm.close()
+        pipe.close()
+
+
+class VectorFrameStack:
+    """
+    N dm_control envs, each one with its own FrameStack in a worker process, so rendering runs on N cores.
+    The stacked observations are written by the workers into shared memory:
+        states      (N, k*3, 84, 84) uint8, the observations to act on
+        next_states (N, k*3, 84, 84) uint8, the observations reached by the last step()
+    When an env is done, next_states keeps its last observation and states holds the first one of the next episode.
+    The returned arrays are views of the shared memory, valid until the next call to step() or reset().
+    """
+    def __init__(self, domain_name, task_name, num_envs, seed, k=3, action_repeat=1):
+        self.num_envs  = num_envs
+        self.action_repeat = action_repeat
+        self.obs_shape = (num_envs, k * 3, 84, 84)
+
+        obs_bytes = int(np.prod(self.obs_shape))
+        self.shms = [shared_memory.SharedMemory(create=True, size=obs_bytes) for _ in range(2)]
+        self.states      = np.ndarray(self.obs_shape, dtype=np.uint8, buffer=self.shms[0].buf)
+        self.next_states = np.ndarray(self.obs_shape, dtype=np.uint8, buffer=self.shms[1].buf)
+
+        context = mp.get_context("spawn")  # a forked copy of a rendering context is not safe to use
+        self.pipes     = []
+        self.processes = []
+        for env_idx in range(num_envs):
+            parent_pipe, child_pipe = context.Pipe()
+            process = context.Process(
+                target=env_worker,
+                args=(child_pipe, domain_name, task_name, seed + env_idx, k, action_repeat, env_idx, [shm.name for shm in self.shms], self.obs_shape),
+                daemon=True)
+            process.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+    def reset(self):
+        for pipe in self.pipes:
+            pipe.send(("reset", None))
+        for pipe in self.pipes:
+            pipe.recv()
+        return self.states  # --> shape = (N, 9, 84, 84)
+
+    def step(self, actions):
+        # every worker steps and renders at the same time, the results are gathered afterwards
+        for pipe, action in zip(self.pipes, actions):
+            pipe.send(("step", action))
+        results = [pipe.recv() for pipe in self.pipes]
+        rewards, dones = zip(*results)
+        return self.next_states, np.array(rewards, dtype=np.float32), np.array(dones, dtype=bool), self.states
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+        for process in self.processes:
+            process.join()
+        for pipe in self.pipes:
+            pipe.close()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
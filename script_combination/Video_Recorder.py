@@ -0,0 +1,76 @@
+
+import queue
+import threading
+
+import cv2
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class VideoRecorder:
+    """
+    Writes the evaluation video in a background thread. The loop hands over the raw RGB frames from
+    physics.render through a bounded queue, and the thread does the BGR conversion and the encoding, so the
+    evaluation only pays for the render. When the writer falls max_queue frames behind, capture() waits for it.
+
+    max_episodes records only the first episodes (None records all of them), frame_skip keeps every
+    frame_skip-th frame of an episode, the others are not rendered.
+    script_TD3_pixels keeps a copy of this file.
+    """
+    def __init__(self, video_name, fps=30, max_queue=64, max_episodes=None, frame_skip=1):
+        self.video_name   = video_name
+        self.fps          = fps
+        self.max_episodes = max_episodes
+        self.frame_skip   = frame_skip
+
+        self.episode = 0
+        self.step    = 0  # frames offered in the current episode
+
+        self.frames = queue.Queue(maxsize=max_queue)
+        self.error  = None
+        self.thread = threading.Thread(target=self.worker, name="VideoRecorder", daemon=True)
+        self.thread.start()
+
+    def worker(self):
+        video = None
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                if video is None:
+                    height, width, _ = frame.shape
+                    video = cv2.VideoWriter(self.video_name, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+                video.write(frame)
+        except Exception as error:
+            self.error = error
+            # keep draining, the loop must not block on a full queue
+            while self.frames.get() is not None:
+                pass
+        finally:
+            if video is not None:
+                video.release()
+
+    def wants_frame(self):
+        if self.max_episodes is not None and self.episode >= self.max_episodes:
+            return False
+        return self.step % self.frame_skip == 0
+
+    def capture(self, env):
+        # call it on every evaluation step, the frames that are not kept are not rendered either
+        if self.wants_frame():
+            frame = env.physics.render(camera_id=0, height=480, width=600)  # a new array each call, safe to queue
+            self.frames.put(frame)
+        self.step += 1
+
+    def end_episode(self):
+        self.episode += 1
+        self.step     = 0
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            logging.warning(f"VideoRecorder: {self.video_name} could not be written, {self.error}")
@@ -0,0 +1,53 @@
+"""
+Steps per second of the frame stack alone, the previous deque + np.concatenate / np.array(list(deque)) versions
+against the preallocated FrameRing, for 3x84x84 uint8 frames (FrameStack_DMCS, FrameStack_3CH) and
+84x84 float32 frames (FrameStack_1CH).
+
+python benchmark_frame_stack.py --steps 20000
+"""
+import time
+import numpy as np
+from collections import deque
+from argparse import ArgumentParser
+
+from FrameStack_DMCS import FrameRing
+
+
+def steps_per_second(step, frames, steps):
+    start = time.perf_counter()
+    for i in range(steps):
+        step(frames[i % len(frames)])
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20_000)
+    args = parser.parse_args()
+
+    color_frames = [np.moveaxis(np.random.randint(0, 255, (84, 84, 3), dtype=np.uint8), -1, 0) for _ in range(16)]
+    gray_frames  = [np.random.rand(84, 84).astype(np.float32) for _ in range(16)]
+
+    print(f"{'frames':>18} | {'k':>2} | {'deque (steps/s)':>16} | {'ring (steps/s)':>16}")
+    for k in (3, 8):
+        for name, frames, concatenate in (("3x84x84 uint8", color_frames, True), ("84x84 float32", gray_frames, False)):
+            frames_stacked = deque(frames[:k], maxlen=k)
+            if concatenate:
+                def step_deque(frame):
+                    frames_stacked.append(frame)
+                    return np.concatenate(list(frames_stacked), axis=0)
+            else:
+                def step_deque(frame):
+                    frames_stacked.append(frame)
+                    return np.array(frames_stacked)
+
+            ring = FrameRing(k, concatenate=concatenate)
+            ring.reset(frames[0])
+
+            deque_rate = steps_per_second(step_deque, frames, args.steps)
+            ring_rate  = steps_per_second(ring.append, frames, args.steps)
+            print(f"{name:>18} | {k:>2} | {deque_rate:>16.0f} | {ring_rate:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Sampling throughput of the prioritized replay (SumTree) against uniform sampling.
+The index draw is measured on a tree of --capacity priorities (1e6 by default, the replay size of the loops),
+together with the batched priority update after each train step and the single-slot update of an add.
+The whole batch (frames stacked) is measured on a filled CustomMemoryBuffer of --buffer_capacity slots.
+
+python benchmark_prioritized_replay.py --capacity 1000000 --batch_size 32
+"""
+import time
+import numpy as np
+from argparse import ArgumentParser
+
+from Custom_Memory import CustomMemoryBuffer
+from Prioritized_Replay import SumTree
+
+
+def time_call(function, repetitions):
+    for _ in range(10):
+        function()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions * 1e6  # us per call
+
+
+def uniform_indexes(valid, batch_size):
+    # the index draw of CustomMemoryBuffer.sample
+    idxs    = np.random.randint(0, len(valid), size=batch_size)
+    invalid = ~valid[idxs]
+    while invalid.any():
+        idxs[invalid] = np.random.randint(0, len(valid), size=invalid.sum())
+        invalid = ~valid[idxs]
+    return idxs
+
+
+def prioritized_indexes(tree, batch_size, size, beta=0.4):
+    # the index draw and weights of CustomMemoryBuffer.sample_prioritized
+    total   = tree.total()
+    targets = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+    idxs    = tree.find(targets)
+    weights = (size * tree.get(idxs) / total) ** -beta
+    return idxs, weights / weights.max()
+
+
+def fill_buffer(memory, steps, episode_length=500):
+    state = np.random.randint(0, 255, (memory.k * 3, 84, 84), dtype=np.uint8)
+    for step in range(steps):
+        memory.add(state=state, action=np.random.uniform(-1, 1, 6), reward=1.0, next_state=state, done=(step + 1) % episode_length == 0)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--capacity",        type=int, default=1_000_000)
+    parser.add_argument("--buffer_capacity", type=int, default=20_000)  # frames are 21 KB each, this one is allocated for real
+    parser.add_argument("--batch_size",      type=int, default=32)
+    parser.add_argument("--repetitions",     type=int, default=2000)
+    args = parser.parse_args()
+
+    # ---------- index draw over capacity slots ----------
+    valid = np.ones(args.capacity, dtype=bool)
+    valid[::500] = False  # the newest frame of each episode is not a transition
+
+    tree  = SumTree(args.capacity)
+    start = time.perf_counter()
+    tree.update(np.arange(args.capacity), np.where(valid, np.random.random(args.capacity) ** 0.6, 0.0))
+    print(f"sum tree of {args.capacity} priorities: {tree.tree.nbytes / 1e6:.1f} MB, built in {time.perf_counter() - start:.2f} s")
+
+    uniform_time     = time_call(lambda: uniform_indexes(valid, args.batch_size), args.repetitions)
+    prioritized_time = time_call(lambda: prioritized_indexes(tree, args.batch_size, args.capacity), args.repetitions)
+    print(f"index draw, batch {args.batch_size}:  uniform {uniform_time:.1f} us ({1e6 / uniform_time:.0f} batches/s) | "
+          f"prioritized {prioritized_time:.1f} us ({1e6 / prioritized_time:.0f} batches/s)")
+
+    batch_idxs  = np.random.randint(0, args.capacity, size=args.batch_size)
+    update_time = time_call(lambda: tree.update(batch_idxs, np.random.random(args.batch_size)), args.repetitions)
+    insert_time = time_call(lambda: tree.update(np.atleast_1d(np.random.randint(args.capacity)), 1.0), args.repetitions)
+    print(f"priority update: batch of {args.batch_size} {update_time:.1f} us | one slot {insert_time:.1f} us")
+
+    # ---------- whole batches from a CustomMemoryBuffer ----------
+    uniform_memory     = CustomMemoryBuffer(6, max_capacity=args.buffer_capacity, k=3)
+    prioritized_memory = CustomMemoryBuffer(6, max_capacity=args.buffer_capacity, k=3, prioritized=True)
+
+    uniform_add_time     = time_call(lambda: fill_buffer(uniform_memory, 100), args.buffer_capacity // 100) / 100
+    prioritized_add_time = time_call(lambda: fill_buffer(prioritized_memory, 100), args.buffer_capacity // 100) / 100
+    print(f"add, per transition:  uniform {uniform_add_time:.1f} us | prioritized {prioritized_add_time:.1f} us")
+
+    uniform_time     = time_call(lambda: uniform_memory.sample(args.batch_size), args.repetitions)
+    prioritized_time = time_call(lambda: prioritized_memory.sample_prioritized(args.batch_size), args.repetitions)
+    print(f"full batch, batch {args.batch_size}:  uniform {uniform_time:.1f} us ({1e6 / uniform_time:.0f} batches/s) | "
+          f"prioritized {prioritized_time:.1f} us ({1e6 / prioritized_time:.0f} batches/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-step latency of the surprise rate and of one predictive model update,
+looping over independent EPDM members (previous version) against the fused EPDMEnsemble.
+
+python benchmark_surprise.py --repetitions 500
+"""
+import time
+import torch
+import numpy as np
+import torch.nn as nn
+import torch.nn.functional as F
+from argparse import ArgumentParser
+
+from networks import Encoder
+from networks import EPDM
+from networks import EPDMEnsemble
+
+
+def copy_members_to_ensemble(members, ensemble):
+    # stack the weights of the independent members into the fused layers, so both versions predict the same
+    fused_layers  = [layer for layer in ensemble.prediction_net if hasattr(layer, "weight")]
+    member_layers = [[layer for layer in member.prediction_net if isinstance(layer, nn.Linear)] for member in members]
+    with torch.no_grad():
+        for i, fused in enumerate(fused_layers):
+            for m, layers in enumerate(member_layers):
+                fused.weight[m].copy_(layers[i].weight.t())
+                fused.bias[m, 0].copy_(layers[i].bias)
+
+
+def surprise_loop(encoder, members, state, action, next_state):
+    with torch.no_grad():
+        latent_state      = encoder(state, detach=True)
+        latent_next_state = encoder(next_state, detach=True)
+        predict_vector_set = []
+        for network in members:
+            network.eval()
+            predicted_vector = network(latent_state, action)
+            predict_vector_set.append(predicted_vector.detach().cpu().numpy())
+        ensemble_vector = np.concatenate(predict_vector_set, axis=0)
+        z_next_latent_prediction = np.mean(ensemble_vector, axis=0)
+        z_next_latent_true       = latent_next_state.detach().cpu().numpy()[0]
+        mse = (np.square(z_next_latent_prediction - z_next_latent_true)).mean()
+    return mse
+
+
+def surprise_fused(encoder, ensemble, state, action, next_state):
+    with torch.no_grad():
+        latent_state      = encoder(state, detach=True)
+        latent_next_state = encoder(next_state, detach=True)
+        ensemble_vector   = ensemble(latent_state, action)
+        mse = (ensemble_vector.mean(dim=0) - latent_next_state).pow(2).mean(dim=1)
+    return mse[0].item()
+
+
+def train_loop(members, optimizers, latent_state, action, latent_next_state):
+    for network, optimizer in zip(members, optimizers):
+        loss = F.mse_loss(network(latent_state, action), latent_next_state)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+
+def train_fused(ensemble, optimizer, latent_state, action, latent_next_state):
+    prediction = ensemble(latent_state, action)
+    loss = F.mse_loss(prediction, latent_next_state.expand_as(prediction), reduction='none').mean(dim=(1, 2)).sum()
+    optimizer.zero_grad()
+    loss.backward()
+    optimizer.step()
+
+
+def time_call(function, repetitions, device):
+    for _ in range(10):
+        function()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repetitions * 1e3  # ms per call
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--repetitions",   type=int, default=500)
+    parser.add_argument("--batch_size",    type=int, default=32)
+    parser.add_argument("--ensemble_size", type=int, default=5)
+    parser.add_argument("--action_num",    type=int, default=2)
+    args = parser.parse_args()
+
+    device      = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    latent_size = 50
+
+    encoder  = Encoder(latent_dim=latent_size, k=9).to(device)
+    members  = nn.ModuleList([EPDM(latent_size, args.action_num) for _ in range(args.ensemble_size)]).to(device)
+    ensemble = EPDMEnsemble(latent_size, args.action_num, args.ensemble_size).to(device)
+    copy_members_to_ensemble(members, ensemble)
+
+    state      = torch.randint(0, 255, (1, 9, 84, 84), device=device).float()
+    next_state = torch.randint(0, 255, (1, 9, 84, 84), device=device).float()
+    action     = torch.rand(1, args.action_num, device=device) * 2 - 1
+
+    loop_value  = surprise_loop(encoder, members, state, action, next_state)
+    fused_value = surprise_fused(encoder, ensemble, state, action, next_state)
+    print(f"surprise rate: loop {loop_value:.6f} | fused {fused_value:.6f}")
+
+    loop_time  = time_call(lambda: surprise_loop(encoder, members, state, action, next_state), args.repetitions, device)
+    fused_time = time_call(lambda: surprise_fused(encoder, ensemble, state, action, next_state), args.repetitions, device)
+    print(f"surprise per env step ({device}):   loop {loop_time:.3f} ms | fused {fused_time:.3f} ms")
+
+    latent_state      = torch.rand(args.batch_size, latent_size, device=device)
+    latent_next_state = torch.rand(args.batch_size, latent_size, device=device)
+    actions           = torch.rand(args.batch_size, args.action_num, device=device)
+
+    optimizers = [torch.optim.Adam(member.parameters(), lr=1e-4, weight_decay=1e-3) for member in members]
+    optimizer  = torch.optim.Adam(ensemble.parameters(), lr=1e-4, weight_decay=1e-3)
+
+    loop_time  = time_call(lambda: train_loop(members, optimizers, latent_state, actions, latent_next_state), args.repetitions, device)
+    fused_time = time_call(lambda: train_fused(ensemble, optimizer, latent_state, actions, latent_next_state), args.repetitions, device)
+    print(f"predictive model update ({device}): loop {loop_time:.3f} ms | fused {fused_time:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
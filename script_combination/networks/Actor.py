@@ -31,6 +31,10 @@ class Actor(nn.Module):
 
     def forward(self, state, detach_encoder=False):
         z_vector = self.encoder_net(state, detach=detach_encoder)
+        output   = self.forward_latent(z_vector)
+        return output
+
+    def forward_latent(self, z_vector):
         # output   = F.relu(self.h_linear_1(z_vector))
         # output   = F.relu(self.h_linear_2(output))
         # output   = torch.tanh(self.h_linear_3(output))
@@ -42,7 +42,11 @@ class Critic(nn.Module):
         self.apply(weight_init)
 
     def forward(self, state, action, detach_encoder=False):
-        z_vector   = self.encoder_net(state, detach=detach_encoder)
+        z_vector = self.encoder_net(state, detach=detach_encoder)
+        q1, q2   = self.forward_latent(z_vector, action)
+        return q1, q2
+
+    def forward_latent(self, z_vector, action):
         obs_action = torch.cat([z_vector, action], dim=1)
 
         # q1 = F.relu(self.h_linear_1(obs_action))
@@ -31,3 +31,52 @@ class EPDM(nn.Module):
         x   = torch.cat([state, action], dim=1)
         out = self.prediction_net(x)
         return out
+
+
+class EnsembleLinear(nn.Module):
+    """
+    Linear layer for a whole ensemble, weights stacked as (ensemble_size, in, out) and applied with one batched matmul
+    """
+    def __init__(self, ensemble_size, in_features, out_features):
+        super(EnsembleLinear, self).__init__()
+
+        self.weight = nn.Parameter(torch.empty(ensemble_size, in_features, out_features))
+        self.bias   = nn.Parameter(torch.zeros(ensemble_size, 1, out_features))
+
+        # same orthogonal init of weight_init, drawn independently for each member
+        for member in range(ensemble_size):
+            weight = torch.empty(out_features, in_features)
+            nn.init.orthogonal_(weight)
+            self.weight.data[member].copy_(weight.t())
+
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)  # (ensemble_size, batch, in) --> (ensemble_size, batch, out)
+
+
+class EPDMEnsemble(nn.Module):
+    """
+    Fused version of ensemble_size independent EPDM models.
+    Members do not share parameters, and Adam and its weight decay act element-wise, so training the summed member
+    losses with a single optimizer updates each member exactly as its own optimizer would.
+    """
+    def __init__(self, latent_size, num_actions, ensemble_size=5):
+        super(EPDMEnsemble, self).__init__()
+
+        self.ensemble_size = ensemble_size
+        self.input_dim     = latent_size + num_actions
+        self.output_dim    = latent_size
+        self.hidden_size   = [512, 512]
+
+        self.prediction_net = nn.Sequential(
+            EnsembleLinear(self.ensemble_size, self.input_dim, self.hidden_size[0]),
+            nn.ReLU(),
+            EnsembleLinear(self.ensemble_size, self.hidden_size[0], self.hidden_size[1]),
+            nn.ReLU(),
+            EnsembleLinear(self.ensemble_size, self.hidden_size[1], self.output_dim),
+        )
+
+    def forward(self, state, action):
+        x   = torch.cat([state, action], dim=1)
+        x   = x.unsqueeze(0).expand(self.ensemble_size, -1, -1)
+        out = self.prediction_net(x)  # --> (ensemble_size, batch, latent_size)
+        return out
@@ -3,4 +3,5 @@ from .Critic import Critic
 from .Decoder import Decoder
 from .Encoder import Encoder
 from .EPPM import EPPM
-from .EPDM import EPDM
\ No newline at end of file
+from .EPDM import EPDM
+from .EPDM import EPDMEnsemble
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Plots a metrics file written by MetricsLog, offline, so the training loops only append to it.
+It only reads the CSV, so it also plots the files of 4DoF_Gripper and model_base_autoencoder_td3.
+
+python plot_metrics.py data_plots/<file_name> --x step --y episode_reward
+python plot_metrics.py plots/<file_name>_intrinsic_values --x step --y novelty_rate surprise_rate --show
+python plot_metrics.py ../model_base_autoencoder_td3/data_plots/<file_name> --x episode --y reward
+"""
+import pandas as pd
+import matplotlib.pyplot as plt
+from argparse import ArgumentParser
+
+
+def plot_metrics(path, x, y, output=None, title=None, show=False):
+    data = pd.read_csv(path)
+    data.plot(x=x, y=y, title=title if title is not None else path)
+    plt.savefig(output if output is not None else f"{path}.png")
+    if show:
+        plt.show()
+    plt.close()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("path", type=str)
+    parser.add_argument("--x", type=str, default="step")
+    parser.add_argument("--y", type=str, nargs="+", default=["episode_reward"])
+    parser.add_argument("--output", type=str, default=None)  # <path>.png by default
+    parser.add_argument("--title",  type=str, default=None)
+    parser.add_argument("--show",   action="store_true")
+    args = parser.parse_args()
+
+    plot_metrics(args.path, args.x, args.y, args.output, args.title, args.show)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+
+import numpy as np
+import pytest
+
+from Custom_Memory import CustomMemoryBuffer
+
+
+def fill(memory, steps, episode_length):
+    state = np.zeros((memory.k * 3, 84, 84), dtype=np.uint8)
+    for step in range(steps):
+        memory.add(state=state, action=np.zeros(6), reward=1.0, next_state=state, done=(step + 1) % episode_length == 0)
+
+
+def test_sample_without_transitions():
+    memory = CustomMemoryBuffer(6, max_capacity=100, k=3)
+    with pytest.raises(ValueError):
+        memory.sample(32)
+
+
+def test_sample_draws_valid_slots():
+    memory = CustomMemoryBuffer(6, max_capacity=100, k=3)
+    fill(memory, 30, episode_length=10)
+    idxs = memory.uniform_idxs(256)
+    assert memory.valid[idxs].all()
+
+
+def test_sample_single_transition():
+    # half the slots are invalid, a batch this large always has draws left for the fallback
+    memory = CustomMemoryBuffer(6, max_capacity=100, k=3)
+    fill(memory, 1, episode_length=1)
+    idxs = memory.uniform_idxs(10_000)
+    assert memory.valid[idxs].all()
+
+
+def test_restore_memmap_after_wrap(tmp_path):
+    # with storage_dir, the slots written after the checkpoint must not leak into the restored buffer
+    memory = CustomMemoryBuffer(6, max_capacity=50, k=3, storage_dir=str(tmp_path / "buffer"))
+    for step in range(80):
+        state = np.full((9, 84, 84), step % 256, dtype=np.uint8)
+        memory.add(state=state, action=np.full(6, step), reward=float(step), next_state=state, done=(step + 1) % 10 == 0)
+
+    snapshot = memory.snapshot(str(tmp_path / "checkpoint"))
+    frames, actions = memory.frames.copy(), memory.actions.copy()
+
+    for step in range(60):
+        state = np.full((9, 84, 84), 255, dtype=np.uint8)
+        memory.add(state=state, action=np.full(6, -1), reward=-1.0, next_state=state, done=(step + 1) % 7 == 0)
+
+    memory.restore(str(tmp_path / "checkpoint"), snapshot)
+    valid = np.flatnonzero(memory.valid)
+    assert len(valid) > 0
+    assert (memory.frames[valid] == frames[valid]).all()
+    assert (memory.actions[valid] == actions[valid]).all()
+
+
+def test_sample_prioritized_without_transitions():
+    memory = CustomMemoryBuffer(6, max_capacity=100, k=3, prioritized=True)
+    with pytest.raises(ValueError):
+        memory.sample_prioritized(32)
+
+    # every transition waits for its intrinsic reward, none holds a priority yet
+    state = np.zeros((9, 84, 84), dtype=np.uint8)
+    for step in range(5):
+        memory.add(state=state, action=np.zeros(6), reward=1.0, next_state=state, done=False, pending=True)
+    with pytest.raises(ValueError):
+        memory.sample_prioritized(32)
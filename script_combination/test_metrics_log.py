@@ -0,0 +1,25 @@
+
+import numpy as np
+
+from Metrics_Log import MetricsLog
+
+
+def test_resume_truncates_to_checkpoint(tmp_path):
+    path = str(tmp_path / "run")
+    log  = MetricsLog(path, ["step", "episode_reward"])
+    for step in range(5):
+        log.append(step=step, episode_reward=1.0)
+    size = log.file_size()  # the checkpoint is taken here
+
+    for step in range(5, 8):
+        log.append(step=step, episode_reward=2.0)
+    log.flush()  # rows written before the preemption
+
+    log = MetricsLog(path, ["step", "episode_reward"], append=True, truncate=size)
+    for step in range(5, 10):
+        log.append(step=step, episode_reward=3.0)
+    log.flush()
+
+    rows = np.loadtxt(path, delimiter=",", skiprows=1)
+    assert (rows[:, 0] == np.arange(10)).all()
+    assert (rows[5:, 1] == 3.0).all()
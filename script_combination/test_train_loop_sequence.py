@@ -0,0 +1,45 @@
+
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dm_control")
+from train_loop_sequence import train
+
+
+class SetupDone(Exception):
+    pass
+
+
+class SetupEnv:
+    # stops train() at the first reset, everything before it is the setup of the run
+    def action_spec(self):
+        return types.SimpleNamespace(shape=(6,), maximum=np.ones(6), minimum=-np.ones(6))
+
+    def reset(self):
+        raise SetupDone
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "plots").mkdir()
+    return tmp_path
+
+
+@pytest.mark.parametrize("options", [
+    dict(intrinsic_on=True, intrinsic_at_sample=True),
+    dict(intrinsic_on=False, priority_source="surprise"),
+])
+def test_n_step_setup_without_prioritized(run_dir, options):
+    agent = types.SimpleNamespace(gamma=0.99)
+    with pytest.raises(SetupDone):
+        train(SetupEnv(), agent, "test", number_stack_frames=3, buffer_dir=str(run_dir / "replay"), n_step=3, **options)
+
+
+def test_n_step_setup_prioritized_surprise(run_dir):
+    agent = types.SimpleNamespace(gamma=0.99)
+    with pytest.raises(ValueError):
+        train(SetupEnv(), agent, "test", intrinsic_on=False, number_stack_frames=3, buffer_dir=str(run_dir / "replay"), n_step=3,
+              prioritized=True, priority_source="surprise")
@@ -0,0 +1,183 @@
+
+import os
+import time
+import queue
+import torch
+import random
+import torch.multiprocessing as mp
+from datetime import datetime
+
+import logging
+logging.basicConfig(level=logging.INFO)
+from argparse import ArgumentParser
+
+from dm_control import suite
+from Algorithm import Algorithm
+from FrameStack_DMCS import FrameStack
+from Custom_Memory import CustomMemoryBuffer
+from Async_Actor import SharedPolicy, actor_worker
+from Metrics_Log import MetricsLog
+from train_loop_control_suite import evaluation_loop
+from train_loop_vector_control_suite import sample_memories
+
+import numpy as np
+
+
+def define_parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--intrinsic', type=bool, default=False)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env',  type=str, default="ball_in_cup")
+    parser.add_argument('--task', type=str, default="catch")
+    parser.add_argument('--num_actors', type=int, default=4)        # collecting processes, one dm_control instance each
+    parser.add_argument('--sync_interval', type=int, default=100)   # learner updates between two publications of the policy
+    parser.add_argument('--action_repeat', type=int, default=1)     # physics steps per agent decision, only the last one is rendered
+    args   = parser.parse_args()
+    return args
+
+
+def train(eval_env, agent, file_name, intrinsic_on, number_stack_frames, domain_name, task_name, seed, num_actors, sync_interval, action_repeat=1):
+    # Hyperparameters
+    # ------------------------------------#
+    max_steps_training    = 1_000_000
+    max_steps_exploration = 1_000
+
+    batch_size = 32
+    G          = 5    # update-to-data ratio, kept by the throttle instead of lockstep
+    max_lag    = 200  # transitions the actors can collect ahead of the G ratio before they wait for the learner
+    k          = number_stack_frames
+    # ------------------------------------#
+
+    action_size  = eval_env.action_spec().shape[0]
+    memories     = [CustomMemoryBuffer(action_size, max_capacity=int(1e6) // num_actors, k=k) for _ in range(num_actors)]
+    frames_stack = FrameStack(eval_env, k, action_repeat)
+
+    # Actor processes
+    # ------------------------------------#
+    context       = mp.get_context("spawn")  # a forked copy of a rendering context is not safe to use
+    shared_policy = SharedPolicy(agent.actor, context)
+    transitions   = context.Queue(maxsize=1_000)
+    env_steps     = context.Value('l', 0)
+    updates       = context.Value('l', 0)
+    stop          = context.Value('b', False)
+    settings      = {"G": G, "max_lag": max_lag, "max_steps_exploration": max_steps_exploration, "action_repeat": action_repeat}
+
+    actors = []
+    for actor_idx in range(num_actors):
+        process = context.Process(
+            target=actor_worker,
+            args=(actor_idx, domain_name, task_name, seed + actor_idx, k, agent.latent_size, shared_policy, transitions, (env_steps, updates, stop), settings),
+            daemon=True)
+        process.start()
+        actors.append(process)
+    # ------------------------------------#
+
+    # Learner Loop
+    # ------------------------------------#
+    total_step_counter = 0  # physics steps of the transitions added to the memories, action_repeat per transition
+    update_counter     = 0
+    episode_num        = 0
+    historical_reward  = MetricsLog(f"data_plots/{file_name}", ["step", "episode_reward"])  # plot it with plot_metrics.py
+    start_time = time.time()
+
+    try:
+        while total_step_counter < max_steps_training:
+            # learn while the update-to-data ratio allows it, otherwise wait for the actors
+            can_learn = total_step_counter >= max_steps_exploration and update_counter < G * (total_step_counter - max_steps_exploration) // action_repeat
+            try:
+                message = transitions.get_nowait() if can_learn else transitions.get(timeout=1.0)
+            except queue.Empty:
+                message = None
+
+            if message is not None:
+                kind, actor_idx, data = message
+                if kind == "transition":
+                    state, action, reward_extrinsic, next_state, done = data
+                    if intrinsic_on and total_step_counter >= max_steps_exploration:
+                        a = 0.5
+                        b = 0.5
+                        surprise_rate, novelty_rate = agent.get_intrinsic_values(state, action, next_state)
+                        total_reward = reward_extrinsic + surprise_rate * a + novelty_rate * b
+                    else:
+                        total_reward = reward_extrinsic
+                    memories[actor_idx].add(state=state, action=action, reward=total_reward, next_state=next_state, done=done)
+                    total_step_counter += action_repeat
+                else:
+                    episode_reward, episode_timesteps = data
+                    episode_duration = time.time() - start_time
+                    start_time       = time.time()
+
+                    logging.info(f"Total T:{total_step_counter} | Episode {episode_num + 1} (actor {actor_idx}) was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f} | Updates= {update_counter} | Duration= {episode_duration:.2f} Seg")
+                    historical_reward.append(step=total_step_counter, episode_reward=episode_reward)
+                    episode_num += 1
+
+                    if episode_num % 10 == 0:
+                        historical_reward.flush()
+                        print("--------------------------------------------")
+                        evaluation_loop(eval_env, agent, frames_stack, total_step_counter, file_name)
+                        print("--------------------------------------------")
+
+            if can_learn:
+                states, actions, rewards, next_states, dones = sample_memories(memories, batch_size)
+
+                agent.train_policy((states, actions, rewards, next_states, dones))
+
+                if intrinsic_on:
+                    agent.train_predictive_model((states, actions, next_states))
+
+                update_counter += 1
+                updates.value = update_counter
+                if update_counter % sync_interval == 0:
+                    shared_policy.publish(agent.actor)
+    finally:
+        stop.value = True
+        for process in actors:
+            process.join()
+
+    agent.save_models(filename=file_name)
+    historical_reward.flush()
+
+
+def main():
+    args   = define_parse_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    domain_name = args.env
+    task_name   = args.task
+    seed        = args.seed
+
+    # the actors use the seeds seed ... seed + num_actors - 1, the evaluation env runs here in the learner process
+    eval_env    = suite.load(domain_name, task_name, task_kwargs={'random': seed + args.num_actors})
+    action_size = eval_env.action_spec().shape[0]
+    latent_size = 50
+    number_stack_frames = 3
+
+    # Create Directories
+    # ---------------------------------------
+    for directory in ("videos", "plots", "data_plots"):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # set seeds
+    #---------------------------------------
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    #---------------------------------------
+
+    agent = Algorithm(
+        latent_size=latent_size,
+        action_num=action_size,
+        device=device,
+        k=number_stack_frames)
+
+    intrinsic_on  = args.intrinsic
+    date_time_str = datetime.now().strftime("%m_%d_%H_%M")
+    file_name     = domain_name + "_" + str(date_time_str) + "_" + task_name + "_" + "NASA_TD3" + "_Intrinsic_" + str(intrinsic_on) + "_Async_" + str(args.num_actors)
+
+    train(eval_env, agent, file_name, intrinsic_on, number_stack_frames, domain_name, task_name, seed, args.num_actors, args.sync_interval, args.action_repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -92,7 +92,8 @@ def train(env, agent,  file_name, intrinsic_on, number_stack_frames):
         else:
             total_reward = reward_extrinsic
 
-        memory.add(state=state, action=action, reward=total_reward, next_state=next_state, done=done)
+        # the stacks are views of the FrameStack ring, the MemoryBuffer keeps references so it gets copies
+        memory.add(state=state.copy(), action=action, reward=total_reward, next_state=next_state.copy(), done=done)
         state = next_state
 
         episode_reward += reward_extrinsic  # just for plotting and evaluation purposes use the reward as it is
@@ -1,6 +1,5 @@
 
 import os
-import cv2
 import time
 import torch
 import random
@@ -10,25 +9,20 @@ import logging
 logging.basicConfig(level=logging.INFO)
 from dm_control import suite
 
-from cares_reinforcement_learning.memory import MemoryBuffer
-
 
 from Algorithm import Algorithm
 from FrameStack_DMCS import FrameStack
+from Custom_Memory import CustomMemoryBuffer
+from Prefetch_Sampler import PrefetchSampler
+from Intrinsic_Reward import IntrinsicRewardEngine, IntrinsicRewardCache
+from Video_Recorder import VideoRecorder
+from Evaluation_Worker import EvaluationWorker
+from Metrics_Log import MetricsLog
 
 
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
-def plot_reward_curve(data_reward, filename):
-    data = pd.DataFrame.from_dict(data_reward)
-    data.to_csv(f"data_plots/{filename}", index=False)
-    data.plot(x='step', y='episode_reward', title="Reward Curve")
-    plt.title(filename)
-    plt.savefig(f"plots/{filename}.png")
-    plt.close()
-
 def plot_reconstruction_img(original, reconstruction):
     input_img      = original[0]/255
     reconstruction = reconstruction[0]
@@ -45,7 +39,7 @@ def plot_reconstruction_img(original, reconstruction):
     plt.imshow(difference, vmin=0, vmax=1)
     plt.pause(0.01)
 
-def train(env, agent, file_name, intrinsic_on, number_stack_frames):
+def train(env, agent, file_name, intrinsic_on, number_stack_frames, domain_name, task_name, seed):
     # Hyperparameters
     # ------------------------------------#
     max_steps_training    = 1_000_000
@@ -54,6 +48,13 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
     batch_size = 32
     G          = 5
     k          = number_stack_frames
+    buffer_dir = None  # folder to keep the replay buffer on disk as np.memmap files, None keeps it in RAM
+    prefetch_batches = 0  # batches drawn ahead by a background thread, 0 samples in the loop
+    intrinsic_batch  = 32  # transitions scored together, they become sampleable up to this many steps later
+    intrinsic_at_sample = False  # store the extrinsic reward only and recompute the intrinsic one for each sampled batch
+    intrinsic_staleness = 1000   # updates a cached intrinsic reward is reused for before it is recomputed
+    action_repeat = 1  # physics steps per agent decision, the step counters and limits above are in physics steps
+    evaluation_in_worker = True  # evaluate in a separate process while training goes on, False pauses the training for it
     # ------------------------------------#
 
     # Action size and format
@@ -66,8 +67,15 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
 
     # Needed classes
     # ------------------------------------#
-    memory       = MemoryBuffer()
-    frames_stack = FrameStack(env, k)
+    memory       = CustomMemoryBuffer(action_size, k=k, storage_dir=buffer_dir)
+    frames_stack = FrameStack(env, k, action_repeat)
+    sampler      = PrefetchSampler(memory, batch_size, prefetch=prefetch_batches) if prefetch_batches > 0 else None
+    intrinsic    = IntrinsicRewardEngine(agent, memory, batch_size=intrinsic_batch, surprise_weight=0.5, novelty_weight=0.5)
+    intrinsic_cache = IntrinsicRewardCache(agent, memory, max_staleness=intrinsic_staleness, surprise_weight=0.5, novelty_weight=0.5)
+    evaluator       = None
+    if evaluation_in_worker:
+        evaluator = EvaluationWorker(domain_name, task_name, seed, k, agent.latent_size, log_file=f"data_plots/{file_name}_evaluation",
+                                     video_name=f"videos/{file_name}_{{step}}.mp4", num_episodes=1, action_repeat=action_repeat)
     # ------------------------------------#
 
     # Training Loop
@@ -75,11 +83,11 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
     episode_timesteps = 0
     episode_reward    = 0
     episode_num       = 0
-    historical_reward = {"step": [], "episode_reward": []}
+    historical_reward = MetricsLog(f"data_plots/{file_name}", ["step", "episode_reward"])  # plot it with plot_metrics.py
     start_time = time.time()
     state      = frames_stack.reset()  # for 3 images with color, unit8 , (9, 84 , 84)
 
-    for total_step_counter in range(int(max_steps_training)):
+    for total_step_counter in range(0, int(max_steps_training), action_repeat):
         episode_timesteps += 1
         if total_step_counter < max_steps_exploration:
             logging.info(f"Running Exploration Steps {total_step_counter}/{max_steps_exploration}")
@@ -89,18 +97,11 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
 
         next_state, reward_extrinsic, done = frames_stack.step(action)
 
-        if intrinsic_on and total_step_counter >= max_steps_exploration:
-            a = 0.5
-            b = 0.5
-            surprise_rate, novelty_rate = agent.get_intrinsic_values(state, action, next_state)
-            reward_surprise = surprise_rate * a
-            reward_novelty  = novelty_rate  * b
-            #logging.info(f"Surprise Rate = {reward_surprise},  Novelty Rate = {reward_novelty}, Normal Reward = {reward_extrinsic}, {total_step_counter}")
-            total_reward = reward_extrinsic + reward_surprise + reward_novelty
-        else:
-            total_reward = reward_extrinsic
-
-        memory.add(state=state, action=action, reward=total_reward, next_state=next_state, done=done)
+        # the surprise and novelty rewards are added later by the intrinsic engine, a batch at a time
+        score_intrinsic = intrinsic_on and not intrinsic_at_sample and total_step_counter >= max_steps_exploration
+        slot = memory.add(state=state, action=action, reward=reward_extrinsic, next_state=next_state, done=done, pending=score_intrinsic)
+        if score_intrinsic:
+            intrinsic.add(slot, total_step_counter)
         state = next_state
 
         episode_reward += reward_extrinsic  # just for plotting purposes use this reward as it is
@@ -108,30 +109,25 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
         if total_step_counter >= max_steps_exploration:
             #num_updates = max_steps_exploration if total_step_counter == max_steps_exploration else G
             for _ in range(G):
-                experience = memory.sample(batch_size)
+                if intrinsic_at_sample and intrinsic_on:
+                    # the replay holds the extrinsic reward only, train_policy adds the (cached) intrinsic one
+                    experiences, intrinsic_reward = intrinsic_cache.sample(batch_size)
+                else:
+                    experiences      = memory.sample(batch_size) if sampler is None else sampler.sample()
+                    intrinsic_reward = None
+                states, actions, rewards, next_states, dones = experiences
 
-                agent.train_policy((
-                    experience['state'],
-                    experience['action'],
-                    experience['reward'],
-                    experience['next_state'],
-                    experience['done'],
-                ))
+                agent.train_policy((states, actions, rewards, next_states, dones), intrinsic_reward)
 
                 if intrinsic_on:
-                    agent.train_predictive_model((
-                        experience['state'],
-                        experience['action'],
-                        experience['next_state']
-                    ))
+                    agent.train_predictive_model((states, actions, next_states))
 
         if done:
             episode_duration = time.time() - start_time
             start_time       = time.time()
 
-            logging.info(f"Total T:{total_step_counter + 1} | Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f} | Duration= {episode_duration:.2f} Seg")
-            historical_reward["step"].append(total_step_counter)
-            historical_reward["episode_reward"].append(episode_reward)
+            logging.info(f"Total T:{total_step_counter + action_repeat} | Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f} | Duration= {episode_duration:.2f} Seg")
+            historical_reward.append(step=total_step_counter, episode_reward=episode_reward)
 
             state = frames_stack.reset()
             episode_reward    = 0
@@ -139,13 +135,23 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
             episode_num      += 1
 
             if episode_num % 10 == 0:
-                plot_reward_curve(historical_reward, filename=file_name)
-                print("--------------------------------------------")
-                evaluation_loop(env, agent, frames_stack, total_step_counter, file_name)
-                print("--------------------------------------------")
+                historical_reward.flush()
+                if evaluator is not None:
+                    # a snapshot of the actor is evaluated in the worker process while training goes on
+                    evaluator.submit(total_step_counter + action_repeat, agent.actor)
+                else:
+                    print("--------------------------------------------")
+                    evaluation_loop(env, agent, frames_stack, total_step_counter, file_name)
+                    print("--------------------------------------------")
 
     agent.save_models(filename=file_name)
-    plot_reward_curve(historical_reward, filename=file_name)
+    historical_reward.flush()
+    intrinsic.score()  # the transitions still waiting for their intrinsic reward
+    memory.flush()
+    if sampler is not None:
+        sampler.close()
+    if evaluator is not None:
+        evaluator.close()  # waits for the evaluations still queued
 
 
 
@@ -156,20 +162,18 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name):
     episode_num       = 0
 
     state = frames_stack.reset()
-    frame = grab_frame(env)
 
     fps = 30
     video_name = f'videos/{file_name}_{total_counter+1}.mp4'
-    height, width, channels = frame.shape
-    video = cv2.VideoWriter(video_name, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    video = VideoRecorder(video_name, fps, max_episodes=None, frame_skip=1)  # encodes in its own thread
 
-    for total_step_counter in range(int(max_steps_evaluation)):
+    for total_step_counter in range(0, int(max_steps_evaluation), frames_stack.action_repeat):
         episode_timesteps += 1
         action = agent.select_action_from_policy(state, evaluation=True)
         state, reward_extrinsic, done = frames_stack.step(action)
         episode_reward += reward_extrinsic
 
-        video.write(grab_frame(env))
+        video.capture(env)
 
         if done:
             #original_img, reconstruction = agent.get_reconstruction_for_evaluation(state)
@@ -177,17 +181,13 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name):
 
             logging.info(f" EVALUATION | Eval Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f}")
             state = frames_stack.reset()
+            video.end_episode()
             episode_reward    = 0
             episode_timesteps = 0
             episode_num       += 1
 
-    video.release()
-
+    video.close()
 
-def grab_frame(env):
-    frame = env.physics.render(camera_id=0, height=480, width=600)
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Convert to BGR for use with OpenCV
-    return frame
 
 
 def main():
@@ -236,7 +236,7 @@ def main():
     date_time_str = datetime.now().strftime("%m_%d_%H_%M")
     file_name     = domain_name + "_" + str(date_time_str) + "_" + task_name + "_" + "NASA_TD3" + "_Intrinsic_" + str(intrinsic_on)
 
-    train(env, agent, file_name, intrinsic_on, number_stack_frames)
+    train(env, agent, file_name, intrinsic_on, number_stack_frames, domain_name, task_name, seed)
 
 
 if __name__ == '__main__':
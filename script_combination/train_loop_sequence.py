@@ -1,6 +1,5 @@
 
 import os
-import cv2
 import time
 import torch
 import random
@@ -13,26 +12,18 @@ from argparse import ArgumentParser
 from dm_control import suite
 from Algorithm import Algorithm
 from FrameStack_DMCS import FrameStack
-from cares_reinforcement_learning.memory import MemoryBuffer
+from Custom_Memory import CustomMemoryBuffer
+from Prefetch_Sampler import PrefetchSampler
+from Intrinsic_Reward import IntrinsicRewardEngine, IntrinsicRewardCache
+from Prioritized_Replay import PrioritizedReplay
+from Video_Recorder import VideoRecorder
+from Metrics_Log import MetricsLog
+from Checkpoint import save_checkpoint, load_checkpoint
 
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
 
-def save_intrinsic_values(data_reward, filename):
-    data = pd.DataFrame.from_dict(data_reward)
-    data.to_csv(f"plots/{filename}_intrinsic_values", index=False)
-
-
-def plot_reward_curve(data_reward, filename):
-    data = pd.DataFrame.from_dict(data_reward)
-    data.to_csv(f"plots/{filename}", index=False)
-    data.plot(x='step', y='episode_reward', title="Reward Curve")
-    plt.title(filename)
-    plt.savefig(f"plots/{filename}.png")
-    plt.close()
-
 def plot_reconstruction_img(original, reconstruction):
     input_img      = original[0]/255
     reconstruction = reconstruction[0]
@@ -56,11 +47,25 @@ def define_parse_args():
     parser.add_argument('--seed', type=int, default=1)
     parser.add_argument('--env',  type=str, default="ball_in_cup")
     parser.add_argument('--task', type=str, default="catch")
+    parser.add_argument('--buffer_dir', type=str, default=None)  # keep the replay buffer on disk in this folder
+    parser.add_argument('--prefetch', type=int, default=0)  # batches drawn ahead by a background thread, 0 samples in the loop
+    parser.add_argument('--intrinsic_batch', type=int, default=32)  # transitions scored together for the intrinsic reward
+    parser.add_argument('--intrinsic_at_sample', type=bool, default=False)  # recompute the intrinsic reward of the sampled batches
+    parser.add_argument('--intrinsic_staleness', type=int, default=1000)    # updates a cached intrinsic reward stays valid
+    parser.add_argument('--action_repeat', type=int, default=1)  # physics steps per agent decision, only the last one is rendered
+    parser.add_argument('--checkpoint_dir', type=str, default=None)          # folder for the periodic checkpoints, None disables them
+    parser.add_argument('--checkpoint_interval', type=int, default=50_000)  # steps between two checkpoints, taken at the end of an episode
+    parser.add_argument('--resume', type=bool, default=False)               # continue the run saved in checkpoint_dir
+    parser.add_argument('--prioritized', type=bool, default=False)      # sample the replay in proportion to a priority, no prefetch then
+    parser.add_argument('--priority_source', type=str, default="td_error")  # td_error or surprise (ensemble prediction error)
+    parser.add_argument('--n_step', type=int, default=1)  # rewards summed in the critic target, e.g. 3 for sparse rewards as ball_in_cup catch (--intrinsic_at_sample batches stay 1-step)
     args   = parser.parse_args()
     return args
 
 
-def train(env, agent, file_name, intrinsic_on, number_stack_frames):
+def train(env, agent, file_name, intrinsic_on, number_stack_frames, buffer_dir=None, prefetch_batches=0, intrinsic_batch=32,
+          intrinsic_at_sample=False, intrinsic_staleness=1000, action_repeat=1, checkpoint_dir=None, checkpoint_interval=50_000, resume=False,
+          prioritized=False, priority_source="td_error", n_step=1):
 
     # Hyperparameters
     # ------------------------------------#
@@ -80,23 +85,49 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
 
     # Needed classes
     # ------------------------------------#
-    memory       = MemoryBuffer()
-    frames_stack = FrameStack(env, k)
+    memory       = CustomMemoryBuffer(action_size, k=k, storage_dir=buffer_dir, prioritized=prioritized, n_step=n_step, gamma=agent.gamma)
+    frames_stack = FrameStack(env, k, action_repeat)
+    sampler      = PrefetchSampler(memory, batch_size, prefetch=prefetch_batches) if prefetch_batches > 0 and not prioritized else None
+    intrinsic    = IntrinsicRewardEngine(agent, memory, batch_size=intrinsic_batch, surprise_weight=0.5, novelty_weight=0.5)
+    intrinsic_cache = IntrinsicRewardCache(agent, memory, max_staleness=intrinsic_staleness, surprise_weight=0.5, novelty_weight=0.5)
+    prioritized_replay = None
+    if prioritized:
+        prioritized_replay = PrioritizedReplay(agent, memory, source=priority_source, beta_updates=G * max_steps_training // action_repeat,
+                                               intrinsic_cache=intrinsic_cache if intrinsic_at_sample and intrinsic_on else None)
+    # ------------------------------------#
+
+    # Resume
+    # ------------------------------------#
+    start_step   = action_repeat
+    episode_num  = 0
+    metrics_size = {}
+    if resume:
+        # agent, optimizers, replay and RNG come back as they were, the run continues after its last checkpoint
+        loop_state   = load_checkpoint(checkpoint_dir, agent, memory)
+        start_step   = loop_state["total_step_counter"] + action_repeat
+        episode_num  = loop_state["episode_num"]
+        file_name    = loop_state["file_name"]  # keep writing the files of the run that is continued
+        metrics_size = loop_state.get("metrics_size", {})  # the rows logged after the checkpoint are logged again
+    last_checkpoint = start_step - action_repeat
     # ------------------------------------#
 
     # Training Loop
     # ------------------------------------#
     episode_timesteps = 0
     episode_reward    = 0
-    episode_num       = 0
 
-    historical_reward           = {"step": [], "episode_reward": []}
-    historical_intrinsic_reward = {"step": [], "novelty_rate": [], "surprise_rate": [], "extrinsic_reward": []}
+    # append-only files, plot them with plot_metrics.py
+    historical_reward           = MetricsLog(f"plots/{file_name}", ["step", "episode_reward"], append=resume, truncate=metrics_size.get("reward"))
+    historical_intrinsic_reward = None
+    if intrinsic_on:
+        historical_intrinsic_reward = MetricsLog(f"plots/{file_name}_intrinsic_values", ["step", "novelty_rate", "surprise_rate", "extrinsic_reward"],
+                                                 append=resume, truncate=metrics_size.get("intrinsic"))
 
     start_time        = time.time()
     state             = frames_stack.reset()  # for 3 images with color, unit8 , (9, 84 , 84)
 
-    for total_step_counter in range(1, int(max_steps_training)+1):
+    # the step counter and limits are in physics steps, a decision advances it by action_repeat
+    for total_step_counter in range(start_step, int(max_steps_training)+1, action_repeat):
         episode_timesteps += 1
 
         if total_step_counter <= max_steps_exploration:
@@ -107,24 +138,13 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
 
         next_state, reward_extrinsic, done = frames_stack.step(action)
 
-        if intrinsic_on and total_step_counter > max_steps_exploration:
-            a = 0.5
-            b = 0.5
-            surprise_rate, novelty_rate = agent.get_intrinsic_values(state, action, next_state)
-            reward_surprise = surprise_rate * a
-            reward_novelty  = novelty_rate * b
-            total_reward    = reward_extrinsic + reward_surprise + reward_novelty
-
-            historical_intrinsic_reward["step"].append(total_step_counter)
-            historical_intrinsic_reward["extrinsic_reward"].append(reward_extrinsic)
-            historical_intrinsic_reward["novelty_rate"].append(novelty_rate)
-            historical_intrinsic_reward["surprise_rate"].append(surprise_rate)
-            #logging.info(f"Surprise Rate = {reward_surprise},  Novelty Rate = {reward_novelty}, Normal Reward = {reward_extrinsic}, {total_step_counter}")
-
-        else:
-            total_reward = reward_extrinsic
-
-        memory.add(state=state, action=action, reward=total_reward, next_state=next_state, done=done)
+        # the surprise and novelty rewards are added later by the intrinsic engine, a batch at a time
+        score_intrinsic = intrinsic_on and not intrinsic_at_sample and total_step_counter > max_steps_exploration
+        slot = memory.add(state=state, action=action, reward=reward_extrinsic, next_state=next_state, done=done, pending=score_intrinsic)
+        if score_intrinsic:
+            intrinsic_values = intrinsic.add(slot, total_step_counter)
+            if intrinsic_values is not None:
+                historical_intrinsic_reward.extend(intrinsic_values)
         state = next_state
 
         episode_reward += reward_extrinsic  # just for plotting purposes use this reward as it is i.e. from env
@@ -132,46 +152,65 @@ def train(env, agent, file_name, intrinsic_on, number_stack_frames):
         if total_step_counter > max_steps_exploration:
             # num_updates = max_steps_exploration if total_step_counter == max_steps_exploration else G
             for _ in range(G):
-                experience = memory.sample(batch_size)
-                agent.train_policy((
-                    experience['state'],
-                    experience['action'],
-                    experience['reward'],
-                    experience['next_state'],
-                    experience['done'],
-                ))
+                weights, priorities = None, None
+                if prioritized:
+                    # drawn by priority, train_policy weights the critic loss and sets the new priorities of the batch
+                    experiences, intrinsic_reward, weights, priorities = prioritized_replay.sample(batch_size)
+                elif intrinsic_at_sample and intrinsic_on:
+                    # the replay holds the extrinsic reward only, train_policy adds the (cached) intrinsic one
+                    experiences, intrinsic_reward = intrinsic_cache.sample(batch_size)
+                else:
+                    experiences      = memory.sample(batch_size) if sampler is None else sampler.sample()
+                    intrinsic_reward = None
+                agent.train_policy(experiences, intrinsic_reward, weights, priorities)
 
                 if intrinsic_on:
-                    agent.train_predictive_model((
-                        experience['state'],
-                        experience['action'],
-                        experience['next_state']
-                    ))
+                    # the ensemble learns one step ahead, an n-step batch bootstraps from further away
+                    states, actions, _, next_states, _ = experiences if n_step == 1 else memory.sample(batch_size, n_step=1)
+                    agent.train_predictive_model((states, actions, next_states))
 
         if done:
             episode_duration = time.time() - start_time
             start_time       = time.time()
             logging.info(f"Total T:{total_step_counter} | Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f} | Duration= {episode_duration:.2f} Sec")
 
-            historical_reward["step"].append(total_step_counter)
-            historical_reward["episode_reward"].append(episode_reward)
+            historical_reward.append(step=total_step_counter, episode_reward=episode_reward)
 
             state = frames_stack.reset()
             episode_reward    = 0
             episode_timesteps = 0
             episode_num       += 1
 
+            if checkpoint_dir is not None and total_step_counter - last_checkpoint >= checkpoint_interval:
+                # nothing waits for its intrinsic reward and the metrics are on disk when the checkpoint is taken
+                intrinsic_values = intrinsic.score()
+                if intrinsic_values is not None:
+                    historical_intrinsic_reward.extend(intrinsic_values)
+                metrics_size = {"reward": historical_reward.file_size()}
+                if historical_intrinsic_reward is not None:
+                    metrics_size["intrinsic"] = historical_intrinsic_reward.file_size()
+                save_checkpoint(checkpoint_dir, agent, memory, {"total_step_counter": total_step_counter, "episode_num": episode_num, "file_name": file_name,
+                                                                "metrics_size": metrics_size})
+                last_checkpoint = total_step_counter
+
             if episode_num % 10 == 0:
                 print("*************--Evaluation--*************")
-                plot_reward_curve(historical_reward, filename=file_name)
+                historical_reward.flush()
+                if historical_intrinsic_reward is not None:
+                    historical_intrinsic_reward.flush()
                 evaluation_loop(env, agent, frames_stack, total_step_counter, file_name)
                 print("--------------------------------------------")
 
     agent.save_models(filename=file_name)
-    plot_reward_curve(historical_reward, filename=file_name)
-
-    if intrinsic_on:
-        save_intrinsic_values(historical_intrinsic_reward, file_name)
+    historical_reward.flush()
+    intrinsic_values = intrinsic.score()  # the transitions still waiting for their intrinsic reward
+    if intrinsic_values is not None:
+        historical_intrinsic_reward.extend(intrinsic_values)
+    if historical_intrinsic_reward is not None:
+        historical_intrinsic_reward.flush()
+    memory.flush()
+    if sampler is not None:
+        sampler.close()
     logging.info("All GOOD :)")
 
 
@@ -182,20 +221,18 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name):
     episode_num          = 0
 
     state = frames_stack.reset()
-    frame = grab_frame(env)
 
     fps = 30
     video_name = f'videos/{file_name}_{total_counter+1}.mp4'
-    height, width, channels = frame.shape
-    video = cv2.VideoWriter(video_name, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    video = VideoRecorder(video_name, fps, max_episodes=None, frame_skip=1)  # encodes in its own thread
 
-    for total_step_counter in range(int(max_steps_evaluation)):
+    for total_step_counter in range(0, int(max_steps_evaluation), frames_stack.action_repeat):
         episode_timesteps += 1
         action = agent.select_action_from_policy(state, evaluation=True)
         state, reward_extrinsic, done = frames_stack.step(action)
         episode_reward += reward_extrinsic
 
-        video.write(grab_frame(env))
+        video.capture(env)
 
         if done:
             original_img, reconstruction = agent.get_reconstruction_for_evaluation(state)
@@ -203,16 +240,12 @@ def evaluation_loop(env, agent, frames_stack, total_counter, file_name):
 
             logging.info(f" EVALUATION | Eval Episode {episode_num + 1} was completed with {episode_timesteps} steps | Reward= {episode_reward:.3f}")
             state = frames_stack.reset()
+            video.end_episode()
             episode_reward    = 0
             episode_timesteps = 0
             episode_num       += 1
-    video.release()
-
+    video.close()
 
-def grab_frame(env):
-    frame = env.physics.render(camera_id=0, height=480, width=600)
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Convert to BGR for use with OpenCV
-    return frame
 
 def main():
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -238,6 +271,10 @@ def main():
     dir_exists = os.path.exists("plot_results")
     if not dir_exists:
         os.makedirs("plot_results")
+
+    dir_exists = os.path.exists("plots")
+    if not dir_exists:
+        os.makedirs("plots")
     #------------------------------------------------
 
     # set seeds
@@ -261,7 +298,9 @@ def main():
     logging.info(f" File name for this training loop: {file_name}")
 
     logging.info("Initializing Training Loop......")
-    train(env, agent, file_name, intrinsic_on, number_stack_frames)
+    train(env, agent, file_name, intrinsic_on, number_stack_frames, args.buffer_dir, args.prefetch, args.intrinsic_batch,
+          args.intrinsic_at_sample, args.intrinsic_staleness, args.action_repeat, args.checkpoint_dir, args.checkpoint_interval, args.resume,
+          args.prioritized, args.priority_source, args.n_step)
 
 
 
@@ -0,0 +1,180 @@
+
+import os
+import time
+import torch
+import random
+from datetime import datetime
+
+import logging
+logging.basicConfig(level=logging.INFO)
+from argparse import ArgumentParser
+
+from dm_control import suite
+from Algorithm import Algorithm
+from FrameStack_DMCS import FrameStack
+from Vector_Env_DMCS import VectorFrameStack
+from Custom_Memory import CustomMemoryBuffer
+from Metrics_Log import MetricsLog
+from train_loop_control_suite import evaluation_loop
+
+import numpy as np
+
+
+def define_parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--intrinsic', type=bool, default=False)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env',  type=str, default="ball_in_cup")
+    parser.add_argument('--task', type=str, default="catch")
+    parser.add_argument('--num_envs', type=int, default=4)  # dm_control instances rendering in parallel processes
+    parser.add_argument('--action_repeat', type=int, default=1)  # physics steps per agent decision, only the last one is rendered
+    args   = parser.parse_args()
+    return args
+
+
+def sample_memories(memories, batch_size):
+    # one memory per env (the frames of each one are stored in episode order), splitting the batch at random between
+    # them in proportion to their size is the same as sampling from a single memory
+    sizes   = np.array([len(memory) for memory in memories], dtype=np.float64)
+    counts  = np.random.multinomial(batch_size, sizes / sizes.sum())
+    batches = [memory.sample(count) for memory, count in zip(memories, counts) if count > 0]
+    return tuple(np.concatenate(field, axis=0) for field in zip(*batches))
+
+
+def train(vector_env, eval_env, agent, file_name, intrinsic_on, number_stack_frames):
+    # Hyperparameters
+    # ------------------------------------#
+    max_steps_training    = 1_000_000
+    max_steps_exploration = 1_000
+
+    batch_size = 32
+    G          = 5  # updates per transition collected, G * num_envs per vector step
+    k          = number_stack_frames
+    num_envs   = vector_env.num_envs
+    action_repeat = vector_env.action_repeat  # the step counter and limits above are in physics steps
+    # ------------------------------------#
+
+    # Action size and format
+    # ------------------------------------#
+    action_spec      = eval_env.action_spec()
+    action_size      = action_spec.shape[0]    # For example, 6 for cheetah
+    max_action_value = action_spec.maximum[0]  # --> +1
+    min_action_value = action_spec.minimum[0]  # --> -1
+    # ------------------------------------#
+
+    # Needed classes
+    # ------------------------------------#
+    memories     = [CustomMemoryBuffer(action_size, max_capacity=int(1e6) // num_envs, k=k) for _ in range(num_envs)]
+    frames_stack = FrameStack(eval_env, k, action_repeat)
+    # ------------------------------------#
+
+    # Training Loop
+    # ------------------------------------#
+    episode_reward    = np.zeros(num_envs)
+    episode_num       = 0
+    historical_reward = MetricsLog(f"data_plots/{file_name}", ["step", "episode_reward"])  # plot it with plot_metrics.py
+    start_time = time.time()
+    states     = vector_env.reset()  # for 3 images with color, unit8 , (num_envs, 9, 84 , 84)
+
+    for total_step_counter in range(0, int(max_steps_training), num_envs * action_repeat):
+        if total_step_counter < max_steps_exploration:
+            logging.info(f"Running Exploration Steps {total_step_counter}/{max_steps_exploration}")
+            actions = np.random.uniform(min_action_value, max_action_value, size=(num_envs, action_size))
+        else:
+            actions = agent.select_actions_from_policy(states)  # one batched forward for all the envs
+
+        # states is overwritten by the step, keep the observations the actions were taken from
+        states = states.copy()
+        next_states, rewards_extrinsic, dones, reset_states = vector_env.step(actions)
+
+        for env_idx in range(num_envs):
+            if intrinsic_on and total_step_counter >= max_steps_exploration:
+                a = 0.5
+                b = 0.5
+                surprise_rate, novelty_rate = agent.get_intrinsic_values(states[env_idx], actions[env_idx], next_states[env_idx])
+                total_reward = rewards_extrinsic[env_idx] + surprise_rate * a + novelty_rate * b
+            else:
+                total_reward = rewards_extrinsic[env_idx]
+
+            memories[env_idx].add(state=states[env_idx], action=actions[env_idx], reward=total_reward, next_state=next_states[env_idx], done=dones[env_idx])
+
+        episode_reward += rewards_extrinsic  # just for plotting purposes use this reward as it is
+        states = reset_states
+
+        if total_step_counter >= max_steps_exploration:
+            for _ in range(G * num_envs):
+                states_batch, actions_batch, rewards_batch, next_states_batch, dones_batch = sample_memories(memories, batch_size)
+
+                agent.train_policy((states_batch, actions_batch, rewards_batch, next_states_batch, dones_batch))
+
+                if intrinsic_on:
+                    agent.train_predictive_model((states_batch, actions_batch, next_states_batch))
+
+        for env_idx in np.flatnonzero(dones):
+            episode_duration = time.time() - start_time
+            start_time       = time.time()
+
+            logging.info(f"Total T:{total_step_counter + num_envs * action_repeat} | Episode {episode_num + 1} (env {env_idx}) was completed | Reward= {episode_reward[env_idx]:.3f} | Duration= {episode_duration:.2f} Seg")
+            historical_reward.append(step=total_step_counter, episode_reward=episode_reward[env_idx])
+
+            episode_reward[env_idx] = 0
+            episode_num += 1
+
+            if episode_num % 10 == 0:
+                historical_reward.flush()
+                print("--------------------------------------------")
+                evaluation_loop(eval_env, agent, frames_stack, total_step_counter, file_name)
+                print("--------------------------------------------")
+
+    agent.save_models(filename=file_name)
+    historical_reward.flush()
+
+
+def main():
+    args   = define_parse_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    domain_name = args.env
+    task_name   = args.task
+    seed        = args.seed
+    num_envs    = args.num_envs
+
+    # the training envs use the seeds seed ... seed + num_envs - 1, the evaluation env runs here in the main process
+    vector_env  = VectorFrameStack(domain_name, task_name, num_envs, seed, k=3, action_repeat=args.action_repeat)
+    eval_env    = suite.load(domain_name, task_name, task_kwargs={'random': seed + num_envs})
+    action_size = eval_env.action_spec().shape[0]
+    latent_size = 50
+    number_stack_frames = 3
+
+    # Create Directories
+    # ---------------------------------------
+    for directory in ("videos", "plots", "data_plots"):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # set seeds
+    #---------------------------------------
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    #---------------------------------------
+
+    agent = Algorithm(
+        latent_size=latent_size,
+        action_num=action_size,
+        device=device,
+        k=number_stack_frames)
+
+    intrinsic_on  = args.intrinsic
+    date_time_str = datetime.now().strftime("%m_%d_%H_%M")
+    file_name     = domain_name + "_" + str(date_time_str) + "_" + task_name + "_" + "NASA_TD3" + "_Intrinsic_" + str(intrinsic_on) + "_Envs_" + str(num_envs)
+
+    try:
+        train(vector_env, eval_env, agent, file_name, intrinsic_on, number_stack_frames)
+    finally:
+        vector_env.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,13 @@ import torch
 import torch.nn.functional as F
 
 
+def to_device_tensor(array, device):
+    tensor = torch.from_numpy(np.asarray(array)).to(device, non_blocking=True)
+    if tensor.dtype == torch.uint8:
+        return tensor * (1.0 / 255)
+    return tensor.float()
+
+
 class AE_TD3:
     def __init__(self,
                  actor_network,
@@ -62,7 +69,7 @@ class AE_TD3:
     def get_action_from_policy(self, state, evaluation=False, noise_scale=0.1):
         self.actor_net.eval()
         with torch.no_grad():
-            state_tensor = torch.FloatTensor(state).to(self.device)
+            state_tensor = to_device_tensor(state, self.device)
             state_tensor = state_tensor.unsqueeze(0)
             action       = self.actor_net(state_tensor)
             action       = action.cpu().data.numpy().flatten()
@@ -82,10 +89,10 @@ class AE_TD3:
         batch_size = len(states)
 
         # Convert into tensor
-        states  = torch.FloatTensor(np.asarray(states)).to(self.device)
-        actions = torch.FloatTensor(np.asarray(actions)).to(self.device)
-        rewards = torch.FloatTensor(np.asarray(rewards)).to(self.device)
-        next_states = torch.FloatTensor(np.asarray(next_states)).to(self.device)
+        states  = to_device_tensor(states, self.device)
+        actions = to_device_tensor(actions, self.device)
+        rewards = to_device_tensor(rewards, self.device)
+        next_states = to_device_tensor(next_states, self.device)
         dones = torch.LongTensor(np.asarray(dones)).to(self.device)
 
         # Reshape to batch_size
@@ -58,7 +58,8 @@ def train(env, agent, env_name):
             action     = agent.get_action_from_policy(state)
             action_env = hlp.denormalize(action, max_action_value, min_action_value)
         next_state, reward, done, truncated, info = frames_stack.step(action_env)
-        memory.add(state=state, action=action, reward=reward, next_state=next_state, done=done)
+        # the stacks are views of the FrameStack ring, the MemoryBuffer keeps references so it gets copies
+        memory.add(state=state.copy(), action=action, reward=reward, next_state=next_state.copy(), done=done)
         state = next_state
 
         episode_reward += reward
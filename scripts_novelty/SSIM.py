@@ -0,0 +1,48 @@
+
+import torch
+import torch.nn.functional as F
+
+
+def window_1d(win_size, gaussian_weights, sigma, device):
+    if not gaussian_weights:
+        return torch.full((win_size,), 1.0 / win_size, device=device)
+    coords = torch.arange(win_size, device=device, dtype=torch.float32) - (win_size - 1) / 2
+    window = torch.exp(-0.5 * (coords / sigma) ** 2)
+    return window / window.sum()
+
+
+def structural_similarity(images, targets, data_range, win_size=7, gaussian_weights=False, sigma=1.5):
+    """
+    SSIM of each image in a (B, C, H, W) batch against its target, on the device that holds them.
+    Follows skimage.metrics.structural_similarity(..., channel_axis=0) applied to every sample:
+    a 7x7 uniform window (or an 11x11 gaussian one with sigma=1.5 when gaussian_weights, as skimage picks it),
+    sample covariance, K1=0.01, K2=0.03, borders within half a window left out and the mean over channels.
+    data_range is a float or a (B,) tensor. Returns a (B,) tensor.
+    """
+    if gaussian_weights:
+        win_size = 2 * int(3.5 * sigma + 0.5) + 1  # skimage truncates the gaussian at 3.5 sigma
+
+    batch_size, channels, height, width = images.shape
+    images  = images.float()
+    targets = targets.float()
+
+    # the window is separable, filter the five maps of every channel at once with a row and a column pass
+    window = window_1d(win_size, gaussian_weights, sigma, images.device)
+    maps   = torch.stack([images, targets, images * images, targets * targets, images * targets])
+    maps   = maps.reshape(-1, 1, height, width)
+    maps   = F.conv2d(maps, window.view(1, 1, 1, -1))
+    maps   = F.conv2d(maps, window.view(1, 1, -1, 1))  # 'valid' filtering, the same pixels skimage keeps after cropping
+    ux, uy, uxx, uyy, uxy = maps.reshape(5, batch_size, channels, *maps.shape[-2:])
+
+    num_points = win_size ** 2
+    cov_norm   = num_points / (num_points - 1)  # sample covariance
+    vx  = cov_norm * (uxx - ux * ux)
+    vy  = cov_norm * (uyy - uy * uy)
+    vxy = cov_norm * (uxy - ux * uy)
+
+    data_range = torch.as_tensor(data_range, dtype=torch.float32, device=images.device).reshape(-1, 1, 1, 1)
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+
+    ssim_map = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+    return ssim_map.mean(dim=(1, 2, 3))
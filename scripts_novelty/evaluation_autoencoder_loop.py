@@ -9,7 +9,8 @@ logging.basicConfig(level=logging.INFO)
 import matplotlib.pyplot as plt
 
 from Novelty import Deep_Novelty
-from skimage.metrics import structural_similarity as ssim, mean_squared_error
+from skimage.metrics import mean_squared_error
+from SSIM import structural_similarity
 
 
 def preprocessing_image(image_array):
@@ -30,8 +31,8 @@ def evaluation(env, autoencoder_model):
     state = env.render()
     state = preprocessing_image(state)
 
-    reconstruction = autoencoder_model.get_reconstruction_from_model(state)
-    reconstruction = reconstruction.cpu().numpy()
+    reconstruction_tensor = autoencoder_model.get_reconstruction_from_model(state)
+    reconstruction        = reconstruction_tensor.cpu().numpy()
 
     input_img = state[0]
     reconstruction_img = reconstruction[0][0]
@@ -43,7 +44,8 @@ def evaluation(env, autoencoder_model):
     mse_index = mean_squared_error(input_img, reconstruction_img)
     print("MSE similarity index", mse_index)
 
-    ssim_index = ssim(input_img, reconstruction_img, data_range=input_img.max() - input_img.min())
+    state_tensor = torch.from_numpy(state).unsqueeze(0).to(reconstruction_tensor.device)  # --> (1, 1, 84, 84)
+    ssim_index   = structural_similarity(reconstruction_tensor, state_tensor, data_range=input_img.max() - input_img.min()).item()
     print("Structural similarity index", ssim_index)
 
     plt.subplot(1, 3, 1)